@@ -85,6 +85,7 @@ ax1 = fig.add_subplot()
 data = osc.get_data()
 color_ch1 = 'tab:blue'
 data_time_ns = np.array(data['time'])/ns
+data_time_key = (len(data['time']), data['time'][0], data['time'][-1])
 
 line1, = ax1.plot(data_time_ns, data['ch1'],color=color_ch1)
 ax1.set_xlim([data_time_ns[0], data_time_ns[-1]])
@@ -111,6 +112,20 @@ root = tkinter.Tk()
 canvas = FigureCanvasTkAgg(fig, master=root)  # A tk.DrawingArea.
 canvas.draw()
 
+#########################################################################
+## Controls of the boxcar, as last sent to the Moku. Only the controls that
+## have changed are sent, and several changes are sent in one request
+applied_controls = {}
+
+def set_controls(controls):
+    changed = {idx: value for idx, value in controls.items() if applied_controls.get(idx) != value}
+    if len(changed) == 1:
+        idx, value = next(iter(changed.items()))
+        mcc.set_control(idx, value)
+    elif changed:
+        mcc.set_controls(controls=[dict(idx=idx, value=value) for idx, value in changed.items()])
+    applied_controls.update(changed)
+
 #########################################################################
 def update_timebase(event):
     neg_timebase = float(neg_timebase_text.get()) 
@@ -126,7 +141,7 @@ def update_trg_level(event):
     quantized_text = str(trg_level_bits*resolution)
     trg_level_text.insert(tkinter.END, quantized_text)
 
-    mcc.set_control(0,trg_level_bits)
+    set_controls({0: trg_level_bits})
 
     warning_text.delete("1.0", "end")
     warning_text.insert(tkinter.END, 'Coerced to ' + quantized_text + ' Volts' )
@@ -140,7 +155,7 @@ def update_trg_delay(event):
     print(quantized_text)
     trg_delay_text.insert(tkinter.END, quantized_text)
 
-    mcc.set_control(1,trg_delay_bits)
+    set_controls({1: trg_delay_bits})
     
     warning_text.delete("1.0", "end")
     warning_text.insert(tkinter.END, 'Coerced to ' + quantized_text + ' ns' )
@@ -153,7 +168,7 @@ def update_gate_width(event):
     quantized_text = str(gate_width_bits*period/ns)
     gate_width_text.insert(tkinter.END, quantized_text)
 
-    mcc.set_control(2,gate_width_bits)
+    set_controls({2: gate_width_bits})
 
     warning_text.delete("1.0", "end")
     warning_text.insert(tkinter.END, 'Coerced to ' + quantized_text + ' ns' )
@@ -161,14 +176,14 @@ def update_gate_width(event):
 #########################################################################
 def update_avg_length(event):    
     avg_length = int(float(avg_length_text.get()))
-    mcc.set_control(3,avg_length)
+    set_controls({3: avg_length})
 
 #########################################################################
 def update_gain(event):
     gain = float(gain_text.get())
     gain = int(gain*2**16)
 
-    mcc.set_control(5,gain)
+    set_controls({5: gain})
     
     warning_text.delete("1.0", "end")
     warning_text.insert(tkinter.END, 'Coerced gain to ' + str(gain/2**16))
@@ -190,7 +205,7 @@ def auto_delay():
         trg_delay_text.delete(0, 'end')
         trg_delay_text.insert(tkinter.END, str(time_delay_bits*period/ns))
         
-        mcc.set_control(1,time_delay_bits)
+        set_controls({1: time_delay_bits})
     else:
         return
 
@@ -202,13 +217,13 @@ def update_mode(event):
         case 'Align':
             output_mode = 2
             ax1.set_ylabel('Pulse Input Amplitude (Volts)', color=color_ch1)
-            mcc.set_control(4,output_mode)
+            set_controls({4: output_mode})
             out_text.delete("1.0", "end")
             auto_button.configure(state = 'normal')
         case 'Average Output':
             output_mode = 0
             ax1.set_ylabel('Summed Pulse Amplitude (Volts)', color=color_ch1)
-            mcc.set_control(4,output_mode)
+            set_controls({4: output_mode})
             auto_button.configure(state = 'disabled')
             
 
@@ -221,26 +236,28 @@ def quit(tk_root, instrument):
 
 #########################################################################
 def update_plot():
+    global data_time_ns, data_time_key
     while True:
 
         if exit_event.is_set():
             break
         try:
             data = osc.get_data()
-            data_time_ns = np.array(data['time'])/ns
-            # print(data_time_ns)
-            ax1.set_xlim([data_time_ns[0], data_time_ns[-1]])
+            ch1 = np.asarray(data['ch1'])
+            ch2 = np.asarray(data['ch2'])
+
+            # The time axis only changes with the timebase, so only convert it to ns when it does
+            time_key = (len(data['time']), data['time'][0], data['time'][-1])
+            if time_key != data_time_key:
+                data_time_key = time_key
+                data_time_ns = np.asarray(data['time'])/ns
+                ax1.set_xlim([data_time_ns[0], data_time_ns[-1]])
             
-            min_ch1 = min(data['ch1'])
-            max_ch1 = max(data['ch1'])
-            ax1.set_ylim([min_ch1-0.001, max_ch1+0.001])
-
-            min_ch2 = min(data['ch2'])
-            max_ch2 = max(data['ch2'])
-            ax2.set_ylim([min_ch2-0.001, max_ch2+0.1])
+            ax1.set_ylim([ch1.min()-0.001, ch1.max()+0.001])
+            ax2.set_ylim([ch2.min()-0.001, ch2.max()+0.1])
 
-            line1.set_data(data_time_ns, data['ch1'])
-            line2.set_data(data_time_ns, data['ch2'])
+            line1.set_data(data_time_ns, ch1)
+            line2.set_data(data_time_ns, ch2)
             canvas.draw()
 
             if mode.get() == 'Average Output':
@@ -255,7 +272,7 @@ def update_plot():
                     warning_text.insert(tkinter.END, 'Possible saturation detected, please reduce gain' )
                 else:
                     avg_length = float(avg_length_text.get())
-                    averaged_out = sum(data['ch1'])/(len(data['ch1'])*avg_length*mV*gain)
+                    averaged_out = ch1.mean()/(avg_length*mV*gain)
                     out_text.insert(tkinter.END, "{:.6f}".format(averaged_out))
                     
         except Exception as e:
@@ -353,12 +370,12 @@ warning_text.grid(row=matplot_rowspan-1, column=matplot_columnspan+1, columnspan
 
 print('Initializing...')
 
-mcc.set_control(0,int(INITIAL_TRIGGER_LEVEL/resolution) )
-mcc.set_control(1,int(INITIAL_TRIGGER_DELAY*ns/period) )
-mcc.set_control(2,int(INITIAL_GATEWIDTH*ns/period) )
-mcc.set_control(3,int(INITIAL_AVERAGE_LENGTH) )
-mcc.set_control(4,INITIAL_OUTPUT_MODE) 
-mcc.set_control(5,int(INITIAL_OUTPUT_GAIN*2**16) )
+set_controls({0: int(INITIAL_TRIGGER_LEVEL/resolution),
+              1: int(INITIAL_TRIGGER_DELAY*ns/period),
+              2: int(INITIAL_GATEWIDTH*ns/period),
+              3: int(INITIAL_AVERAGE_LENGTH),
+              4: INITIAL_OUTPUT_MODE,
+              5: int(INITIAL_OUTPUT_GAIN*2**16)})
 
 ax1.set_ylabel('Pulse Input Amplitude (Volts)', color=color_ch1)
     
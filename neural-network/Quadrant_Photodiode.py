@@ -9,55 +9,48 @@
 # The model is then saved to disk for use with the Moku Neural Network instrument.
 
 # %%
-import os
-
-import h5py
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.integrate import dblquad
 
-from moku.nn import LinnModel, save_linn
+from dataset_cache import DatasetCache
+from model_sweep import run_sweep
+from qpd_simulator import spot_func, generate_quadrants, QuadrantLUT
 # %%
 # ---
 # Step 1: Simulate the QPD function to build input and output data for training
 # ---
 
-# Gaussian spot function with elliptical symmetry and variable intensity
-def spot_func(x, y, X, Y, spot=0.5, intensity=1, sym=1):
-    return np.exp(-((x - X)**2 * sym + (y - Y)**2 / sym) / spot) * intensity
-
-# Simple QPD function, integrating the spot function over each quadrant. Assumes square detectors
-def position_to_quadrants(X, Y, spot=0.5, intensity=1, sym=1):
-    # Integrate over each quadrant using numerical integration
-    def integrand(x, y):
-        return spot_func(x, y, X, Y, spot, intensity, sym)
-
-    q1_val = dblquad(integrand, 0, 1, -1, 0)[0]
-    q2_val = dblquad(integrand, 0, 1, 0, 1)[0]
-    q3_val = dblquad(integrand, -1, 0, -1, 0)[0]
-    q4_val = dblquad(integrand, -1, 0, 0, 1)[0]
-
-    return np.array((q1_val, q2_val, q3_val, q4_val))
+# The Gaussian spot function and the QPD function that integrates it over each square quadrant
+# are defined in qpd_simulator.py. For the Gaussian spot the quadrant integrals have a closed form,
+# so the whole grid is evaluated at once. Passing a different spot_func to generate_quadrants falls
+# back to numerical integration spread over a process pool.
 
 # Add some distortion and noise to the QPD function. Compute some static biases and gain errors
-# for each quadrant diode once per run, with some random noise added for each point
-biases = np.random.normal(scale=0.01, size=4)
-gains = np.random.normal(loc=1, scale=0.1, size=4)
-sym = np.random.normal(loc=1, scale=0.3)
-def position_to_quadrants_noisy(X, Y):
-    spot = np.random.normal(loc=0.5, scale=0.1)
-    intensity = np.random.normal(loc=1, scale=0.1)
-
-    qs = position_to_quadrants(X, Y, spot, intensity, sym)
+# for each quadrant diode once per run, with some random noise added for each point. The random
+# numbers are seeded so the simulated data, and its cache entry below, are repeatable
+seed = 0
+rng = np.random.default_rng(seed)
+biases = rng.normal(scale=0.01, size=4)
+gains = rng.normal(loc=1, scale=0.1, size=4)
+sym = rng.normal(loc=1, scale=0.3)
+def position_to_quadrants_noisy(X, Y, biases=biases, gains=gains, sym=sym, rng=np.random):
+    spot = rng.normal(loc=0.5, scale=0.1, size=np.shape(X))
+    intensity = rng.normal(loc=1, scale=0.1, size=np.shape(X))
+
+    qs = generate_quadrants(X, Y, spot, intensity, sym)
 
     # Apply systematic errors
     qs = qs * gains + biases
 
     # Gain and bias random errors
-    qs += np.random.normal(scale=0.01, size=4)
-    qs *= np.random.normal(loc=1, scale=0.005, size=4)
+    qs += rng.normal(scale=0.01, size=qs.shape)
+    qs *= rng.normal(loc=1, scale=0.005, size=qs.shape)
     return qs
 
+# Generate the noisy QPD function values for a set of points as a cacheable dataset
+def quadrant_dataset(X, Y, biases, gains, sym, seed):
+    return {'qg': position_to_quadrants_noisy(X, Y, biases, gains, sym, np.random.default_rng(seed))}
+
 # Simple naive point calculation from the quadrant values as a baseline
 def naive_point(q1, q2, q3, q4):
     x = q2 - q1 + q4 - q3
@@ -74,20 +67,13 @@ X, Y = np.meshgrid(x, x)
 plt.imshow(spot_func(X, Y, 0, 0), extent=(-1, 1, -1, 1))
 
 # %%
-# Generate the QPD function values for each point in the grid. Cache the results to disk. Set
-# regenerate to True to recompute the QPD values when you change the simulation function or mesh
-regenerate = True
-update_cache = True
-cache_file = 'quadrant_data.h5'
-if not os.path.exists(cache_file) or regenerate:
-    qg = np.vectorize(position_to_quadrants_noisy, signature='(),()->(4)')(X, Y)
-
-    if update_cache:
-        with h5py.File(cache_file, 'w') as hf:
-            hf.create_dataset('qg', data=qg)
-
-
-with h5py.File(cache_file, 'r') as hf:
+# Generate the QPD function values for each point in the grid. The results are cached to disk, keyed
+# on the simulation code and its parameters, so they are only recomputed when you change the simulation
+# function, mesh or noise model. Set regenerate to True to force them to be recomputed anyway
+regenerate = False
+cache = DatasetCache('quadrant_data', max_bytes=2**28)
+with cache.load(quadrant_dataset, regenerate=regenerate,
+                X=X, Y=Y, biases=biases, gains=gains, sym=sym, seed=seed) as hf:
     qg = hf['qg'][:]
 # %%
 # Plot the QPD function values for each quadrant.
@@ -106,6 +92,19 @@ error = np.linalg.norm(naive_points - actual_points, axis=-1)
 plt.imshow(error, extent=(-1, 1, -1, 1), vmax=0.5)
 plt.colorbar()
 
+# %%
+# For closed-loop simulations, where quadrant values are needed for a stream of beam positions, a precomputed
+# lookup table serves them faster than evaluating the spot integrals. The table is built once to the requested
+# accuracy and saved, later runs memory-map it from disk. It is built again if the accuracy or ranges change.
+# Positions and spot parameters outside the ranges of the table give NaN rather than extrapolating
+lut = QuadrantLUT.load_or_build('quadrant_lut', tolerance=1e-5, spot_range=(0.2, 0.8), sym_range=(0.3, 1.7))
+print(f'Lookup table error relative to the peak quadrant value: {lut.error:.2g}')
+
+# Check the table against the spot integrals over the grid, without the noise and distortion
+qs = lut.lookup(X, Y, spot=0.5, intensity=1, sym=sym)
+exact = generate_quadrants(X, Y, spot=0.5, intensity=1, sym=sym)
+print(f'Largest lookup table error over the grid: {np.nanmax(np.abs(qs - exact)) / exact.max():.2g}')
+
 # %%
 # ---
 # Step 2: Train a neural network to predict the beam position from the QPD values
@@ -115,6 +114,26 @@ plt.colorbar()
 locations = actual_points.reshape(-1, 2)
 q_values = qg.reshape(-1, 4)
 
+# %%
+# Optionally compare the model definitions below by training them all in parallel, rather than toggling
+# them by hand. The losses and training times of each run are written to a results table. Worker processes
+# started with 'spawn' would re-run this script, so the sweep uses 'fork', available on Linux and macOS.
+# Forking is only safe before tensorflow starts, so the sweep runs before moku.nn is imported below
+run_model_sweep = False
+if run_model_sweep:
+    sweep_definitions = [[(4, 'relu'), (4, 'relu'), (2, 'linear')],
+                         [(4, 'tanh'), (4, 'tanh'), (2, 'linear')],
+                         [(16, 'tanh'), (16, 'tanh'), (2, 'linear')],
+                         [(100, 'tanh'), (100, 'tanh'), (100, 'tanh'), (100, 'tanh'), (2, 'linear')]]
+    results = run_sweep(sweep_definitions, q_values, locations, epochs=500, es_configs=[{'patience': 10}],
+                        scale=False, results_file='qpd_sweep.csv', mp_context='fork')
+    for result in results:
+        print(f"{result['model_definition']}: best val_loss {result['best_val_loss']:.3g}, "
+              f"{result['epochs_run']} epochs in {result['wall_time']:.1f} s")
+
+# %%
+from moku.nn import LinnModel, save_linn
+
 # Build the neural network model. Skip the I/O scaling as the data are already pretty good for training,
 # though QPD powers (input values) are strictly positive so input scaling might be beneficial depending on the model.
 # Note that if you add scaling here, you'll need to apply the same scaling in the Moku Neural Network instrument at
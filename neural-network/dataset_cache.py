@@ -0,0 +1,209 @@
+"""
+Content-addressed HDF5 cache for the simulated training datasets.
+
+Datasets are keyed on a hash of the generator source code, everything it reads from its module and the parameters
+it is called with, so changing the mesh, the noise model, a module constant or the simulation function produces a new
+entry rather than silently reusing stale data.
+Entries are stored as chunked, compressed HDF5 files and the least recently used entries are evicted once the cache
+grows beyond its size budget.
+
+Example:
+    cache = DatasetCache('dataset_cache')
+    with cache.load(generate_data, x=np.linspace(-1, 1, 100), noise=0.01) as data:
+        first_rows = data['inputs'][:100]
+"""
+import hashlib
+import inspect
+import os
+
+import h5py
+import numpy as np
+
+
+def _update_hash(h, value):
+    # feed a value into the hash in a way that is stable between runs
+    if isinstance(value, np.ndarray):
+        h.update(f'ndarray{value.dtype.str}{value.shape}'.encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        h.update(b'dict')
+        for k in sorted(value):
+            h.update(repr(k).encode())
+            _update_hash(h, value[k])
+    elif isinstance(value, (list, tuple)):
+        h.update(type(value).__name__.encode())
+        for v in value:
+            _update_hash(h, v)
+    elif callable(value):
+        h.update(source_hash(value).encode())
+    else:
+        text = repr(value)
+        # objects without a repr of their own include their address, which changes between runs
+        h.update((type(value).__qualname__ if ' at 0x' in text else text).encode())
+
+
+def _referenced_names(code):
+    # global names used by a code object and by the functions, lambdas and comprehensions nested in it
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _referenced_names(const)
+    return names
+
+
+def source_hash(func):
+    """
+    Hash the source of a function along with everything it references from its module: the source of the functions
+    and classes it uses, and the values of the constants and arrays it reads, e.g. a mesh size or a noise bias. The
+    default values of its arguments and the variables it closes over are hashed too, so that a change to any of them
+    invalidates the cache. Modules are not followed, so pass anything read from another module as a parameter.
+    :param func: function to hash
+    :return: hex digest of the source code and the values it references
+    """
+    h = hashlib.sha256()
+    seen = set()
+    pending = [func]
+    while pending:
+        f = inspect.unwrap(pending.pop())
+        if id(f) in seen:
+            continue
+        seen.add(id(f))
+        try:
+            h.update(inspect.getsource(f).encode())
+        except (OSError, TypeError):
+            # built-ins and functions defined interactively have no source, fall back to their name
+            h.update(getattr(f, '__qualname__', repr(f)).encode())
+            continue
+
+        if inspect.isclass(f):
+            # the source of the methods is part of the class, but the globals they read are not
+            pending.extend(value for value in vars(f).values() if inspect.isfunction(value))
+            continue
+        code = getattr(f, '__code__', None)
+        if code is None:
+            continue
+
+        values = {}
+        module_globals = getattr(f, '__globals__', {})
+        for name in sorted(_referenced_names(code)):
+            if name in module_globals:
+                values[name] = module_globals[name]
+        for name, cell in zip(code.co_freevars, f.__closure__ or ()):
+            values[name] = cell.cell_contents
+        values['__defaults__'] = (f.__defaults__, f.__kwdefaults__)
+
+        for name, value in values.items():
+            if inspect.ismodule(value):
+                continue
+            if inspect.isfunction(value) or inspect.isclass(value):
+                pending.append(value)
+            else:
+                h.update(name.encode())
+                _update_hash(h, value)
+    return h.hexdigest()
+
+
+class DatasetCache:
+    """
+    Cache of generated datasets in a directory of HDF5 files, one file per generator call.
+    """
+    def __init__(self, directory='dataset_cache', max_bytes=2 ** 30, compression='gzip', chunk_bytes=2 ** 20):
+        """
+        :param directory: directory to store the cached datasets in
+        :param max_bytes: size budget of the cache, least recently used entries are evicted beyond this
+        :param compression: HDF5 compression filter for the stored datasets
+        :param chunk_bytes: approximate size of each HDF5 chunk
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.chunk_bytes = chunk_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, generator, **params):
+        """
+        Find the cache key for a generator called with the given parameters
+        :param generator: function that generates the dataset
+        :param params: keyword arguments to pass to the generator
+        :return: the hex digest identifying the dataset
+        """
+        h = hashlib.sha256()
+        h.update(source_hash(generator).encode())
+        _update_hash(h, params)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.h5')
+
+    def load(self, generator, regenerate=False, **params):
+        """
+        Load a dataset from the cache, generating and storing it first if it is not present. The generator may
+        return a single array, stored as 'data', or a dict of named arrays.
+        :param generator: function that generates the dataset
+        :param regenerate: force the dataset to be generated even if it is cached
+        :param params: keyword arguments to pass to the generator
+        :return: the read-only h5py.File, slice its datasets to load them into memory
+        """
+        path = self.path(self.key(generator, **params))
+        if regenerate or not os.path.exists(path):
+            data = generator(**params)
+            self.store(path, data if isinstance(data, dict) else {'data': data})
+        else:
+            # mark the entry as recently used
+            os.utime(path)
+
+        self.evict(keep=path)
+        return h5py.File(path, 'r')
+
+    def store(self, path, data):
+        # write to a temporary file first so an interrupted write never leaves a partial entry behind
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with h5py.File(tmp_path, 'w') as hf:
+            for name, value in data.items():
+                value = np.asarray(value)
+                chunks = self._chunks(value)
+                hf.create_dataset(name, data=value, chunks=chunks, compression=self.compression if chunks else None)
+        os.replace(tmp_path, path)
+
+    def _chunks(self, value):
+        # chunk along the first axis so that slicing rows only decompresses the chunks it touches
+        if value.ndim == 0 or value.size == 0:
+            return None
+        row_bytes = max(1, value[:1].nbytes)
+        rows = int(np.clip(self.chunk_bytes // row_bytes, 1, value.shape[0]))
+        return (rows, *value.shape[1:])
+
+    def entries(self):
+        """
+        List the cache entries, least recently used first
+        :return: list of (path, size in bytes, last used time)
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.h5'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((os.path.join(self.directory, name), stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda e: e[2])
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache is within its size budget
+        :param keep: path of an entry that should never be evicted, e.g. the one just loaded
+        :return: list of the evicted paths
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = []
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            evicted.append(path)
+        return evicted
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            os.remove(path)
@@ -20,8 +20,35 @@ class QuantumEmitter:
         self.X = None
         self.Y = None
         self.angles = [np.pi / 2, np.pi / 2]
-        self.e_target = None
-        self.e_current = None
+
+        # 1D x and y axes of the simulation domain, when it is a regular grid
+        self.x_axis = None
+        self.y_axis = None
+        self._factor_cache = {}
+
+        self._e_target = None
+        self._e_current = None
+        self._target_factors = None
+        self._current_factors = None
+
+    @property
+    def e_target(self):
+        # the target intensity is only materialised on the full grid when it is requested
+        if self._e_target is None and self._target_factors is not None:
+            self._e_target = np.outer(*self._target_factors)
+        return self._e_target
+
+    @property
+    def e_current(self):
+        # the current intensity is only materialised on the full grid when it is requested
+        if self._e_current is None and self._current_factors is not None:
+            self._e_current = np.outer(*self._current_factors)
+        return self._e_current
+
+    @property
+    def separable(self):
+        # the field factors into x and y parts whenever the domain is a regular grid
+        return self.x_axis is not None
 
     def get_field(self, x, y, z, mods):
         """
@@ -34,29 +61,82 @@ class QuantumEmitter:
         """
         return self.E((x + mods[0]) * mods[2], (y + mods[1]) * mods[3], z)
 
+    def get_intensity_factors(self, z, mods):
+        """
+        Find the x and y factors of the intensity over the simulation grid, such that the intensity is their outer
+        product. Factors are cached for each z and set of modifications.
+        :param z: z position
+        :param mods: modifications in the form of [x translation, y translation, x scale, y scale]
+        :return: tuple of the 1D x and y intensity factors
+        """
+        key = (z, *(float(np.ravel(m)[0]) for m in mods))
+        factors = self._factor_cache.get(key)
+        if factors is None:
+            factors = self.I_factors((self.x_axis + mods[0]) * mods[2], (self.y_axis + mods[1]) * mods[3], z)
+            if len(self._factor_cache) >= 64:
+                self._factor_cache.clear()
+            self._factor_cache[key] = factors
+        return factors
+
     def update_current(self, mods):
         """
         Update the current incident field for a given set of modifications
         :param mods: the list of modifications to provide to self.get_field
         :return: None
         """
-        self.e_current = np.abs(self.get_field(self.X, self.Y, 1e-10, mods)) ** 2
+        if self.separable:
+            self._current_factors = self.get_intensity_factors(1e-10, mods)
+            self._e_current = None
+        else:
+            self._e_current = np.abs(self.get_field(self.X, self.Y, 1e-10, mods)) ** 2
 
     def set_XY(self, X, Y):
         """
         Set the X and Y arrays that correspond to the simulation domain, ij formatting from np.meshgrid is expected.
-        :param X: X-array of points (1D)
-        :param Y: Y-array of points (1D)
+        If the arrays form a regular grid, the separable fast path is used for the overlap calculations.
+        :param X: X-array of points (2D)
+        :param Y: Y-array of points (2D)
         :return:
         """
         self.X = X
         self.Y = Y
-        self.e_target = self.get_field(X, Y, 1e-10,
-                                       (0, 0, self.new_scale(self.angles[0]), self.new_scale(self.angles[1])))
-        self.e_target = np.abs(self.e_target)**2
+        self.x_axis, self.y_axis = None, None
+        if X.ndim == 2 and np.all(X == X[:, :1]) and np.all(Y == Y[:1, :]):
+            self.x_axis, self.y_axis = X[:, 0], Y[0, :]
+        self._update_target()
+
+    def set_axes(self, x, y):
+        """
+        Set the simulation domain from its 1D axes, equivalent to self.set_XY(*np.meshgrid(x, y, indexing='ij')) but
+        without allocating the full grid.
+        :param x: x-axis points (1D)
+        :param y: y-axis points (1D)
+        :return:
+        """
+        self.x_axis = np.asarray(x, dtype=float)
+        self.y_axis = np.asarray(y, dtype=float)
+        shape = (self.x_axis.size, self.y_axis.size)
+        self.X = np.broadcast_to(self.x_axis[:, None], shape)
+        self.Y = np.broadcast_to(self.y_axis[None, :], shape)
+        self._update_target()
+
+    def _update_target(self):
+        mods = (0, 0, self.new_scale(self.angles[0]), self.new_scale(self.angles[1]))
+        self._factor_cache = {}
+        self._e_current, self._current_factors = None, None
+        if self.separable:
+            self._target_factors = self.get_intensity_factors(1e-10, mods)
+            self._e_target = None
+        else:
+            self._target_factors = None
+            self._e_target = np.abs(self.get_field(self.X, self.Y, 1e-10, mods)) ** 2
 
     def get_overlap(self):
         # return the approximate overlap of the two beams
+        if self.separable:
+            # sum over x times sum over y, avoiding the full grid
+            (tx, ty), (cx, cy) = self._target_factors, self._current_factors
+            return (tx @ cx) * (ty @ cy) / ((tx @ tx) * (ty @ ty))
         return (self.e_target*self.e_current).sum() / (self.e_target**2).sum()
 
     def get_counts(self):
@@ -111,6 +191,59 @@ class QuantumEmitter:
 
         return diff_counts
 
+    def time_step_batch(self, offsets, shears, angles, chunk_size=None, max_bytes=2**28):
+        """
+        Vectorised equivalent of calling self.time_step once per row of the inputs. The base and four modulated
+        fields of every step are evaluated in a single broadcast pass, with the time axis split into chunks so that
+        the intermediate field arrays never exceed max_bytes.
+        :param offsets: offsets to apply to the x and y axis, array of shape (T, 2)
+        :param shears: shears to apply to the x and y axis, array of shape (T, 2)
+        :param angles: z-x and z-y angles for each step, array of shape (T, 2)
+        :param chunk_size: number of time steps to evaluate at once, derived from max_bytes if None
+        :param max_bytes: approximate memory budget for the intermediate field arrays of one chunk
+        :return: tuple of the (T, 4) difference in counts for each modulation and the (T,) base counts
+        """
+        offsets = np.asarray(offsets, dtype=float).reshape(-1, 2)
+        shears = np.asarray(shears, dtype=float).reshape(-1, 2)
+        angles = np.asarray(angles, dtype=float).reshape(-1, 2)
+        steps = offsets.shape[0]
+
+        if chunk_size is None:
+            if self.separable:
+                # five sets of x and y intensity factors per step
+                step_bytes = 5 * (self.x_axis.size + self.y_axis.size) * np.dtype(float).itemsize
+            else:
+                # five complex fields per step, plus their intensities
+                step_bytes = 5 * self.X.size * (np.dtype(complex).itemsize + np.dtype(float).itemsize)
+            chunk_size = max(1, int(max_bytes // step_bytes))
+
+        # build the base and modulated parameters for every step, shape (T, 5, 4)
+        mods = np.repeat(np.concatenate((offsets, shears), axis=1)[:, None, :], 5, axis=1)
+        mods[:, 1, 0] += 1e-7
+        mods[:, 2, 1] += 1e-7
+        mods[:, 3, 2] = self.new_scale(angles[:, 0] - np.pi / 64)
+        mods[:, 4, 3] = self.new_scale(angles[:, 1] - np.pi / 64)
+
+        counts = np.empty((steps, 5), dtype=np.int64)
+        for start in range(0, steps, chunk_size):
+            if self.separable:
+                (tx, ty), m = self._target_factors, mods[start:start + chunk_size, :, :, None]
+                fx, fy = self.I_factors((self.x_axis + m[:, :, 0]) * m[:, :, 2],
+                                        (self.y_axis + m[:, :, 1]) * m[:, :, 3], 1e-10)
+                overlap = (fx @ tx) * (fy @ ty) / ((tx @ tx) * (ty @ ty))
+            else:
+                m = mods[start:start + chunk_size, :, :, None, None]
+                field = self.E((self.X + m[:, :, 0]) * m[:, :, 2], (self.Y + m[:, :, 1]) * m[:, :, 3], 1e-10)
+                overlap = (self.e_target * np.abs(field) ** 2).sum(axis=(-2, -1)) / (self.e_target ** 2).sum()
+            counts[start:start + chunk_size] = np.clip(np.trunc(overlap * 2 ** 16), 0, 2 ** 16)
+
+        # leave the simulator in the same state as the equivalent sequence of time_step calls
+        if steps:
+            self.angles = list(angles[-1])
+            self.update_current(mods[-1, 0])
+
+        return counts[:, 1:] - counts[:, :1], counts[:, 0]
+
     def w(self, z):
         """
         Find the waist for a given z-position along the beam axis
@@ -139,6 +272,19 @@ class QuantumEmitter:
         # return the complex electric field
         return t1 * t2 * t3
 
+    def I_factors(self, x, y, z):
+        """
+        Calculate the x and y factors of the intensity, |E(x, y, z)|^2 = I_x * I_y, so that the intensity over a grid
+        can be found from 1D factors rather than the full 2D field
+        :param x: x position in m
+        :param y: y position in m
+        :param z: z position in m
+        :return: tuple of the x and y intensity factors
+        """
+        # the phase term has unit magnitude, leaving only the amplitude and Gaussian terms
+        t1 = self.w0 / self.w(z)
+        return t1 * np.exp(-2 * x ** 2 / self.w(z) ** 2), t1 * np.exp(-2 * y ** 2 / self.w(z) ** 2)
+
     def new_length(self, w, theta):
         """
         Function for calculating the shear projection of the beam
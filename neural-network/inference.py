@@ -0,0 +1,41 @@
+"""
+Helpers for evaluating trained models over long signals.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def sliding_windows(signal, window, step=1):
+    """
+    View a 1D signal as a set of overlapping windows without copying it
+    :param signal: 1D signal
+    :param window: number of points in each window
+    :param step: number of points between the start of consecutive windows
+    :return: read-only view of the windows, shape ((signal.size - window) // step + 1, window)
+    """
+    return sliding_window_view(np.asarray(signal), window)[::step]
+
+
+def predict_windows(model, signal, window, step=1, batch_size=4096, output_mapping=None, **predict_kwargs):
+    """
+    Run a model over every window of a signal, evaluating the windows in batches rather than one predict call each
+    :param model: model with a predict(inputs, **kwargs) method, e.g. a LinnModel
+    :param signal: 1D signal
+    :param window: number of points in each window, the model input size
+    :param step: number of points between the start of consecutive windows
+    :param batch_size: number of windows to pass to each predict call
+    :param output_mapping: indices of the model outputs to return, all outputs if None
+    :param predict_kwargs: additional arguments to pass to model.predict, e.g. scale=False
+    :return: the model outputs for each window, shape (n_windows, n_outputs)
+    """
+    windows = sliding_windows(signal, window, step)
+
+    preds = []
+    for start in range(0, windows.shape[0], batch_size):
+        pred = np.asarray(model.predict(windows[start:start + batch_size], **predict_kwargs))
+        preds.append(pred.reshape(pred.shape[0], -1))
+    preds = np.concatenate(preds, axis=0)
+
+    if output_mapping is not None:
+        preds = preds[:, output_mapping]
+    return preds
@@ -0,0 +1,130 @@
+"""
+Offline emulation of a quantized .linn network, for validating models without uploading them to a Moku.
+
+The .linn file holds the dense layers written by save_linn, with the output_mapping already applied to the final
+layer. Every weight, bias and layer output is a signed fixed-point fraction in [-1, 1), matching the clipping that
+LinnModel applies during training. The number of fractional bits is configurable so that the emulator can be matched
+to the word length of the instrument.
+
+Example:
+    network = LinnEmulator('qpd.linn', input_transform=linn_model._input_transform_args)
+    preds = network.predict(q_values)
+"""
+import json
+
+import numpy as np
+
+from inference import predict_windows
+
+ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'softsign': lambda x: x / (1 + np.abs(x)),
+    'linear': lambda x: x,
+}
+
+
+class LinnEmulator:
+    """
+    Fixed-point NumPy emulator of a .linn network
+    """
+    def __init__(self, linn, frac_bits=15, input_transform=None, output_transform=None):
+        """
+        :param linn: path to a .linn file, or the dict returned by moku.nn.get_linn
+        :param frac_bits: number of fractional bits of the signed fixed-point values, e.g. 15 for 16-bit words
+        :param input_transform: (min, max) used to scale the inputs to [-1, 1], e.g. LinnModel._input_transform_args
+        :param output_transform: (min, max) used to scale the outputs, e.g. LinnModel._output_transform_args
+        """
+        if isinstance(linn, dict):
+            self.linn = linn
+        else:
+            with open(linn, 'r') as f:
+                self.linn = json.load(f)
+
+        self.frac_bits = frac_bits
+        self.input_transform = input_transform
+        self.output_transform = output_transform
+        self.num_input_channels = self.linn['num_input_channels']
+        self.num_output_channels = self.linn['num_output_channels']
+
+        self.layers = []
+        for idx, layer in enumerate(self.linn['layers']):
+            activation = layer['activation'].lower()
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Layer {idx} has unsupported activation {activation}. Try {list(ACTIVATIONS)}.")
+            # keep the quantized weights and biases as integer codes, stored as floats so the matrix products use
+            # BLAS. The products and sums of codes are integers well within the float64 mantissa, so they are exact.
+            weights = self.to_codes(np.array(layer['weights'], dtype=float)).T
+            biases = self.to_codes(np.array(layer['biases'], dtype=float))
+            self.layers.append((weights, biases, ACTIVATIONS[activation]))
+
+        self.input_size = self.layers[0][0].shape[0]
+        self.output_size = self.layers[-1][0].shape[1]
+
+    def to_codes(self, values):
+        # round to the nearest fixed-point code, saturating at the ends of the [-1, 1) range
+        scale = 2 ** self.frac_bits
+        return np.clip(np.round(values * scale), -scale, scale - 1)
+
+    def quantize(self, values):
+        """
+        Quantize values to the fixed-point format of the network
+        :param values: array of values
+        :return: the nearest representable values
+        """
+        return self.to_codes(values) / 2 ** self.frac_bits
+
+    def _transform(self, data, transform):
+        lo, hi = (np.asarray(t, dtype=float) for t in transform)
+        return 2 * ((data - lo) / (hi - lo) - 0.5)
+
+    def _inverse_transform(self, data, transform):
+        lo, hi = (np.asarray(t, dtype=float) for t in transform)
+        return (data / 2 + 0.5) * (hi - lo) + lo
+
+    def predict(self, inputs, scale=None, unscale_output=None, batch_size=65536):
+        """
+        Run the network on a batch of inputs, with the same scaling options as LinnModel.predict
+        :param inputs: network inputs, shape (n, input_size)
+        :param scale: scale the inputs with input_transform, defaults to whether an input_transform was given
+        :param unscale_output: unscale the outputs with output_transform, defaults to whether one was given
+        :param batch_size: number of inputs to evaluate at once, to bound the memory used
+        :return: the network outputs, shape (n, output_size)
+        """
+        if scale is None:
+            scale = self.input_transform is not None
+        if unscale_output is None:
+            unscale_output = self.output_transform is not None
+
+        inputs = np.asarray(inputs, dtype=float).reshape(-1, self.input_size)
+        if scale:
+            inputs = self._transform(inputs, self.input_transform)
+
+        outputs = np.empty((inputs.shape[0], self.output_size))
+        for start in range(0, inputs.shape[0], batch_size):
+            outputs[start:start + batch_size] = self._forward(inputs[start:start + batch_size])
+
+        if unscale_output:
+            outputs = self._inverse_transform(outputs, self.output_transform)
+        return outputs
+
+    def _forward(self, inputs):
+        codes = self.to_codes(inputs)
+        scale = 2.0 ** self.frac_bits
+        for weights, biases, activation in self.layers:
+            # accumulate at double precision, then apply the activation and requantize the layer output
+            acc = (codes @ weights + biases * scale) / scale ** 2
+            codes = self.to_codes(np.clip(activation(acc), -1, 1))
+        return codes / scale
+
+    def process_signal(self, signal, batch_size=65536, **predict_kwargs):
+        """
+        Emulate the serial mode of the instrument, where a single input channel is fed through the network as a
+        sliding window of the most recent input_size samples.
+        :param signal: 1D input signal
+        :param batch_size: number of windows to evaluate at once
+        :param predict_kwargs: additional arguments to pass to predict, e.g. scale=False
+        :return: the network outputs for each window, shape (signal.size - input_size + 1, output_size)
+        """
+        return predict_windows(self, signal, self.input_size, batch_size=batch_size, **predict_kwargs)
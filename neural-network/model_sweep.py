@@ -0,0 +1,182 @@
+"""
+Parallel sweeps over LinnModel architectures and training configurations.
+
+Each combination of model definition, epochs and early stopping configuration is trained in its own worker process.
+The training arrays are placed in shared memory once rather than being pickled to every worker, and each worker is
+pinned to its own set of CPUs with a fixed number of threads so that the workers do not compete for cores.
+
+Example:
+    results = run_sweep([[(16, 'tanh'), (16, 'tanh'), (2, 'linear')],
+                         [(4, 'relu'), (4, 'relu'), (2, 'linear')]],
+                        training_inputs, training_outputs, epochs=500, es_configs=[{'patience': 10}],
+                        results_file='sweep.csv')
+
+When the sweep is run with the default 'spawn' start method the worker processes import the calling script, so call
+run_sweep from a notebook or from inside an `if __name__ == '__main__':` block. Flat scripts can use the 'fork' start
+method instead, as long as the sweep runs before anything imports tensorflow: forking a process once tensorflow has
+started its threads can deadlock the workers, and the thread limits of each worker could no longer be applied.
+"""
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# shared training arrays of this worker process, set by _init_worker
+_worker_arrays = {}
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(shared_arrays, threads, next_worker):
+    # pin this worker to its own block of CPUs, where the platform supports it
+    with next_worker.get_lock():
+        worker_idx = next_worker.value
+        next_worker.value += 1
+    if hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        block = cpus[(worker_idx * threads) % len(cpus):][:threads]
+        if block:
+            os.sched_setaffinity(0, block)
+
+    # limit the thread pools before tensorflow is imported in this process
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+        os.environ[var] = str(threads)
+
+    for key, (name, shape, dtype) in shared_arrays.items():
+        shm = _attach(name)
+        _worker_arrays[key] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _train(run_idx, config, scale):
+    import tensorflow as tf
+    from moku.nn import LinnModel
+
+    threads = int(os.environ['TF_NUM_INTRAOP_THREADS'])
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    except RuntimeError as e:
+        # tensorflow has already started in this worker, which is expected if an earlier run set the same limits
+        if (tf.config.threading.get_intra_op_parallelism_threads(),
+                tf.config.threading.get_inter_op_parallelism_threads()) != (threads, threads):
+            raise RuntimeError(f"Can't limit the tensorflow threads of this worker to {threads}, as tensorflow was "
+                               "already running when the worker started") from e
+
+    linn_model = LinnModel()
+    linn_model.set_training_data(_worker_arrays['inputs'][1], _worker_arrays['outputs'][1], scale=scale)
+    linn_model.construct_model(config['model_definition'])
+
+    start = time.perf_counter()
+    history = linn_model.fit_model(epochs=config['epochs'], es_config=config['es_config'],
+                                   **config['fit_kwargs'])
+    wall_time = time.perf_counter() - start
+
+    history = {k: [float(v) for v in values] for k, values in history.history.items()}
+    val_loss = history.get('val_loss', [np.nan])
+    return {
+        'run': run_idx,
+        'model_definition': config['model_definition'],
+        'epochs': config['epochs'],
+        'es_config': config['es_config'],
+        'epochs_run': len(history.get('loss', [])),
+        'final_loss': history.get('loss', [np.nan])[-1],
+        'final_val_loss': val_loss[-1],
+        'best_val_loss': float(np.nanmin(val_loss)),
+        'wall_time': wall_time,
+        'history': history,
+    }
+
+
+def _share(array):
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def write_results(results, file_name):
+    """
+    Write the sweep results to a CSV table, one row per run. The training history is stored as JSON.
+    :param results: list of result dicts returned by run_sweep
+    :param file_name: path of the CSV file
+    :return: None
+    """
+    if not results:
+        return
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        for result in results:
+            writer.writerow({k: json.dumps(v) if isinstance(v, (list, dict)) else v for k, v in result.items()})
+
+
+def run_sweep(model_definitions, training_inputs, training_outputs, epochs=500, es_configs=(None,),
+              scale=True, processes=None, threads_per_worker=1, results_file=None, mp_context='spawn',
+              **fit_kwargs):
+    """
+    Train every combination of model definition, epochs and early stopping configuration across a process pool
+    :param model_definitions: list of model definitions as passed to LinnModel.construct_model
+    :param training_inputs: training inputs as passed to LinnModel.set_training_data
+    :param training_outputs: training outputs as passed to LinnModel.set_training_data
+    :param epochs: maximum number of epochs, or a list of them to sweep over
+    :param es_configs: list of early stopping configurations to sweep over, None to disable early stopping
+    :param scale: whether LinnModel should scale the training data
+    :param processes: number of worker processes, defaults to the number of CPUs divided by threads_per_worker
+    :param threads_per_worker: number of CPUs and threads given to each worker
+    :param results_file: optional CSV file to write the results table to
+    :param mp_context: multiprocessing start method for the workers, 'fork' is only allowed before tensorflow is
+    imported
+    :param fit_kwargs: additional arguments to pass to LinnModel.fit_model, e.g. validation_split=0.1
+    :return: list of result dicts, one per run, in the order the runs were defined
+    """
+    if mp_context == 'fork' and 'tensorflow' in sys.modules:
+        raise RuntimeError("Can't fork the sweep workers once tensorflow has been imported, as its threads can "
+                           "deadlock them. Run the sweep before importing moku.nn or creating a model, or use the "
+                           "'spawn' start method from inside an `if __name__ == '__main__':` block")
+
+    epochs = epochs if isinstance(epochs, (list, tuple)) else [epochs]
+    fit_kwargs.setdefault('validation_split', 0.1)
+    fit_kwargs.setdefault('verbose', 0)
+    configs = [dict(model_definition=m, epochs=e, es_config=es, fit_kwargs=fit_kwargs)
+               for m, e, es in itertools.product(model_definitions, epochs, es_configs)]
+
+    if not configs:
+        return []
+    if processes is None:
+        processes = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    processes = max(1, min(processes, len(configs)))
+
+    shared = {}
+    try:
+        for key, array in (('inputs', training_inputs), ('outputs', training_outputs)):
+            shared[key] = _share(np.asarray(array))
+
+        context = mp.get_context(mp_context)
+        next_worker = context.Value('i', 0)
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker,
+                                 initargs=({k: v[1] for k, v in shared.items()}, threads_per_worker,
+                                           next_worker)) as executor:
+            futures = [executor.submit(_train, idx, config, scale) for idx, config in enumerate(configs)]
+            results = [future.result() for future in futures]
+    finally:
+        for shm, _ in shared.values():
+            shm.close()
+            shm.unlink()
+
+    if results_file is not None:
+        write_results(results, results_file)
+    return results
@@ -12,7 +12,7 @@ import matplotlib.pyplot as plt
 from scipy.integrate import dblquad
 from scipy.special import erf
 
-from moku.nn import LinnModel, save_linn
+from model_sweep import run_sweep
 
 # %%
 # ---
@@ -54,6 +54,25 @@ achieved = actuator_response(desired)
 input.shape  = [nPts, 1]
 output.shape = [nPts, 1]
 
+# %%
+# Optionally compare the models below by training them all in parallel, rather than toggling them by hand.
+# The losses and training times of each run are written to a results table. Worker processes started with
+# 'spawn' would re-run this script, so the sweep uses 'fork', available on Linux and macOS. Forking is only
+# safe before tensorflow starts, so the sweep runs before moku.nn is imported below
+run_model_sweep = False
+if run_model_sweep:
+    sweep_definitions = [[(1, 'linear')],
+                         [(16, 'relu'), (16, 'relu'), (16, 'relu'), (1, 'linear')],
+                         [(100, 'relu'), (100, 'relu'), (100, 'relu'), (100, 'relu'), (1, 'linear')]]
+    results = run_sweep(sweep_definitions, output, input, epochs=500, es_configs=[{'patience': 16}],
+                        scale=False, results_file='actuator_sweep.csv', mp_context='fork')
+    for result in results:
+        print(f"{result['model_definition']}: best val_loss {result['best_val_loss']:.3g}, "
+              f"{result['epochs_run']} epochs in {result['wall_time']:.1f} s")
+
+# %%
+from moku.nn import LinnModel, save_linn
+
 # Build the neural network model. Skip the I/O scaling as the data are already pretty good for training,
 # Note that if you add scaling here, you'll need to apply the same scaling in the Moku Neural Network instrument at
 # runtime.
@@ -0,0 +1,297 @@
+"""
+Quadrant photodiode (QPD) simulation functions.
+
+These functions are used in the Quadrant_Photodiode.py example
+"""
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from scipy.integrate import dblquad
+from scipy.special import erf
+
+# Bounds of the square detectors in the form ((x_min, x_max), (y_min, y_max)), in quadrant order
+QUADRANTS = (((-1, 0), (0, 1)),
+             ((0, 1), (0, 1)),
+             ((-1, 0), (-1, 0)),
+             ((0, 1), (-1, 0)))
+
+
+# Gaussian spot function with elliptical symmetry and variable intensity
+def spot_func(x, y, X, Y, spot=0.5, intensity=1, sym=1):
+    return np.exp(-((x - X)**2 * sym + (y - Y)**2 / sym) / spot) * intensity
+
+
+_gaussian_spot = spot_func
+
+
+# Simple QPD function, integrating the spot function over each quadrant. Assumes square detectors
+def position_to_quadrants(X, Y, spot=0.5, intensity=1, sym=1, spot_func=spot_func):
+    # Integrate over each quadrant using numerical integration. Note that dblquad passes the inner
+    # integration variable first, so here x runs over the inner (gfun, hfun) limits
+    def integrand(x, y):
+        return spot_func(x, y, X, Y, spot, intensity, sym)
+
+    return np.array([dblquad(integrand, y0, y1, x0, x1)[0] for (x0, x1), (y0, y1) in QUADRANTS])
+
+
+def _gaussian_integral(a, b, centre, width):
+    # integral of exp(-(u - centre)^2 / width^2) for u from a to b
+    return np.sqrt(np.pi) / 2 * width * (erf((b - centre) / width) - erf((a - centre) / width))
+
+
+def quadrants_closed_form(X, Y, spot=0.5, intensity=1, sym=1):
+    """
+    Integrate the Gaussian spot_func over each quadrant analytically. The spot is separable in x and y so each
+    quadrant is the product of two 1D erf integrals, evaluated for every point at once.
+    :param X: beam x positions, any shape
+    :param Y: beam y positions, broadcastable with X
+    :param spot: spot size, scalar or broadcastable with X
+    :param intensity: spot intensity, scalar or broadcastable with X
+    :param sym: elliptical symmetry of the spot, scalar or broadcastable with X
+    :return: the quadrant values, with a trailing axis of size 4
+    """
+    X, Y, spot, intensity, sym = np.broadcast_arrays(*(np.asarray(v, dtype=float)
+                                                       for v in (X, Y, spot, intensity, sym)))
+    wx = np.sqrt(spot / sym)
+    wy = np.sqrt(spot * sym)
+
+    return np.stack([intensity * _gaussian_integral(x0, x1, X, wx) * _gaussian_integral(y0, y1, Y, wy)
+                     for (x0, x1), (y0, y1) in QUADRANTS], axis=-1)
+
+
+def _integrate_point(params, spot_func):
+    return position_to_quadrants(*params, spot_func=spot_func)
+
+
+def quadrants_numerical(X, Y, spot=0.5, intensity=1, sym=1, spot_func=spot_func, processes=None, chunksize=64):
+    """
+    Integrate an arbitrary spot function over each quadrant numerically, spreading the points over a process pool.
+    The spot function must be importable by the worker processes, i.e. defined at the top level of a module.
+    :param X: beam x positions, any shape
+    :param Y: beam y positions, broadcastable with X
+    :param spot: spot size, scalar or broadcastable with X
+    :param intensity: spot intensity, scalar or broadcastable with X
+    :param sym: elliptical symmetry of the spot, scalar or broadcastable with X
+    :param spot_func: function of (x, y, X, Y, spot, intensity, sym) to integrate
+    :param processes: number of worker processes, defaults to the number of CPUs
+    :param chunksize: number of points sent to a worker at a time
+    :return: the quadrant values, with a trailing axis of size 4
+    """
+    X, Y, spot, intensity, sym = np.broadcast_arrays(*(np.asarray(v, dtype=float)
+                                                       for v in (X, Y, spot, intensity, sym)))
+    params = zip(*(v.ravel().tolist() for v in (X, Y, spot, intensity, sym)))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        qs = list(executor.map(partial(_integrate_point, spot_func=spot_func), params, chunksize=chunksize))
+
+    return np.array(qs).reshape(*X.shape, 4)
+
+
+def generate_quadrants(X, Y, spot=0.5, intensity=1, sym=1, spot_func=None, processes=None):
+    """
+    Generate the quadrant values over a set of beam positions. The closed form is used for the default Gaussian spot,
+    any other spot function falls back to numerical integration across a process pool.
+    :param X: beam x positions, any shape
+    :param Y: beam y positions, broadcastable with X
+    :param spot: spot size, scalar or broadcastable with X
+    :param intensity: spot intensity, scalar or broadcastable with X
+    :param sym: elliptical symmetry of the spot, scalar or broadcastable with X
+    :param spot_func: function of (x, y, X, Y, spot, intensity, sym) to integrate, None for the Gaussian spot
+    :param processes: number of worker processes for the numerical fallback
+    :return: the quadrant values, with a trailing axis of size 4
+    """
+    if spot_func is None or spot_func is _gaussian_spot:
+        return quadrants_closed_form(X, Y, spot, intensity, sym)
+    return quadrants_numerical(X, Y, spot, intensity, sym, spot_func=spot_func, processes=processes)
+
+
+
+class QuadrantLUT:
+    """
+    Precomputed lookup table of the quadrant values over (X, Y, spot, sym), for serving quadrant values at high rates in
+    closed-loop simulations. The Gaussian spot is separable, so each quadrant value is the intensity times the
+    integral of a 1D Gaussian over the left or right half of the detector in x, times the same over the bottom or top
+    half in y. The table holds those two half-detector integrals on a regular grid of (position, width), which covers
+    every combination of X, Y, spot and sym in a table of a few MB, and values between the grid points are found by
+    bilinear interpolation. Beam positions and spot widths outside the table are not extrapolated: their quadrant
+    values are NaN, or a ValueError is raised if lookup is called with bounds_error=True.
+    """
+    def __init__(self, table, bounds):
+        """
+        :param table: integrals over the lower and upper half of the detector, shape (n_position, n_width, 2)
+        :param bounds: list of the (min, max) position and (min, max) width of the table
+        """
+        self.table = table
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.shape = np.array(table.shape[:2])
+        self.steps = (self.bounds[:, 1] - self.bounds[:, 0]) / (self.shape - 1)
+
+        # relative interpolation error measured when the table was built, and the arguments it was built with
+        self.error = None
+        self.params = None
+
+    @staticmethod
+    def table_bounds(x_range=(-1, 1), y_range=(-1, 1), spot_range=(0.2, 0.8), sym_range=(0.3, 1.7)):
+        # positions and widths needed to cover the given ranges, the widths are sqrt(spot / sym) and sqrt(spot * sym)
+        widths = np.sqrt(np.outer(spot_range, np.concatenate((sym_range, 1 / np.asarray(sym_range)))))
+        return [(min(x_range[0], y_range[0]), max(x_range[1], y_range[1])), (widths.min(), widths.max())]
+
+    @classmethod
+    def from_grid(cls, shape, bounds):
+        """
+        Build a table by evaluating the half-detector integrals on a grid of the given shape
+        :param shape: number of grid points along the position and width axes
+        :param bounds: list of the (min, max) position and (min, max) width of the table
+        :return: the lookup table
+        """
+        position = np.linspace(*bounds[0], shape[0])[:, None]
+        width = np.linspace(*bounds[1], shape[1])[None, :]
+        table = np.stack((_gaussian_integral(-1, 0, position, width), _gaussian_integral(0, 1, position, width)),
+                         axis=-1)
+        return cls(table, bounds)
+
+    @classmethod
+    def build(cls, tolerance=1e-5, x_range=(-1, 1), y_range=(-1, 1), spot_range=(0.2, 0.8), sym_range=(0.3, 1.7),
+              initial_shape=(65, 17), max_bytes=2 ** 28, n_check=100000, seed=0):
+        """
+        Build a table that meets an accuracy target over the given ranges of beam position and spot parameters. The
+        grid is refined until the largest error of the interpolated quadrant values at a set of random check points,
+        relative to the largest quadrant value, is below the tolerance.
+        :param tolerance: target interpolation error, relative to the largest quadrant value
+        :param initial_shape: number of grid points along the position and width axes to start with
+        :param max_bytes: largest table to build, a RuntimeError is raised if the tolerance can't be met within it
+        :param n_check: number of random points to check the interpolation error at
+        :param seed: seed for the check points
+        :return: the lookup table
+        """
+        params = dict(tolerance=tolerance, x_range=x_range, y_range=y_range, spot_range=spot_range,
+                      sym_range=sym_range, initial_shape=initial_shape, max_bytes=max_bytes, n_check=n_check, seed=seed)
+        rng = np.random.default_rng(seed)
+        check = [rng.uniform(lo, hi, n_check) for lo, hi in (x_range, y_range, spot_range, sym_range)]
+        expected = quadrants_closed_form(check[0], check[1], check[2], 1, check[3])
+        bounds = cls.table_bounds(x_range, y_range, spot_range, sym_range)
+
+        shape = np.array(initial_shape)
+        while np.prod(shape) * 2 * np.dtype(float).itemsize <= max_bytes:
+            lut = cls.from_grid(shape, bounds)
+            lut.error = np.abs(lut.lookup(check[0], check[1], check[2], 1, check[3]) - expected).max()
+            lut.error /= np.abs(expected).max()
+            if lut.error <= tolerance:
+                # store the arguments as they are saved to JSON, so that they compare equal after loading
+                lut.params = json.loads(json.dumps(params))
+                return lut
+
+            # the linear interpolation error along each axis is about an eighth of the largest second difference
+            # of the table along it, so only refine the axes that contribute a significant part of the error
+            peak = np.abs(lut.table).max()
+            axis_error = np.array([np.abs(np.diff(lut.table, 2, axis=a)).max() / 8 / peak for a in range(2)])
+            refine = (axis_error > tolerance / 4) | (axis_error == axis_error.max())
+            shape = np.where(refine, 2 * shape - 1, shape)
+
+        raise RuntimeError(f"Can't meet the tolerance {tolerance} with a table of at most {max_bytes} bytes")
+
+    def _outside(self, position, width):
+        # points outside the table, allowing for rounding at its edges
+        fi = (position - self.bounds[0, 0]) / self.steps[0]
+        fj = (width - self.bounds[1, 0]) / self.steps[1]
+        eps = 1e-9
+        return (fi < -eps) | (fi > self.shape[0] - 1 + eps) | (fj < -eps) | (fj > self.shape[1] - 1 + eps)
+
+    def _interpolate(self, position, width):
+        # bilinear interpolation of the lower and upper half integrals, shape (n, 2). Points outside the table are
+        # clamped to its edges here, and masked by lookup.
+        fi = np.clip((position - self.bounds[0, 0]) / self.steps[0], 0, self.shape[0] - 1)
+        fj = np.clip((width - self.bounds[1, 0]) / self.steps[1], 0, self.shape[1] - 1)
+        i = np.minimum(fi.astype(np.intp), self.shape[0] - 2)
+        j = np.minimum(fj.astype(np.intp), self.shape[1] - 2)
+        fi = (fi - i)[:, None]
+        fj = (fj - j)[:, None]
+
+        # gather the four surrounding grid points from the flattened table
+        table = self.table.reshape(-1, 2)
+        flat = i * self.shape[1] + j
+        v00, v01 = table.take(flat, axis=0), table.take(flat + 1, axis=0)
+        v10, v11 = table.take(flat + self.shape[1], axis=0), table.take(flat + self.shape[1] + 1, axis=0)
+
+        return v00 + fj * (v01 - v00) + fi * (v10 - v00 + fj * (v11 - v10 - v01 + v00))
+
+    def lookup(self, X, Y, spot=0.5, intensity=1, sym=1, bounds_error=False):
+        """
+        Interpolate the quadrant values for a set of beam positions and spot parameters
+        :param X: beam x positions, any shape
+        :param Y: beam y positions, broadcastable with X
+        :param spot: spot size, scalar or broadcastable with X
+        :param intensity: spot intensity, scalar or broadcastable with X
+        :param sym: elliptical symmetry of the spot, scalar or broadcastable with X
+        :param bounds_error: raise a ValueError if any point is outside the table, otherwise its values are NaN
+        :return: the quadrant values, with a trailing axis of size 4
+        """
+        X, Y, spot, intensity, sym = np.broadcast_arrays(*(np.asarray(v, dtype=float)
+                                                           for v in (X, Y, spot, intensity, sym)))
+        shape = X.shape
+        X, Y, spot, intensity, sym = (v.ravel() for v in (X, Y, spot, intensity, sym))
+
+        wx, wy = np.sqrt(spot / sym), np.sqrt(spot * sym)
+        outside = self._outside(X, wx) | self._outside(Y, wy)
+        if bounds_error and outside.any():
+            raise ValueError(f'{np.count_nonzero(outside)} points are outside the lookup table, which covers '
+                             f'positions {self.bounds[0, 0]:g} to {self.bounds[0, 1]:g} and spot widths '
+                             f'{self.bounds[1, 0]:g} to {self.bounds[1, 1]:g}')
+
+        # integrals over the left/right halves in x and the bottom/top halves in y
+        gx = self._interpolate(X, wx)
+        gy = self._interpolate(Y, wy)
+
+        # combine them in the order of QUADRANTS
+        qs = np.stack((gx[:, 0] * gy[:, 1], gx[:, 1] * gy[:, 1], gx[:, 0] * gy[:, 0], gx[:, 1] * gy[:, 0]), axis=-1)
+        qs *= intensity[:, None]
+        qs[outside] = np.nan
+        return qs.reshape(*shape, 4)
+
+    def save(self, file_name):
+        """
+        Save the table to disk, as file_name.npy with the axis bounds and build arguments in file_name.json
+        :param file_name: path of the table, without an extension
+        :return: None
+        """
+        np.save(f'{file_name}.npy', np.ascontiguousarray(self.table))
+        with open(f'{file_name}.json', 'w') as f:
+            json.dump({'bounds': self.bounds.tolist(), 'error': self.error, 'params': self.params}, f)
+
+    @classmethod
+    def load(cls, file_name, mmap_mode='r'):
+        """
+        Load a table saved with save, memory-mapping the table rather than reading it into memory
+        :param file_name: path of the table, without an extension
+        :param mmap_mode: numpy memory-map mode, None to read the table into memory
+        :return: the lookup table
+        """
+        with open(f'{file_name}.json', 'r') as f:
+            meta = json.load(f)
+        lut = cls(np.load(f'{file_name}.npy', mmap_mode=mmap_mode), meta['bounds'])
+        lut.error = meta['error']
+        lut.params = meta.get('params')
+        return lut
+
+    @classmethod
+    def load_or_build(cls, file_name, mmap_mode='r', **kwargs):
+        """
+        Load a saved table if it was built with the same arguments, otherwise build it and save it in its place
+        :param file_name: path of the table, without an extension
+        :param mmap_mode: numpy memory-map mode, None to read the table into memory
+        :param kwargs: arguments of build, e.g. tolerance or spot_range
+        :return: the lookup table
+        """
+        params = inspect.signature(cls.build).bind(**kwargs)
+        params.apply_defaults()
+        params = json.loads(json.dumps(params.arguments))
+        if os.path.exists(f'{file_name}.npy') and os.path.exists(f'{file_name}.json'):
+            lut = cls.load(file_name, mmap_mode)
+            if lut.params == params:
+                return lut
+        cls.build(**kwargs).save(file_name)
+        return cls.load(file_name, mmap_mode)
@@ -0,0 +1,294 @@
+"""
+Vectorised generators for the training data used in the neural network examples.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+from emitter_simulator import QuantumEmitter
+
+
+def _compose_clips(outer, inner):
+    # compose two clipped additions f(x) = clip(x + a, lo, hi), returning outer(inner(x)) in the same form
+    a_o, lo_o, hi_o = outer
+    a_i, lo_i, hi_i = inner
+    return a_i + a_o, np.clip(lo_i + a_o, lo_o, hi_o), np.clip(hi_i + a_o, lo_o, hi_o)
+
+
+def clipped_cumsum(start, steps, lower=-1, upper=1):
+    """
+    Cumulative sum of steps, clipped to the bounds after every step. Each step is the function
+    x -> clip(x + step, lower, upper), and these are closed under composition, so the running composition is found
+    with a parallel prefix scan in log2(N) vectorised passes rather than a Python loop over the steps.
+    :param start: starting value of each walk, shape (M,)
+    :param steps: steps to take, shape (M, N). The first step is replaced by the start value.
+    :param lower: lower bound of the walk
+    :param upper: upper bound of the walk
+    :return: the clipped walks, shape (M, N)
+    """
+    steps = np.asarray(steps, dtype=float)
+    start = np.broadcast_to(np.asarray(start, dtype=float), steps.shape[:1])
+
+    add = steps.copy()
+    lo = np.full(steps.shape, float(lower))
+    hi = np.full(steps.shape, float(upper))
+
+    # the first element is the constant function x -> start, so every prefix evaluates to a constant
+    add[:, 0] = 0
+    lo[:, 0] = start
+    hi[:, 0] = start
+
+    shift = 1
+    while shift < steps.shape[1]:
+        add[:, shift:], lo[:, shift:], hi[:, shift:] = _compose_clips(
+            (add[:, shift:], lo[:, shift:], hi[:, shift:]),
+            (add[:, :-shift], lo[:, :-shift], hi[:, :-shift]))
+        shift *= 2
+
+    return lo
+
+
+def random_walks(step_size, n_walks, length, random_start=False, lower=-1, upper=1, rng=np.random):
+    """
+    Generate a set of random walks that are clipped to the given bounds
+    :param step_size: standard deviation of each step
+    :param n_walks: number of walks to generate
+    :param length: number of points in each walk
+    :param random_start: start each walk at a uniformly distributed point between the bounds, otherwise start at 0
+    :param lower: lower bound of the walks
+    :param upper: upper bound of the walks
+    :param rng: random number generator, defaults to the global numpy generator so np.random.seed applies
+    :return: the walks, shape (n_walks, length)
+    """
+    if random_start:
+        start = rng.uniform(lower, upper, n_walks)
+    else:
+        start = np.zeros(n_walks)
+    steps = rng.normal(0, step_size, (n_walks, length))
+
+    return clipped_cumsum(start, steps, lower, upper)
+
+
+def random_walks_chunked(step_size, n_walks, length, chunk_size=1024, **kwargs):
+    """
+    Generate random walks in chunks to bound the memory used, see random_walks for the arguments
+    :param chunk_size: maximum number of walks in each chunk
+    :return: generator of arrays of walks, each with shape (<= chunk_size, length)
+    """
+    for start in range(0, n_walks, chunk_size):
+        yield random_walks(step_size, min(chunk_size, n_walks - start), length, **kwargs)
+
+
+def random_walk(step_size, input_array, random_start=False, rng=np.random):
+    """
+    Generate a single random walk, clipped to +-1, with the same shape as the input array
+    :param step_size: standard deviation of each step
+    :param input_array: array that defines the shape of the walk, e.g. the time base
+    :param random_start: start at a random point in the domain, otherwise start at 0
+    :param rng: random number generator
+    :return: the walk
+    """
+    input_array = np.asarray(input_array)
+    return random_walks(step_size, 1, input_array.size, random_start, rng=rng).reshape(input_array.shape)
+
+
+def periodic_signals(x, n_signals, cycles_range=(30, 40), rng=np.random):
+    """
+    Generate a labelled set of sine, square and sawtooth waves with random frequencies, as used in Signal_ID.ipynb
+    :param x: phase base of the signals, 1D
+    :param n_signals: number of signals to generate
+    :param cycles_range: range of the integer number of cycles over the phase base, excluding the upper end
+    :param rng: random number generator, defaults to the global numpy generator so np.random.seed applies
+    :return: tuple of the signals, shape (n_signals, x.size), and one-hot labels, shape (n_signals, 3)
+    """
+    func_type = rng.choice(3, n_signals)
+    num_cycles = rng.choice(np.arange(*cycles_range), n_signals)
+    phase = num_cycles[:, None] * np.asarray(x)[None, :]
+
+    signals = np.empty(phase.shape)
+    for idx, func in enumerate((np.sin, signal.square, signal.sawtooth)):
+        mask = func_type == idx
+        signals[mask] = func(phase[mask])
+
+    return signals, np.eye(3)[func_type]
+
+
+def window_batches(signals, labels, window):
+    """
+    Split each signal into consecutive non-overlapping windows, each labelled with the label of its signal. Only
+    windows that end before the last point of the signal are used, matching the batching in Signal_ID.ipynb
+    :param signals: signals to split, shape (n_signals, n_points)
+    :param labels: labels of the signals, shape (n_signals, n_labels)
+    :param window: number of points in each window
+    :return: tuple of the windows, shape (n_signals * n_windows, window), and their labels
+    """
+    signals = np.asarray(signals)
+    n_windows = (signals.shape[1] - 1) // window
+    windows = sliding_window_view(signals, window, axis=1)[:, ::window][:, :n_windows]
+    return windows.reshape(-1, window), np.repeat(labels, n_windows, axis=0)
+
+
+def periodic_windows_chunked(x, n_signals, window, chunk_size=1000, **kwargs):
+    """
+    Generate windowed periodic signals in chunks of signals to bound the memory used, see periodic_signals and
+    window_batches for the arguments
+    :param chunk_size: maximum number of signals in each chunk
+    :return: generator of (windows, labels) tuples
+    """
+    for start in range(0, n_signals, chunk_size):
+        yield window_batches(*periodic_signals(x, min(chunk_size, n_signals - start), **kwargs), window)
+
+
+def sine_grid(t, frequencies, phases):
+    """
+    Generate sine waves for every combination of angular frequency and phase offset, sin(frequency * (t + phase))
+    :param t: time base, 1D
+    :param frequencies: angular frequencies, 1D
+    :param phases: phase offsets in units of t, 1D
+    :return: the signals, shape (frequencies.size * phases.size, t.size), ordered as itertools.product
+    """
+    t, frequencies, phases = (np.asarray(v, dtype=float) for v in (t, frequencies, phases))
+    signals = np.sin(frequencies[:, None, None] * (t[None, None, :] + phases[None, :, None]))
+    return signals.reshape(-1, t.size)
+
+
+def add_anomalies(signals, widths, hold='start', noise=0.2, rng=np.random):
+    """
+    Add a flat anomaly and uniform noise to each signal, as used in Classification.ipynb. The anomaly holds the
+    signal at the value of its first or last point for a random width at a random position.
+    :param signals: signals to modify, shape (n_signals, n_points). They are not modified in place.
+    :param widths: possible widths of the anomaly, in points
+    :param hold: 'start' to hold the value at the start of the anomaly, 'end' to hold the value at its end
+    :param noise: amplitude of the uniform noise added to every point
+    :param rng: random number generator, defaults to the global numpy generator so np.random.seed applies
+    :return: tuple of the modified signals and the (start, stop) index of each anomaly, shape (n_signals, 2)
+    """
+    signals = np.asarray(signals, dtype=float)
+    n_signals, n_points = signals.shape
+
+    # choose a starting index and width, clipping the anomaly to the bounds of the signal
+    start = rng.choice(n_points, n_signals)
+    width = rng.choice(np.asarray(widths), n_signals)
+    start = np.where(start + width >= n_points, n_points - width, start)
+    stop = np.minimum(start + width, n_points)
+
+    rows = np.arange(n_signals)
+    value = signals[rows, start] if hold == 'start' else signals[rows, stop - 1]
+    idx = np.arange(n_points)
+    anomalous = (idx >= start[:, None]) & (idx < stop[:, None])
+
+    out = np.where(anomalous, value[:, None], signals)
+    out += rng.uniform(0, noise, out.shape)
+    return out, np.stack((start, stop), axis=-1)
+
+
+def add_noise(signals, noise=0.2, rng=np.random):
+    """
+    Add uniform noise to each signal
+    :param signals: signals to modify, shape (n_signals, n_points). They are not modified in place.
+    :param noise: amplitude of the uniform noise added to every point
+    :param rng: random number generator
+    :return: the noisy signals
+    """
+    signals = np.asarray(signals, dtype=float)
+    return signals + rng.uniform(0, noise, signals.shape)
+
+
+def anomaly_dataset_chunked(signals, widths, chunk_size=10000, shuffle=True, rng=np.random, **kwargs):
+    """
+    Generate a labelled anomaly detection dataset in chunks. Each chunk holds equal numbers of non-defective
+    (label 0) and defective (label 1) signals, drawn from the given clean signals.
+    :param signals: clean signals, shape (n_signals, n_points)
+    :param widths: possible widths of the anomaly, in points
+    :param chunk_size: number of clean signals used in each chunk
+    :param shuffle: shuffle the order of the signals first
+    :param rng: random number generator
+    :param kwargs: additional arguments for add_anomalies, e.g. hold or noise
+    :return: generator of (signals, labels) tuples, each with 2 * chunk_size rows at most
+    """
+    order = rng.permutation(len(signals)) if shuffle else np.arange(len(signals))
+    noise = kwargs.get('noise', 0.2)
+    for start in range(0, len(order), chunk_size):
+        clean = np.asarray(signals)[order[start:start + chunk_size]]
+        defective, _ = add_anomalies(clean, widths, rng=rng, **kwargs)
+        labels = np.repeat([0., 1.], len(clean))[:, None]
+        yield np.concatenate((add_noise(clean, noise, rng), defective)), labels
+
+
+def autoencoder_dataset(step_size, n_walks, length, seed=0):
+    """
+    Generate the random walk training set of Autoencoder.ipynb, for use with DatasetCache
+    :param step_size: standard deviation of each step
+    :param n_walks: number of walks to generate
+    :param length: number of points in each walk
+    :param seed: seed of the walks
+    :return: dict of the 'walks', shape (n_walks, length), each starting at a random point in [-1, 1]
+    """
+    rng = np.random.default_rng(seed)
+    return {'walks': random_walks(step_size, n_walks, length, random_start=True, rng=rng)}
+
+
+def emitter_dataset(wavelength, waist, x, t, step_size=0.1, seed=0):
+    """
+    Simulate the training set of Emitter_control.ipynb, for use with DatasetCache. The offsets and angles of the beam
+    follow random walks, and the emitter is stepped through all of them in one batch.
+    :param wavelength: wavelength of the beam in m
+    :param waist: waist of the beam in m
+    :param x: axis of the square simulation domain in m, 1D
+    :param t: time base of the walks, 1D
+    :param step_size: standard deviation of each step of the walks
+    :param seed: seed of the walks
+    :return: dict of the 'offsets', 'shears' and 'angles' of each step, shape (T, 2), the difference in counts of
+    each modulation 'mod_counts', shape (T, 4), the base 'counts', shape (T,), and the 'corrections' that return the
+    beam to its target, shape (T, 4)
+    """
+    rng = np.random.default_rng(seed)
+    walks = random_walks(step_size, 4, np.size(t), rng=rng)
+
+    # scale the walks to the bounds for which the simulation makes sense, 4 um offsets and 0 to 10 degree angles
+    offsets = walks[:2].T * 4e-6
+    angles = np.pi / 2 - (walks[2:].T + 1) * 5 * np.pi / 180
+
+    qe_sim = QuantumEmitter(wavelength=wavelength, waist=waist)
+    qe_sim.set_axes(x, x)
+    shears = qe_sim.new_scale(angles)
+    mod_counts, counts = qe_sim.time_step_batch(offsets, shears, angles)
+    corrections = np.array([0, 0, 1, 1]) - np.concatenate((offsets, shears), axis=-1)
+    return {'offsets': offsets, 'shears': shears, 'angles': angles, 'mod_counts': mod_counts, 'counts': counts,
+            'corrections': corrections}
+
+
+def signal_id_dataset(x, n_signals, seed=0, **kwargs):
+    """
+    Generate the labelled periodic signals of Signal_ID.ipynb, for use with DatasetCache
+    :param x: phase base of the signals, 1D
+    :param n_signals: number of signals to generate
+    :param seed: seed of the signals
+    :param kwargs: additional arguments for periodic_signals, e.g. cycles_range
+    :return: dict of the 'signals', shape (n_signals, x.size), and their one-hot 'answers', shape (n_signals, 3)
+    """
+    signals, answers = periodic_signals(x, n_signals, rng=np.random.default_rng(seed), **kwargs)
+    return {'signals': signals, 'answers': answers}
+
+
+def classification_dataset(t, frequencies, phases, widths, noise=0.2, seed=0):
+    """
+    Generate the defective and non-defective signals of Classification.ipynb, for use with DatasetCache. Every
+    signal of the sine grid is used twice in each set, shuffled each time. The first defective copy holds the anomaly
+    at the value of its first point, the second at the value of its last point.
+    :param t: time base, 1D
+    :param frequencies: angular frequencies, 1D
+    :param phases: phase offsets in units of t, 1D
+    :param widths: possible widths of the anomaly, in points
+    :param noise: amplitude of the uniform noise added to every point
+    :param seed: seed of the shuffles, anomalies and noise
+    :return: dict of the 'defective' signals, the (start, stop) 'spans' of their anomalies and the 'non_defective'
+    signals
+    """
+    rng = np.random.default_rng(seed)
+    signals = sine_grid(t, frequencies, phases)
+    defective, spans = zip(*(add_anomalies(rng.permutation(signals), widths, hold=hold, noise=noise, rng=rng)
+                             for hold in ('start', 'end')))
+    non_defective = [add_noise(rng.permutation(signals), noise, rng) for _ in range(2)]
+    return {'defective': np.concatenate(defective), 'spans': np.concatenate(spans),
+            'non_defective': np.concatenate(non_defective)}
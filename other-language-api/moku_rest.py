@@ -0,0 +1,246 @@
+"""
+Minimal client for the Moku REST API in Python, using only the standard library.
+
+This mirrors the other examples in this directory rather than the full `moku` package, so it imports quickly and
+suits embedded or CI hosts. Each client keeps a small pool of keep-alive connections to its Moku, so that frequent
+control calls don't pay for a new TCP connection each time, and can optionally pipeline a batch of requests over a
+single connection.
+
+Responses are decoded from JSON, or from MessagePack if it was asked for, the server supports it and the `msgpack`
+package is installed.
+
+    with MokuClient('192.168.73.1') as moku:
+        moku.claim_ownership(force_connect=True)
+        moku.oscilloscope.set_frontend(channel=1, impedance='1MOhm', coupling='AC', range='10Vpp')
+        data = moku.oscilloscope.get_data(wait_reacquire=False)
+"""
+import http.client
+import json
+import queue
+import socket
+
+
+class MokuError(Exception):
+    """
+    Raised when the Moku responds with `success` false
+    """
+    def __init__(self, endpoint, code, messages):
+        super().__init__(f'{endpoint}: {messages[0] if messages else code}')
+        self.endpoint = endpoint
+        self.code = code
+        self.messages = messages
+
+
+class _Endpoint:
+    # gives moku.oscilloscope.get_data(...) for the endpoint 'oscilloscope/get_data'
+    def __init__(self, client, path):
+        self._client = client
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return _Endpoint(self._client, f'{self._path}/{name}')
+
+    def __call__(self, **params):
+        return self._client.request(self._path, params)
+
+
+class _SharedReader:
+    # lets successive pipelined responses read from one buffered socket file without closing it
+    def __init__(self, fp):
+        self._fp = fp
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+    def close(self):
+        pass
+
+
+class _SocketFile:
+    def __init__(self, fp):
+        self._fp = fp
+
+    def makefile(self, *args, **kwargs):
+        return _SharedReader(self._fp)
+
+
+class MokuClient:
+    """
+    Keep-alive client for the REST API of one Moku. It is safe to share between threads, each request takes a
+    connection from the pool.
+    """
+    def __init__(self, ip_address, pool_size=4, timeout=10, msgpack=False):
+        """
+        :param ip_address: IP address of the Moku, IPv6 addresses in square brackets
+        :param pool_size: maximum number of idle connections kept open
+        :param timeout: socket timeout in seconds
+        :param msgpack: ask for MessagePack responses, which are faster to decode for large frames
+        """
+        self.host = ip_address
+        self.timeout = timeout
+        self.client_key = None
+        self.connections_opened = 0
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+        self._accept = 'application/json'
+        if msgpack:
+            try:
+                import msgpack  # noqa: F401
+                self._accept = 'application/msgpack, application/json;q=0.9'
+            except ImportError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.client_key is not None:
+            self.relinquish_ownership()
+        self.close()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        # e.g. moku.oscilloscope or moku.slot1.oscilloscope
+        return _Endpoint(self, name)
+
+    def claim_ownership(self, force_connect=False):
+        """
+        :param force_connect: take ownership even if another client owns the Moku
+        :return: the client key, which is sent with every following request
+        """
+        self.client_key = self.request('moku/claim_ownership', {'force_connect': force_connect})
+        return self.client_key
+
+    def relinquish_ownership(self):
+        try:
+            self.request('moku/relinquish_ownership')
+        finally:
+            self.client_key = None
+
+    def request(self, endpoint, params=None, method='POST'):
+        """
+        Send one request on a pooled keep-alive connection
+        :param endpoint: endpoint under /api/, e.g. 'oscilloscope/get_data' or 'slot1/oscilloscope/get_data'
+        :param params: dict of parameters, sent as the JSON body
+        :param method: HTTP method, 'GET' for endpoints such as 'moku/name'
+        :return: the data of the response
+        """
+        conn = self._get_connection()
+        try:
+            try:
+                conn.request(method, f'/api/{endpoint}', *self._encode(params, method))
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # the Moku closed the idle connection, so retry once on a new one
+                conn.close()
+                conn = self._connect()
+                conn.request(method, f'/api/{endpoint}', *self._encode(params, method))
+                response = conn.getresponse()
+            data = self._decode(endpoint, response, response.read())
+        except BaseException:
+            conn.close()
+            raise
+        self._put_connection(conn, response)
+        return data
+
+    def pipeline(self, calls):
+        """
+        Send several requests before reading any of the responses, on one connection. This saves a round trip per
+        request, but needs a server that supports HTTP/1.1 pipelining, and a failed request fails the batch.
+        :param calls: list of (endpoint, params) tuples
+        :return: list of the data of each response, in order
+        """
+        conn = self._get_connection()
+        try:
+            if conn.sock is None:
+                conn.connect()
+            payload = b''.join(self._raw_request(endpoint, params) for endpoint, params in calls)
+            conn.sock.sendall(payload)
+
+            reader = _SocketFile(conn.sock.makefile('rb'))
+            results = []
+            for endpoint, _ in calls:
+                response = http.client.HTTPResponse(reader, method='POST')
+                response.begin()
+                results.append(self._decode(endpoint, response, response.read()))
+        finally:
+            # the reader may hold buffered data past the last response, so don't reuse the connection
+            conn.close()
+        return results
+
+    def close(self):
+        """
+        Close every pooled connection
+        """
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _headers(self):
+        headers = {'Content-Type': 'application/json', 'Accept': self._accept}
+        if self.client_key is not None:
+            headers['Moku-Client-Key'] = self.client_key
+        return headers
+
+    def _encode(self, params, method):
+        body = None if params is None and method == 'GET' else json.dumps(params or {}).encode()
+        return body, self._headers()
+
+    def _raw_request(self, endpoint, params):
+        body = json.dumps(params or {}).encode()
+        headers = dict(self._headers(), Host=self.host, **{'Content-Length': str(len(body))})
+        lines = [f'POST /api/{endpoint} HTTP/1.1'] + [f'{key}: {value}' for key, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+    def _decode(self, endpoint, response, body):
+        if response.getheader('Content-Type', '').startswith('application/msgpack'):
+            import msgpack
+            reply = msgpack.unpackb(body, raw=False)
+        else:
+            reply = json.loads(body)
+        if not reply.get('success'):
+            raise MokuError(endpoint, reply.get('code'), reply.get('messages') or [])
+        return reply.get('data')
+
+    def _connect(self):
+        conn = http.client.HTTPConnection(self.host, timeout=self.timeout)
+        conn.connect()
+        # control calls are small, so send them straight away rather than waiting to fill a packet
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections_opened += 1
+        return conn
+
+    def _get_connection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _put_connection(self, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+if __name__ == '__main__':
+    # Change your IP address here
+    with MokuClient('192.168.73.1') as moku:
+        moku.claim_ownership(force_connect=True)
+        print(moku.request('moku/name', method='GET'))
+
+        moku.oscilloscope.set_frontend(channel=1, impedance='1MOhm', coupling='AC', range='10Vpp')
+        moku.oscilloscope.set_frontend(channel=2, impedance='1MOhm', coupling='AC', range='10Vpp')
+
+        # This prints out a frame dictionary like so:
+        # { time: [-0.005, -0.004, -0.003, ...], ch1: [0.0, 0.0, 0.0, ...], ... }
+        print(moku.oscilloscope.get_data(wait_reacquire=False))
+        print(f'{moku.connections_opened} connection(s) opened')
@@ -0,0 +1,144 @@
+#
+# moku example: Asyncio instrument facade
+#
+# This module wraps the instrument classes so that their methods can be
+# awaited from asyncio. Each call is still a blocking HTTP request to the
+# Moku, but it runs on a worker thread, so independent calls such as the
+# front end settings of several channels, or the configuration of several
+# Multi-instrument Mode slots, are sent at once rather than one after
+# another. Each Moku has a bounded pool of worker threads, shared by the
+# slots of a Multi-instrument Mode configuration, and each worker sends its
+# requests through its own copy of the HTTP session of the Moku, as a
+# requests session is not safe to use from several threads at once.
+# Calls sent at once may be applied in any order, so await the calls that
+# depend on each other one after another.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from thread_sessions import ThreadSessions
+
+
+class DevicePool:
+    """
+    Pool of worker threads that bounds the number of requests in flight to one Moku, each worker with its own HTTP
+    session. Share a DevicePool between the instruments of the same Moku, e.g. the slots of a MultiInstrument.
+    """
+    def __init__(self, max_in_flight=4, name='Moku'):
+        """
+        :param max_in_flight: maximum number of requests sent to the Moku at once
+        :param name: name prefix of the worker threads
+        """
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.sessions = ThreadSessions()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=name)
+
+    async def run(self, function):
+        """
+        Run a blocking function on a worker thread of the Moku, once fewer than max_in_flight requests are in flight
+        :param function: function of no arguments
+        :return: the result of the function
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._send, function)
+
+    def _send(self, function):
+        # counted on the worker thread, so that calls waiting for a worker are not in flight
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return function()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.requests += 1
+
+    async def call(self, instrument, method, *args, **kwargs):
+        """
+        Call a method of an instrument on a worker thread, through the session of that worker
+        :param instrument: connected instrument
+        :param method: name of the method, e.g. 'set_frontend'
+        :return: the result of the method
+        """
+        def function():
+            return getattr(self.sessions.instrument(instrument), method)(*args, **kwargs)
+        return await self.run(function)
+
+    def shutdown(self):
+        """
+        Stop the worker threads once the calls in flight have been sent
+        """
+        self._executor.shutdown(wait=False)
+
+
+class AsyncInstrument:
+    """
+    Asyncio facade of an instrument. Every method of the instrument is available as a coroutine.
+
+    Example:
+        i = await AsyncInstrument.connect(Phasemeter, '192.168.###.###')
+        await asyncio.gather(*(i.set_frontend(ch, coupling='DC', impedance='1MOhm', range='400mVpp')
+                               for ch in range(1, 5)))
+        data = await i.get_data()
+    """
+    def __init__(self, instrument, max_in_flight=4, device=None):
+        """
+        :param instrument: connected instrument, e.g. Phasemeter('192.168.###.###')
+        :param max_in_flight: maximum number of requests sent to the Moku at once
+        :param device: DevicePool shared with the other instruments of the same Moku, overrides max_in_flight
+        """
+        self.instrument = instrument
+        self.device = device or DevicePool(max_in_flight)
+
+    @classmethod
+    async def connect(cls, instrument_class, *args, max_in_flight=4, **kwargs):
+        """
+        Connect to a Moku without blocking the event loop
+        :param instrument_class: instrument class, e.g. Phasemeter or MultiInstrument
+        :param args: arguments of the instrument class, e.g. the ip address
+        :param max_in_flight: maximum number of requests sent to the Moku at once
+        :param kwargs: keyword arguments of the instrument class, e.g. force_connect
+        :return: AsyncInstrument of the connected instrument
+        """
+        device = DevicePool(max_in_flight)
+        instrument = await device.run(functools.partial(instrument_class, *args, **kwargs))
+        return cls(instrument, device=device)
+
+    async def call(self, method, *args, **kwargs):
+        """
+        Call a method of the instrument on a worker thread of its Moku
+        :param method: name of the method, e.g. 'set_frontend'
+        :return: the result of the method
+        """
+        return await self.device.call(self.instrument, method, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(self.instrument, name)):
+            return getattr(self.instrument, name)
+
+        @functools.wraps(getattr(self.instrument, name))
+        async def method(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+        return method
+
+    async def set_instrument(self, slot, instrument_class, **kwargs):
+        """
+        Deploy an instrument to a Multi-instrument Mode slot. The slot shares the worker threads of this Moku.
+        :param slot: slot number
+        :param instrument_class: instrument class, e.g. Oscilloscope
+        :param kwargs: additional arguments for set_instrument
+        :return: AsyncInstrument of the slot
+        """
+        instrument = await self.call('set_instrument', slot, instrument_class, **kwargs)
+        # the slot was created with the session copy of a worker thread, give it the session of the MultiInstrument
+        # so that each worker sends the requests of the slot through the same session as those of the Moku
+        instrument.session = self.instrument.session
+        return AsyncInstrument(instrument, device=self.device)
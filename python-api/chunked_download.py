@@ -0,0 +1,220 @@
+#
+# moku example: Parallel, resumable downloads
+#
+# This module downloads large files, such as Datalogger logs, from the Moku
+# as ranged HTTP requests in parallel chunks. Each completed chunk is
+# recorded with its checksum in a small state file next to the partial
+# download, so an interrupted transfer resumes from the chunks that were
+# already received rather than starting again.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+
+class ChunkedDownload:
+    """
+    Downloads a file in parallel ranged chunks, resuming from a partial local file.
+
+    Example:
+        ChunkedDownload(url, 'log.li', workers=4, progress=print_progress).run()
+    """
+    def __init__(self, url, local_path, chunk_size=2 ** 23, workers=4, retries=3, headers=None, timeout=(10, 60),
+                 progress=None):
+        """
+        :param url: URL of the file
+        :param local_path: path to download the file to
+        :param chunk_size: number of bytes in each ranged request
+        :param workers: number of chunks to download at once
+        :param retries: number of times to retry a chunk that fails or does not verify
+        :param headers: extra HTTP headers for every request, e.g. the Moku client key
+        :param timeout: (connect, read) timeout of each request in seconds
+        :param progress: optional callback, called as progress(bytes_done, total_bytes, bytes_per_second)
+        """
+        self.url = url
+        self.local_path = local_path
+        self.part_path = f'{local_path}.part'
+        self.state_path = f'{local_path}.part.json'
+        self.chunk_size = int(chunk_size)
+        self.workers = workers
+        self.retries = retries
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.progress = progress
+
+        self.size = None
+        self.bytes_done = 0
+        self.bytes_downloaded = 0
+        self.chunks_retried = 0
+        self.elapsed = 0.0
+
+        self._start = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        # requests sessions are not thread safe, so give each worker thread its own keep-alive connection
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            self._local.session.headers.update(self.headers)
+        return self._local.session
+
+    def _probe(self):
+        # find the size and version of the file, and whether the server accepts ranged requests
+        with self._session().get(self.url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            if r.status_code == 206 and 'Content-Range' in r.headers:
+                size = int(r.headers['Content-Range'].rsplit('/', 1)[1])
+                ranged = True
+            else:
+                size = int(r.headers.get('Content-Length', -1))
+                ranged = False
+            version = r.headers.get('ETag') or r.headers.get('Last-Modified')
+        return size, version, ranged
+
+    def _load_state(self, size, version):
+        # resume only if the partial download is of the same version of the file, with the same chunks
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if (state is None or state['size'] != size or state['version'] != version
+                or state['chunk_size'] != self.chunk_size or not os.path.exists(self.part_path)):
+            state = {'url': self.url, 'size': size, 'version': version, 'chunk_size': self.chunk_size, 'done': {}}
+            with open(self.part_path, 'wb') as f:
+                f.truncate(size)
+            self._save_state(state)
+            return state
+
+        # check the chunks already on disk against their checksums, in case the partial file was modified
+        with open(self.part_path, 'rb') as f:
+            for idx, digest in list(state['done'].items()):
+                f.seek(int(idx) * self.chunk_size)
+                if hashlib.sha256(f.read(self._chunk_length(int(idx), size))).hexdigest() != digest:
+                    del state['done'][idx]
+        return state
+
+    def _save_state(self, state):
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _chunk_length(self, idx, size):
+        return min(self.chunk_size, size - idx * self.chunk_size)
+
+    def _fetch(self, idx):
+        start = idx * self.chunk_size
+        length = self._chunk_length(idx, self.size)
+        expected_range = f'bytes {start}-{start + length - 1}/{self.size}'
+
+        for attempt in range(self.retries + 1):
+            try:
+                r = self._session().get(self.url, headers={'Range': f'bytes={start}-{start + length - 1}'},
+                                        timeout=self.timeout)
+                r.raise_for_status()
+                # verify that the server returned exactly the requested range
+                if r.status_code != 206 or r.headers.get('Content-Range') != expected_range \
+                        or len(r.content) != length:
+                    raise IOError(f'Chunk {idx} did not match the requested range {expected_range}')
+                break
+            except (requests.RequestException, IOError):
+                if attempt == self.retries:
+                    raise
+                with self._lock:
+                    self.chunks_retried += 1
+                time.sleep(min(2 ** attempt, 10))
+
+        with open(self.part_path, 'r+b') as f:
+            f.seek(start)
+            f.write(r.content)
+        return idx, hashlib.sha256(r.content).hexdigest(), length
+
+    def _download_whole(self):
+        # fall back to a single request when the server does not accept ranged requests
+        with self._session().get(self.url, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            with open(self.part_path, 'wb') as f:
+                for data in r.iter_content(chunk_size=2 ** 16):
+                    f.write(data)
+                    self._add_progress(len(data))
+        self.size = self.bytes_done
+
+    def _add_progress(self, n_bytes):
+        with self._lock:
+            self.bytes_done += n_bytes
+            self.bytes_downloaded += n_bytes
+        if self.progress is not None:
+            self.progress(self.bytes_done, self.size, self.throughput())
+
+    def throughput(self):
+        """
+        :return: bytes downloaded per second by this run, excluding chunks resumed from disk
+        """
+        if self._start is None:
+            return 0
+        elapsed = self.elapsed or time.perf_counter() - self._start
+        return self.bytes_downloaded / elapsed if elapsed > 0 else 0
+
+    def run(self):
+        """
+        Download the file, resuming from any partial download
+        :return: path of the downloaded file
+        """
+        self._start = time.perf_counter()
+        self.size, version, ranged = self._probe()
+
+        if not ranged or self.size <= 0:
+            self._download_whole()
+        else:
+            state = self._load_state(self.size, version)
+            n_chunks = -(-self.size // self.chunk_size)
+            pending = [idx for idx in range(n_chunks) if str(idx) not in state['done']]
+            self.bytes_done = sum(self._chunk_length(int(idx), self.size) for idx in state['done'])
+
+            # record every chunk that completes, even after another has failed, so that a retry resumes from them
+            error = None
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self._fetch, idx) for idx in pending]
+                for future in as_completed(futures):
+                    try:
+                        idx, digest, length = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    state['done'][str(idx)] = digest
+                    self._save_state(state)
+                    self._add_progress(length)
+            if error is not None:
+                raise error
+
+        os.replace(self.part_path, self.local_path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        self.elapsed = time.perf_counter() - self._start
+        return self.local_path
+
+
+def download(instrument, target, file_name, local_path, **kwargs):
+    """
+    Download a file from a Moku in parallel, resumable chunks, like instrument.download
+    :param instrument: connected instrument
+    :param target: location of the file on the Moku, e.g. 'persist'
+    :param file_name: name of the file
+    :param local_path: local path to download the file to
+    :param kwargs: additional arguments for ChunkedDownload, e.g. workers or progress
+    :return: the finished ChunkedDownload, with its size and throughput
+    """
+    session = instrument.session
+    url = session.url_for(target, f'download/{file_name}')
+    downloader = ChunkedDownload(url, local_path, headers=dict(session.rs.headers), **kwargs)
+    downloader.run()
+    return downloader
@@ -10,6 +10,8 @@ import os
 import time
 
 from moku.instruments import Datalogger
+from chunked_download import download
+from li_reader import LogFile
 
 # Connect to your Moku by its ip address using Datalogger('192.168.###.###')
 # or by its serial number using Datalogger(serial=123)
@@ -42,9 +44,22 @@ try:
         if 'time_remaining' in progress:
             print(f"Remaining time {progress['time_remaining']} seconds")
 
-    # Download log from Moku, use liconverter to convert this .li file to .csv
-    i.download("persist", logFile['file_name'], os.path.join(os.getcwd(), logFile['file_name']))
-    print("Downloaded log file to local directory.")
+    # Download log from Moku in parallel chunks. If the download is
+    # interrupted, running it again resumes from the chunks already received
+    local_file = os.path.join(os.getcwd(), logFile['file_name'])
+    transfer = download(i, "persist", logFile['file_name'], local_file,
+                        workers=4)
+    print(f"Downloaded {transfer.size} bytes to local directory at "
+          f"{transfer.throughput() / 1e6:.1f} MB/s.")
+
+    # Decode the .li file directly rather than converting it to .csv, then
+    # export the first 5 seconds of it to HDF5. Only the records of those 5
+    # seconds are read from the file. Logs the decoder does not support are
+    # converted by mokucli to a temporary .npy file, which is deleted again
+    # when the log is closed
+    with LogFile(local_file, temporary=True) as log:
+        print(f"Read {len(log)} samples of {log.channels}")
+        log.export(os.path.splitext(local_file)[0] + '.h5', stop_time=5)
 
 except Exception as e:
     print(f'Exception occurred: {e}')
@@ -9,6 +9,8 @@
 import matplotlib.pyplot as plt
 
 from moku.instruments import Datalogger
+from decimate import minmax
+from stream_reader import StreamReader
 
 i = Datalogger('192.168.###.###', force_connect=False)
 
@@ -36,16 +38,27 @@ try:
     # Configure labels for axes
     ax = plt.gca()
 
-    # This loops continuously updates the plot with new data
-    while True:
-        # get the chunk of streamed data
-        data = i.get_stream_data()
+    # Read the stream on a background thread so that a slow plot update
+    # never backs up the stream
+    reader = StreamReader(i, capacity=2**20).start()
+
+    # This loops continuously updates the plot with all of the data
+    # received so far until the end of the stream
+    while reader.is_alive():
+        data = reader.latest()
         if data:
-            plt.xlim([data['time'][0], data['time'][-1]])
+            # reduce the samples to the minimum and maximum of 2000
+            # buckets, about one per pixel, so that every peak is drawn
+            time, ch1 = minmax(data['time'], data['ch1'], 2000)
+            plt.xlim([time[0], time[-1]])
             # Update the plot
-            line1.set_ydata(data['ch1'])
-            line1.set_xdata(data['time'])
-            plt.pause(0.001)
+            line1.set_data(time, ch1)
+        plt.pause(0.001)
+
+    if reader.error:
+        raise reader.error
+    print(f'Received {reader.samples_received} samples with '
+          f'{reader.time_gaps} gaps in the stream')
 
 except Exception as e:
     i.stop_streaming()
@@ -0,0 +1,159 @@
+#
+# moku example: Display decimation
+#
+# This module reduces long sample arrays to about as many points as the
+# plot has pixels, while keeping the peaks of the signal visible. Use it
+# between the data source and the plot, e.g. to show the whole of a long
+# stream rather than just its latest samples.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import numpy as np
+
+
+def _buckets(y, bucket_size):
+    # view the samples as rows of bucket_size, padding the last row with its final sample
+    n_buckets = -(-y.size // bucket_size)
+    padded = np.pad(y, (0, n_buckets * bucket_size - y.size), mode='edge')
+    return padded.reshape(n_buckets, bucket_size)
+
+
+def minmax_indices(y, n_buckets):
+    """
+    Find the indices of the minimum and maximum sample in each of n_buckets equal buckets, in time order
+    :param y: 1D samples
+    :param n_buckets: number of buckets
+    :return: sorted indices into y, two per bucket
+    """
+    y = np.asarray(y)
+    if y.size <= 2 * n_buckets:
+        return np.arange(y.size)
+
+    bucket_size = -(-y.size // n_buckets)
+    rows = _buckets(y, bucket_size)
+    offsets = np.arange(rows.shape[0]) * bucket_size
+    lo = np.argmin(rows, axis=1) + offsets
+    hi = np.argmax(rows, axis=1) + offsets
+
+    # keep the minimum and maximum of each bucket in the order that they occur
+    idx = np.stack((np.minimum(lo, hi), np.maximum(lo, hi)), axis=1).ravel()
+    return np.minimum(idx, y.size - 1)
+
+
+def minmax(x, y, n_buckets=2000):
+    """
+    Decimate a signal to the minimum and maximum of each bucket, so that every peak is kept. Use about as many
+    buckets as the plot is wide in pixels.
+    :param x: 1D x data, e.g. the time base
+    :param y: 1D samples
+    :param n_buckets: number of buckets
+    :return: tuple of the decimated x and y data, with up to 2 * n_buckets points
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    idx = minmax_indices(y, n_buckets)
+    return x[idx], y[idx]
+
+
+def lttb(x, y, n_out=2000, preselect=4):
+    """
+    Decimate a signal with the Largest-Triangle-Three-Buckets algorithm, which picks the point in each bucket that
+    forms the largest triangle with the point picked in the previous bucket and the mean of the next bucket. Long
+    signals are first reduced to preselect * n_out points with minmax, which keeps the result close to plain LTTB
+    at a fraction of the cost.
+    :param x: 1D x data, increasing
+    :param y: 1D samples
+    :param n_out: number of points to return, including the first and last points
+    :param preselect: multiple of n_out to reduce the signal to with minmax first, None to disable
+    :return: tuple of the decimated x and y data
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if n_out < 3 or y.size <= n_out:
+        return x, y
+    if preselect and y.size > preselect * n_out:
+        idx = minmax_indices(y[1:-1], preselect * n_out // 2) + 1
+        idx = np.concatenate(([0], idx, [y.size - 1]))
+        x, y = x[idx], y[idx]
+
+    # split the points between the first and last into n_out - 2 buckets
+    edges = np.linspace(1, y.size - 1, n_out - 1).astype(int)
+    sums_x = np.add.reduceat(x[:-1], edges[:-1])
+    sums_y = np.add.reduceat(y[:-1], edges[:-1])
+    counts = np.diff(edges)
+    mean_x = np.append(sums_x / counts, x[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, y.size - 1
+    a = 0
+    # each choice depends on the previous one, so only the search within each bucket is vectorised
+    for b in range(n_out - 2):
+        start, stop = edges[b], edges[b + 1]
+        area = np.abs((x[a] - mean_x[b + 1]) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (mean_y[b + 1] - y[a]))
+        a = start + np.argmax(area)
+        out[b + 1] = a
+    return x[out], y[out]
+
+
+class StreamDecimator:
+    """
+    Incremental min/max envelope of a stream. Samples are added as they arrive and each full bucket is reduced to
+    its minimum and maximum once, so the envelope of a long stream is always ready to plot.
+
+    Example:
+        envelope = StreamDecimator(bucket_size=1000, n_buckets=2000)
+        envelope.append(data['time'], data['ch1'])
+        line1.set_data(*envelope.envelope())
+    """
+    def __init__(self, bucket_size, n_buckets=2000):
+        """
+        :param bucket_size: number of samples in each bucket
+        :param n_buckets: number of buckets to keep, the oldest buckets are dropped beyond this
+        """
+        if bucket_size < 2:
+            raise ValueError('Each bucket must hold at least 2 samples')
+        self.bucket_size = int(bucket_size)
+        self.n_buckets = int(n_buckets)
+        self.env_x = np.zeros((self.n_buckets, 2))
+        self.env_y = np.zeros((self.n_buckets, 2))
+        self.buckets = 0
+        self._pending_x = np.zeros(0)
+        self._pending_y = np.zeros(0)
+
+    def append(self, x, y):
+        """
+        Add samples to the envelope
+        :param x: 1D x data, e.g. the time base
+        :param y: 1D samples
+        """
+        x = np.concatenate((self._pending_x, np.asarray(x, dtype=float)))
+        y = np.concatenate((self._pending_y, np.asarray(y, dtype=float)))
+
+        n_full = (y.size // self.bucket_size) * self.bucket_size
+        self._pending_x, self._pending_y = x[n_full:], y[n_full:]
+        # only the last n_buckets full buckets can be kept
+        first = max(0, n_full - self.n_buckets * self.bucket_size)
+        if n_full == first:
+            return
+
+        idx = minmax_indices(y[first:n_full], (n_full - first) // self.bucket_size) + first
+        new_x, new_y = x[idx].reshape(-1, 2), y[idx].reshape(-1, 2)
+        rows = (self.buckets + np.arange(len(new_x))) % self.n_buckets
+        self.env_x[rows] = new_x
+        self.env_y[rows] = new_y
+        self.buckets += len(new_x)
+
+    def envelope(self):
+        """
+        :return: tuple of the x and y data of the envelope in time order, followed by any samples that have not
+        filled a bucket yet
+        """
+        held = min(self.buckets, self.n_buckets)
+        rows = (self.buckets - held + np.arange(held)) % self.n_buckets
+        return (np.concatenate((self.env_x[rows].ravel(), self._pending_x)),
+                np.concatenate((self.env_y[rows].ravel(), self._pending_y)))
+
+    def clear(self):
+        self.buckets = 0
+        self._pending_x = np.zeros(0)
+        self._pending_y = np.zeros(0)
@@ -15,6 +15,7 @@ import matplotlib.pyplot as plt
 
 from moku import MokuException
 from moku.instruments import DigitalFilterBox
+from live_plot import LivePlot
 
 # Connect to your Moku by its ip address using
 # DigitalFilterBox('192.168.###.###')
@@ -74,18 +75,23 @@ try:
     plt.xlabel("Time [Second]")
     plt.ylabel("Amplitude [Volt]")
 
-    # This loops continuously updates the plot with new data
-    while True:
+    # Only redraw the lines on each frame, rather than the whole figure,
+    # and only update the time axis when the timebase changes
+    plot = LivePlot(plt.gcf(), max_fps=30)
+    plot.add(line1)
+    plot.add(line2)
+    plot.autoscale(ax, axis='x')
+
+    # This loops continuously updates the plot with new data until the
+    # plot is closed
+    while plot.is_open():
         # Get new data
         data = i.get_data()
         if data:
-            plt.xlim([data['time'][0], data['time'][-1]])
             # Update the plot
-            line1.set_ydata(data['ch1'])
-            line2.set_ydata(data['ch2'])
-            line1.set_xdata(data['time'])
-            line2.set_xdata(data['time'])
-            plt.pause(0.001)
+            plot.set_data(line1, data['time'], data['ch1'])
+            plot.set_data(line2, data['time'], data['ch2'])
+            plot.render()
 except MokuException as e:
     print("Couldn't configure Moku. Please check your IP address and that you've updated the script parameters (such as sampling rate) to match your device.")
     raise e
@@ -0,0 +1,249 @@
+#
+# moku example: Segmented Frequency Response Analyzer sweeps
+#
+# This module splits a long Frequency Response Analyzer sweep into bands,
+# each with its own averaging and settling settings, and sweeps the bands
+# at the same time on several Frequency Response Analyzers, e.g. the slots
+# of a Multi-instrument Mode configuration or several Moku devices. The
+# bands are then stitched into one transfer function, checking that
+# neighbouring bands agree on the points where they overlap.
+#
+# The low frequency points of a sweep take the longest, as each point is
+# averaged and settled for a number of cycles, so the bands are planned to
+# take about the same time rather than to span the same range.
+#
+# Each Frequency Response Analyzer must measure the same device, either
+# through a copy of it or, for a linear device, by summing the outputs.
+# The slots of a Multi-instrument Mode configuration share the HTTP session
+# of their Moku, so each band is swept from its own thread through its own
+# copy of the session.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import threading
+import time
+
+import numpy as np
+
+from fra_sweep import SweepTracker
+from thread_sessions import ThreadSessions
+
+# the settings of set_sweep other than the frequency range
+SWEEP_SETTINGS = ('averaging_time', 'settling_time', 'averaging_cycles', 'settling_cycles')
+
+
+def sweep_points(start_frequency, stop_frequency, num_points, log_scale=True):
+    """
+    :return: frequencies of the points of a sweep, in the order that they are swept
+    """
+    if log_scale:
+        return np.geomspace(start_frequency, stop_frequency, num_points)
+    return np.linspace(start_frequency, stop_frequency, num_points)
+
+
+def point_durations(frequency, averaging_time, settling_time, averaging_cycles=1, settling_cycles=1):
+    """
+    Estimate the time taken by each point of a sweep, which is averaged and settled for the longer of the time and
+    the number of cycles
+    :param frequency: frequencies of the points
+    :return: estimated duration of each point in seconds
+    """
+    frequency = np.asarray(frequency, dtype=float)
+    return (np.maximum(averaging_time, averaging_cycles / frequency)
+            + np.maximum(settling_time, settling_cycles / frequency))
+
+
+def plan_bands(start_frequency, stop_frequency, num_points, n_bands, settings, overlap=2, log_scale=True):
+    """
+    Split a sweep into bands that take about the same time to sweep. The points of the bands are the points of the
+    whole sweep, and neighbouring bands share overlap points to check that they agree.
+    :param start_frequency: start frequency of the whole sweep
+    :param stop_frequency: stop frequency of the whole sweep
+    :param num_points: number of points of the whole sweep
+    :param n_bands: number of bands
+    :param settings: dict of the sweep settings of every band, see SWEEP_SETTINGS, or a function of the start and
+    stop frequency of a band that returns its settings, e.g. to average more cycles at low frequencies
+    :param overlap: number of points that neighbouring bands share
+    :param log_scale: whether the points are spaced logarithmically
+    :return: list of dicts of the set_sweep arguments of each band, with the 'points' of the whole sweep it covers
+    """
+    frequency = sweep_points(start_frequency, stop_frequency, num_points, log_scale)
+    settings_for = settings if callable(settings) else (lambda start, stop: settings)
+    n_bands = max(1, min(n_bands, num_points // (overlap + 2)))
+
+    # split at equal estimated durations of the whole sweep, refining once with the settings of each band
+    edges = np.linspace(0, num_points, n_bands + 1).astype(int)
+    for _ in range(2):
+        durations = np.concatenate([point_durations(frequency[a:b], **settings_for(frequency[a], frequency[b - 1]))
+                                    for a, b in zip(edges[:-1], edges[1:])])
+        elapsed = np.cumsum(durations)
+        splits = np.searchsorted(elapsed, elapsed[-1] * np.arange(1, n_bands) / n_bands) + 1
+        edges = np.concatenate(([0], np.clip(splits, 1, num_points - 1), [num_points]))
+        edges = np.maximum.accumulate(edges)
+
+    bands = []
+    for a, b in zip(edges[:-1], edges[1:]):
+        if b <= a:
+            continue
+        # extend each band into its neighbours, so that both measure the points of the overlap
+        a, b = max(0, a - overlap // 2), min(num_points, b + overlap - overlap // 2)
+        band = dict(start_frequency=float(frequency[a]), stop_frequency=float(frequency[b - 1]),
+                    num_points=int(b - a), points=(int(a), int(b)))
+        band.update(settings_for(frequency[a], frequency[b - 1]))
+        band['duration'] = float(point_durations(frequency[a:b], **{k: band[k] for k in SWEEP_SETTINGS}).sum())
+        bands.append(band)
+    return bands
+
+
+def assign_bands(bands, n_instruments):
+    """
+    Share the bands between instruments so that they all finish at about the same time, giving the longest band
+    still to assign to the instrument with the least to do
+    :return: list of the bands of each instrument
+    """
+    queues = [[] for _ in range(n_instruments)]
+    load = np.zeros(n_instruments)
+    for band in sorted(bands, key=lambda band: -band['duration']):
+        idx = int(np.argmin(load))
+        queues[idx].append(band)
+        load[idx] += band['duration']
+    return queues
+
+
+def sweep_band(instrument, band, channels=('ch1', 'ch2'), poll_interval=0.5, timeout=None):
+    """
+    Sweep one band on an instrument, following the sweep until every point has been measured
+    :param instrument: FrequencyResponseAnalyzer, with its outputs already configured
+    :param band: band from plan_bands
+    :param channels: channels to measure
+    :param poll_interval: time in seconds between frames
+    :param timeout: maximum time in seconds for the band, defaults to 3 times its estimated duration plus a minute
+    :return: the SweepTracker of the band
+    """
+    instrument.set_sweep(start_frequency=band['start_frequency'], stop_frequency=band['stop_frequency'],
+                         num_points=band['num_points'], **{k: band[k] for k in SWEEP_SETTINGS})
+    instrument.start_sweep(single=True)
+
+    tracker = SweepTracker(channels)
+    timeout = 3 * band['duration'] + 60 if timeout is None else timeout
+    start = time.perf_counter()
+    while True:
+        tracker.update(instrument.get_data())
+        if tracker.complete:
+            return tracker
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"Band {band['start_frequency']:g} to {band['stop_frequency']:g} Hz did not complete")
+        time.sleep(poll_interval)
+
+
+def stitch(bands, trackers, channels=('ch1', 'ch2'), magnitude_tolerance=0.5, phase_tolerance=0.01):
+    """
+    Combine the bands into one transfer function, in the order of the whole sweep, checking the points that
+    neighbouring bands share
+    :param bands: bands from plan_bands
+    :param trackers: SweepTracker of each band, in the same order
+    :param magnitude_tolerance: largest difference in dB between bands that is consistent
+    :param phase_tolerance: largest difference in cycles between bands that is consistent
+    :return: dict of the 'frequency', a dict of 'magnitude' and 'phase' for each channel, and the 'checks' of each
+    overlap
+    """
+    order = np.argsort([band['points'][0] for band in bands])
+    bands = [bands[idx] for idx in order]
+    trackers = [trackers[idx] for idx in order]
+    num_points = max(band['points'][1] for band in bands)
+
+    frequency = np.full(num_points, np.nan)
+    result = {ch: {'magnitude': np.full(num_points, np.nan), 'phase': np.full(num_points, np.nan)} for ch in channels}
+    checks = []
+    for idx, (band, tracker) in enumerate(zip(bands, trackers)):
+        a, b = band['points']
+        if idx > 0:
+            # compare the points that this band shares with the previous band
+            shared = np.arange(a, min(b, bands[idx - 1]['points'][1]))
+            if shared.size:
+                check = {'frequency': (frequency[shared[0]], frequency[shared[-1]]), 'points': shared.size}
+                for ch in channels:
+                    mag = tracker.magnitude[ch][shared - a] - result[ch]['magnitude'][shared]
+                    # compare the phase modulo one cycle, as the bands may be unwrapped differently
+                    phase = (tracker.phase[ch][shared - a] - result[ch]['phase'][shared] + 0.5) % 1 - 0.5
+                    check[ch] = {'magnitude_error': float(np.nanmax(np.abs(mag))),
+                                 'phase_error': float(np.nanmax(np.abs(phase)))}
+                check['consistent'] = all(check[ch]['magnitude_error'] <= magnitude_tolerance
+                                          and check[ch]['phase_error'] <= phase_tolerance for ch in channels)
+                checks.append(check)
+            # keep the points of the previous band where they overlap, and take the rest from this band
+            a_new = a + shared.size
+        else:
+            a_new = a
+
+        frequency[a_new:b] = tracker.frequency[a_new - a:]
+        for ch in channels:
+            result[ch]['magnitude'][a_new:b] = tracker.magnitude[ch][a_new - a:]
+            result[ch]['phase'][a_new:b] = tracker.phase[ch][a_new - a:]
+
+    for ch in channels:
+        # unwrap along the whole sweep, across the joins between bands
+        result[ch]['phase'] = np.unwrap(result[ch]['phase'], period=1)
+    result['frequency'] = frequency
+    result['checks'] = checks
+    return result
+
+
+class BandedSweep:
+    """
+    Sweeps bands on several Frequency Response Analyzers at once and stitches them together.
+
+    Example:
+        bands = plan_bands(20e6, 100, 512, n_bands=4, settings=dict(averaging_time=1e-3, settling_time=1e-3,
+                                                                    averaging_cycles=5, settling_cycles=5))
+        result = BandedSweep([fra1, fra2], bands).run()
+    """
+    def __init__(self, instruments, bands, channels=('ch1', 'ch2'), poll_interval=0.5, progress=None):
+        """
+        :param instruments: list of FrequencyResponseAnalyzer, with their outputs already configured
+        :param bands: bands from plan_bands
+        :param channels: channels to measure
+        :param poll_interval: time in seconds between frames of each instrument
+        :param progress: optional callback, called as progress(band, tracker) as each band completes
+        """
+        self.instruments = instruments
+        self.bands = bands
+        self.channels = channels
+        self.poll_interval = poll_interval
+        self.progress = progress
+        self.trackers = [None] * len(bands)
+        self.errors = []
+        self.elapsed = None
+        self._sessions = ThreadSessions()
+
+    def _run_queue(self, instrument, queue):
+        instrument = self._sessions.instrument(instrument)
+        for band in queue:
+            try:
+                tracker = sweep_band(instrument, band, self.channels, self.poll_interval)
+            except Exception as e:
+                self.errors.append((band, e))
+                continue
+            self.trackers[next(idx for idx, b in enumerate(self.bands) if b is band)] = tracker
+            if self.progress is not None:
+                self.progress(band, tracker)
+
+    def run(self, **kwargs):
+        """
+        Sweep every band, then stitch them together
+        :param kwargs: tolerances of the overlap checks, see stitch
+        :return: the stitched transfer function, see stitch
+        """
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._run_queue, args=(instrument, queue), name='BandedSweep', daemon=True)
+                   for instrument, queue in zip(self.instruments, assign_bands(self.bands, len(self.instruments)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+
+        if self.errors:
+            band, error = self.errors[0]
+            raise RuntimeError(f"Band {band['start_frequency']:g} to {band['stop_frequency']:g} Hz failed") from error
+        return stitch(self.bands, self.trackers, self.channels, **kwargs)
@@ -0,0 +1,214 @@
+#
+# moku example: Incremental Frequency Response Analyzer sweeps
+#
+# This module follows a Frequency Response Analyzer sweep as it progresses.
+# Each frame is compared with the points measured so far, and only the new
+# points are written into preallocated magnitude and phase arrays. The
+# completed points can be checkpointed to disk, so that a long sweep to low
+# frequencies that is interrupted, e.g. by a dropped connection, resumes
+# from the points already measured instead of starting again. A checkpoint
+# of a sweep that had finished is kept as the last sweep, and the next
+# sweep is measured from the start.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import json
+import os
+import time
+
+import numpy as np
+
+
+class SweepTracker:
+    """
+    Tracks the points of a Frequency Response Analyzer sweep, one channel or more. The points of the last complete
+    sweep, including one resumed from a checkpoint, are kept in last_sweep as a dict of 'frequency' and of the
+    'magnitude' and 'phase' of each channel.
+
+    Example:
+        tracker = SweepTracker(checkpoint='sweep.npz', settings=dict(start_frequency=20e6, stop_frequency=100,
+                                                                     num_points=512))
+        start, stop, num_points = tracker.remaining_sweep(20e6, 100, 512)
+        i.set_sweep(start_frequency=start, stop_frequency=stop, num_points=num_points)
+        i.start_sweep(single=True)
+        while not tracker.complete:
+            tracker.update(i.get_data())
+    """
+    def __init__(self, channels=('ch1', 'ch2'), checkpoint=None, settings=None, checkpoint_interval=5.0):
+        """
+        :param channels: channels of the frames to track
+        :param checkpoint: optional .npz file to save the completed points to, and to resume them from
+        :param settings: dict of the sweep settings, a checkpoint is only resumed if they match
+        :param checkpoint_interval: minimum time in seconds between checkpoints, the last points of a sweep are
+        always saved
+        """
+        self.channels = list(channels)
+        self.checkpoint = checkpoint
+        self.settings = json.dumps(settings or {}, sort_keys=True)
+        self.checkpoint_interval = checkpoint_interval
+
+        self.frequency = None
+        self.magnitude = {}
+        self.phase = {}
+        self.done = {}
+        self.sweeps = 0
+        self.last_sweep = None
+        self.points_received = 0
+        self._index = None
+        self._index_key = None
+        self._measured = {}
+        self._last_checkpoint = -np.inf
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            self._load()
+
+    def _allocate(self, frequency):
+        self.frequency = np.array(frequency, dtype=float)
+        for ch in self.channels:
+            self.magnitude[ch] = np.full(self.frequency.size, np.nan)
+            self.phase[ch] = np.full(self.frequency.size, np.nan)
+            self.done[ch] = np.zeros(self.frequency.size, dtype=bool)
+
+    def _indices(self, frequency):
+        # map the points of a frame to the points of the whole sweep, which differ when a sweep has been resumed
+        # over part of the range. The mapping is reused for as long as the frames have the same points.
+        key = (len(frequency), frequency[0], frequency[-1])
+        if key != self._index_key:
+            frequency = np.asarray(frequency, dtype=float)
+            if frequency.size == self.frequency.size and np.allclose(frequency, self.frequency):
+                self._index = slice(None)
+            else:
+                # nearest point of the sweep on a log scale, for either direction of the sweep
+                order = np.argsort(self.frequency)
+                log_f = np.log(self.frequency[order])
+                pos = np.clip(np.searchsorted(log_f, np.log(frequency)), 1, log_f.size - 1)
+                nearer = np.where(np.log(frequency) - log_f[pos - 1] < log_f[pos] - np.log(frequency), pos - 1, pos)
+                self._index = order[nearer]
+            self._index_key = key
+        return self._index
+
+    def update(self, frame):
+        """
+        Add the points of a frame that are new since the last frame
+        :param frame: frame from get_data, with a dict of 'frequency', 'magnitude' and 'phase' for each channel
+        :return: dict of channel to the indices of the points that were updated
+        """
+        if self.frequency is None:
+            self._allocate(frame[self.channels[0]]['frequency'])
+
+        was_complete = self.complete
+        updated = {}
+        for ch in self.channels:
+            data = frame[ch]
+            idx = self._indices(data['frequency'])
+            # points that have not been measured yet are missing from the frame
+            magnitude = np.asarray(data['magnitude'], dtype=float)
+            phase = np.asarray(data['phase'], dtype=float)
+            measured = np.isfinite(magnitude) & np.isfinite(phase)
+
+            n_measured = np.count_nonzero(measured)
+            if n_measured < self._measured.get(ch, 0):
+                # fewer points than the last frame, so the sweep has started again. The points of the last sweep
+                # are kept until they are measured again.
+                self.done[ch].fill(False)
+            self._measured[ch] = n_measured
+
+            new = measured & (~self.done[ch][idx] | (magnitude != self.magnitude[ch][idx])
+                              | (phase != self.phase[ch][idx]))
+            points = np.arange(self.frequency.size)[idx][new]
+            self.magnitude[ch][points] = magnitude[new]
+            self.phase[ch][points] = phase[new]
+            self.done[ch][points] = True
+            updated[ch] = points
+            self.points_received += points.size
+
+        if any(points.size for points in updated.values()):
+            if self.complete and not was_complete:
+                self._finish()
+                self.save()
+            elif time.perf_counter() - self._last_checkpoint >= self.checkpoint_interval:
+                self.save()
+        return updated
+
+    def _finish(self):
+        self.sweeps += 1
+        self.last_sweep = {'frequency': self.frequency.copy()}
+        for ch in self.channels:
+            self.last_sweep[ch] = {'magnitude': self.magnitude[ch].copy(), 'phase': self.phase[ch].copy()}
+
+    @property
+    def complete(self):
+        """
+        :return: whether every point of every channel has been measured
+        """
+        return self.frequency is not None and all(done.all() for done in self.done.values())
+
+    def unwrapped_phase(self, channel):
+        """
+        Unwrap the phase of the measured points of a channel along the sweep, removing the jumps of a whole cycle
+        :param channel: channel name, e.g. 'ch1'
+        :return: phase in cycles, NaN for the points not measured yet
+        """
+        phase = np.full(self.frequency.size, np.nan)
+        done = self.done[channel]
+        phase[done] = np.unwrap(self.phase[channel][done], period=1)
+        return phase
+
+    def remaining_sweep(self, start_frequency, stop_frequency, num_points):
+        """
+        Find the part of a sweep that is still to be measured, from the first point that is missing
+        :param start_frequency: start frequency of the whole sweep
+        :param stop_frequency: stop frequency of the whole sweep
+        :param num_points: number of points of the whole sweep
+        :return: tuple of the start frequency, stop frequency and number of points to sweep
+        """
+        if self.frequency is None or self.complete:
+            return start_frequency, stop_frequency, num_points
+        done = np.logical_and.reduce([self.done[ch] for ch in self.channels])
+        first = int(np.argmin(done))
+        return float(self.frequency[first]), stop_frequency, self.frequency.size - first
+
+    def reset(self):
+        """
+        Forget the measured points, e.g. before starting a new sweep, and remove the checkpoint
+        """
+        for ch in self.channels:
+            self.magnitude[ch].fill(np.nan)
+            self.phase[ch].fill(np.nan)
+            self.done[ch].fill(False)
+        self._measured = {}
+        if self.checkpoint is not None and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def save(self):
+        """
+        Write the measured points to the checkpoint file
+        """
+        self._last_checkpoint = time.perf_counter()
+        if self.checkpoint is None or self.frequency is None:
+            return
+        arrays = {'frequency': self.frequency}
+        for ch in self.channels:
+            arrays.update({f'{ch}_magnitude': self.magnitude[ch], f'{ch}_phase': self.phase[ch],
+                           f'{ch}_done': self.done[ch]})
+        # write to a temporary file first so that an interruption never leaves a partial checkpoint
+        tmp_path = f'{self.checkpoint}.tmp.npz'
+        np.savez(tmp_path, settings=self.settings, channels=self.channels, **arrays)
+        os.replace(tmp_path, self.checkpoint)
+
+    def _load(self):
+        with np.load(self.checkpoint) as f:
+            if str(f['settings']) != self.settings or list(f['channels']) != self.channels:
+                return
+            self._allocate(f['frequency'])
+            for ch in self.channels:
+                self.magnitude[ch][:] = f[f'{ch}_magnitude']
+                self.phase[ch][:] = f[f'{ch}_phase']
+                self.done[ch][:] = f[f'{ch}_done']
+
+        if self.complete:
+            # the sweep had finished, so keep it as the last sweep and measure the next one from the start. Its points
+            # are kept until they are measured again, as when a sweep starts again in update.
+            self._finish()
+            for ch in self.channels:
+                self.done[ch].fill(False)
@@ -9,6 +9,8 @@
 #
 import matplotlib.pyplot as plt
 from moku.instruments import FrequencyResponseAnalyzer
+from live_plot import LivePlot
+from fra_sweep import SweepTracker
 
 # Connect to your Moku by its ip address using FrequencyResponseAnalyzer('192.168.###.###')
 # or by its serial number using FrequencyResponseAnalyzer(serial=123)
@@ -31,11 +33,25 @@ try:
     i.set_output(1, amp_ch1)
     i.set_output(2, amp_ch2)
 
-    # Set the sweep configuration
-    i.set_sweep(start_frequency=f_start, stop_frequency=f_end,
-                num_points=sweep_length, averaging_time=averaging_time,
-                settling_time=settling_time, averaging_cycles=averaging_cycles,
-                settling_cycles=settling_cycles)
+    # Track the points of the sweep as they are measured, saving them to a
+    # checkpoint so that an interrupted sweep resumes from where it stopped
+    sweep = dict(averaging_time=averaging_time, settling_time=settling_time,
+                 averaging_cycles=averaging_cycles, settling_cycles=settling_cycles)
+    tracker = SweepTracker(checkpoint='fra_sweep.npz',
+                           settings=dict(sweep, amplitudes=[amp_ch1, amp_ch2], start_frequency=f_start,
+                                         stop_frequency=f_end, num_points=sweep_length))
+
+    # A checkpoint of a sweep that had finished is not measured again. Its
+    # points are shown until the next sweep measures them again
+    if tracker.last_sweep is not None:
+        print(f'Loaded a complete sweep of {tracker.last_sweep["frequency"].size} points '
+              f'from the checkpoint, starting the next sweep')
+
+    # Set the sweep configuration, only sweeping the points that are missing
+    # from the checkpoint, if any
+    start, stop, num_points = tracker.remaining_sweep(f_start, f_end, sweep_length)
+    resumed = num_points < sweep_length
+    i.set_sweep(start_frequency=start, stop_frequency=stop, num_points=num_points, **sweep)
 
     # Start the output sweep in loop mode
     i.start_sweep()
@@ -69,43 +85,37 @@ try:
     plt.show()
     plt.grid(visible=True)
 
-    # Retrieves and plot new data
-    while True:
+    # Only redraw the lines on each frame, rather than the whole figure.
+    # The frequency axes are a tight fit and the magnitude and phase axes
+    # are only rescaled when the data moves outside of them
+    plot = LivePlot(plt.gcf(), max_fps=30)
+    for line in (line1, line2, line3, line4):
+        plot.add(line)
+    plot.autoscale(ax_1)
+    plot.autoscale(ax_2)
+
+    # Retrieves and plot new data until the plot is closed
+    while plot.is_open():
         frame = i.get_data()
-        ch1Data = frame['ch1']
-        ch2Data = frame['ch2']
-
-        # Set the frame data for each channel plot
-        plt.subplot(211)
-
-        ch1MagnitudeData = ch1Data['magnitude']
-        ch2MagnitudeData = ch2Data['magnitude']
-        line1.set_ydata(ch1MagnitudeData)
-        line2.set_ydata(ch2MagnitudeData)
-        line1.set_xdata(ch1Data['frequency'])
-        line2.set_xdata(ch2Data['frequency'])
-
-        # Phase
-        plt.subplot(212)
-        ch1PhaseData = ch1Data['phase']
-        ch2PhaseData = ch2Data['phase']
-        line3.set_ydata(ch1PhaseData)
-        line4.set_ydata(ch2PhaseData)
-        line3.set_xdata(ch1Data['frequency'])
-        line4.set_xdata(ch2Data['frequency'])
-
-        # Ensure the frequency axis is a tight fit
-        ax_1.set_xlim(min(ch1Data['frequency']), max(ch2Data['frequency']))
-        ax_2.set_xlim(min(ch1Data['frequency']), max(ch2Data['frequency']))
-        ax_1.relim()
-        ax_1.autoscale_view()
-        ax_2.relim()
-        ax_2.autoscale_view()
-
-        # Redraw the lines
-        plt.draw()
-
-        plt.pause(0.001)
+
+        tracker.update(frame)
+
+        if resumed and tracker.complete:
+            # The rest of the interrupted sweep has been measured, so go back
+            # to sweeping the whole range
+            i.set_sweep(start_frequency=f_start, stop_frequency=f_end, num_points=sweep_length, **sweep)
+            i.start_sweep()
+            resumed = False
+
+        # Set the data of each channel plot from the points measured so far
+        plot.set_data(line1, tracker.frequency, tracker.magnitude['ch1'])
+        plot.set_data(line2, tracker.frequency, tracker.magnitude['ch2'])
+
+        # Phase, unwrapped along the sweep
+        plot.set_data(line3, tracker.frequency, tracker.unwrapped_phase('ch1'))
+        plot.set_data(line4, tracker.frequency, tracker.unwrapped_phase('ch2'))
+
+        plot.render()
 
 except Exception as e:
     print(f'Exception occurred: {e}')
@@ -0,0 +1,130 @@
+#
+# moku example: Declarative instrument configuration
+#
+# This module describes the settings of an instrument as a recipe, and
+# applies it by sending only the settings that differ from the ones last
+# applied. Re-applying a recipe after changing one value costs a single
+# request rather than a full re-configuration. Where the API has a batch
+# call, such as CloudCompile.set_controls, the changed settings are sent
+# together.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import json
+import os
+
+
+def _coalesce_controls(settings):
+    # CloudCompile can set any number of controls in one request
+    return 'set_controls', {'controls': [dict(idx=idx, value=kwargs['value']) for idx, kwargs in settings.items()]}
+
+
+# methods whose per-channel calls can be combined into one request, if the instrument has the batch method
+COALESCE = {
+    'set_control': _coalesce_controls,
+}
+
+
+class InstrumentConfig:
+    """
+    Applies recipes of instrument settings, sending only what has changed since the last apply.
+
+    A recipe is a dict of method name to its keyword arguments. Methods that are called once per channel take a dict
+    of channel to keyword arguments instead. Methods are called in the order of the recipe.
+
+    Example:
+        config = InstrumentConfig(i)
+        recipe = {
+            'set_frontend': {ch: dict(coupling='DC', impedance='1MOhm', range='400mVpp') for ch in range(1, 5)},
+            'set_acquisition_speed': dict(speed='596Hz'),
+        }
+        config.apply(recipe)
+        recipe['set_frontend'][2]['range'] = '4Vpp'
+        config.apply(recipe)  # sends set_frontend(2, ...) only
+    """
+    def __init__(self, instrument, state_file=None):
+        """
+        :param instrument: connected instrument
+        :param state_file: optional JSON file to keep the applied settings in, so that they carry over between runs
+        of a script. Only use it while nothing else changes the settings of the instrument.
+        """
+        self.instrument = instrument
+        self.state_file = state_file
+        self.applied = {}
+        self.requests = 0
+
+        if state_file is not None and os.path.exists(state_file):
+            with open(state_file) as f:
+                self.applied = {method: {int(ch) if ch.isdigit() else None: kwargs for ch, kwargs in calls.items()}
+                                for method, calls in json.load(f).items()}
+
+    def diff(self, recipe):
+        """
+        Find the settings of a recipe that differ from the ones last applied
+        :param recipe: dict of method name to keyword arguments, or to a dict of channel to keyword arguments
+        :return: dict of method name to a dict of channel, or None for methods without a channel, to keyword arguments
+        """
+        changes = {}
+        for method, settings in recipe.items():
+            # each call sends all of its arguments, as any that are left out are reset to their defaults
+            calls = settings if _per_channel(settings) else {None: settings}
+            applied = self.applied.get(method, {})
+            changed = {ch: dict(kwargs) for ch, kwargs in calls.items() if applied.get(ch) != kwargs}
+            if changed:
+                changes[method] = changed
+        return changes
+
+    def apply(self, recipe, force=False):
+        """
+        Send the settings of a recipe that differ from the ones last applied
+        :param recipe: dict of method name to keyword arguments, or to a dict of channel to keyword arguments
+        :param force: send every setting of the recipe, e.g. after the instrument has been reset
+        :return: dict of the settings that were sent, see diff
+        """
+        if force:
+            self.invalidate()
+        changes = self.diff(recipe)
+        for method, calls in changes.items():
+            batch = COALESCE.get(method)
+            batch = batch(calls) if batch is not None and len(calls) > 1 else None
+            if batch is not None and hasattr(self.instrument, batch[0]):
+                getattr(self.instrument, batch[0])(**batch[1])
+                self._applied(method, calls)
+                continue
+            for ch, kwargs in calls.items():
+                if ch is None:
+                    getattr(self.instrument, method)(**kwargs)
+                else:
+                    getattr(self.instrument, method)(ch, **kwargs)
+                self._applied(method, {ch: kwargs})
+        return changes
+
+    def _applied(self, method, calls):
+        # only record settings once they have been sent, so that a failed call is sent again by the next apply
+        self.requests += 1
+        self.applied.setdefault(method, {}).update(calls)
+        self._save()
+
+    def invalidate(self, method=None):
+        """
+        Forget the applied settings, so that they are sent again by the next apply
+        :param method: only forget the settings of this method
+        """
+        if method is None:
+            self.applied = {}
+        else:
+            self.applied.pop(method, None)
+        self._save()
+
+    def _save(self):
+        if self.state_file is None:
+            return
+        tmp_path = f'{self.state_file}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({method: {'' if ch is None else str(ch): kwargs for ch, kwargs in calls.items()}
+                       for method, calls in self.applied.items()}, f)
+        os.replace(tmp_path, self.state_file)
+
+
+def _per_channel(settings):
+    return bool(settings) and all(isinstance(ch, int) for ch in settings)
@@ -0,0 +1,487 @@
+#
+# moku example: Reading Datalogger .li files
+#
+# This module decodes the .li log files downloaded from the Datalogger into
+# typed NumPy arrays, so that multi-GB logs can be sliced by time or
+# exported to HDF5 or Parquet a chunk at a time.
+#
+# A .li file is a header describing the binary records of each channel,
+# followed by chunks of those records. Opening a log only reads the header
+# and the chunk headers. The file is memory-mapped, and the records of a
+# time range are decoded from the chunks that hold them, so the rest of the
+# log is never read from disk. Logs the decoder does not support, e.g. the
+# version 2 files of older Moku:Lab firmware, are converted to .npy with
+# mokucli instead, which converts the whole log before any of it can be
+# read.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+from shutil import which
+
+import numpy as np
+
+from stream_writer import StreamWriter
+
+# a field of the record format, e.g. 's32' or 'u8,0xAA' for a field that always holds a literal value
+_FIELD = re.compile(r'([usfbrp])([0-9]+),*([0-9a-zA-Z]+)*')
+# an operation of the processing applied to a field, e.g. '*C' to multiply by the calibration coefficient
+_OPERATION = re.compile(r'([*/+\-&s^fc])(-?[0-9.xA-F]+(e-?[0-9]+)?)?')
+
+
+def _parse_fields(record_format):
+    # list of (type, bit offset, bit length, literal) for each field of a record
+    if record_format.startswith('>'):
+        raise NotImplementedError("Can't decode big-endian records")
+    fields = []
+    offset = 0
+    for clause in record_format.split(':'):
+        match = _FIELD.search(clause)
+        if match is None:
+            raise ValueError(f"Can't parse the record field '{clause}'")
+        kind, bits, literal = match.group(1), int(match.group(2)), match.group(3)
+        if kind == 'r' or (kind == 'f' and bits not in (32, 64)):
+            raise NotImplementedError(f"Can't decode the record field '{clause}'")
+        fields.append((kind, offset, bits, int(literal, 0) if literal else None))
+        offset += bits
+    return fields, offset
+
+
+def _parse_processing(processing, calibration):
+    # list of (operation, value) for each field other than the padding, in the order they are applied
+    def value(literal):
+        if not literal:
+            return None
+        if literal == 'C':
+            if calibration is None:
+                raise NotImplementedError("The log has no calibration coefficient to apply")
+            return calibration
+        try:
+            return int(literal, 0)
+        except ValueError:
+            return float(literal)
+
+    return [[(op, value(literal)) for op, literal, _ in _OPERATION.findall(clause)]
+            for clause in processing.split(':')]
+
+
+def _decode_field(records, kind, offset, bits):
+    # values of a field of each record, from an array with a row of bytes per record
+    if offset % 8 == 0 and bits in (8, 16, 32, 64) and kind in 'usf':
+        # byte aligned fields are a plain view of their bytes
+        dtype = np.dtype(f"<{'i' if kind == 's' else kind}{bits // 8}")
+        return np.ascontiguousarray(records[:, offset // 8:(offset + bits) // 8]).view(dtype)[:, 0]
+
+    first, shift = divmod(offset, 8)
+    n_bytes = (shift + bits + 7) // 8
+    if n_bytes > 8:
+        raise NotImplementedError(f"Can't decode a {bits} bit field that spans {n_bytes} bytes")
+    word = np.zeros(len(records), dtype=np.uint64)
+    for idx in range(n_bytes):
+        word |= records[:, first + idx].astype(np.uint64) << np.uint64(8 * idx)
+    word >>= np.uint64(shift)
+    if bits < 64:
+        word &= np.uint64((1 << bits) - 1)
+
+    if kind == 'b':
+        return word.astype(bool)
+    if kind == 's':
+        sign = (word >> np.uint64(bits - 1)) & np.uint64(1)
+        return word.astype(np.int64) - (sign.astype(np.int64) << np.int64(bits))
+    if kind == 'f':
+        return word.astype(np.uint32).view(np.float32) if bits == 32 else word.view(np.float64)
+    return word
+
+
+def _process(values, operations):
+    for op, value in operations:
+        if op == '*':
+            values = values * value
+        elif op == '/':
+            values = values / value
+        elif op == '+':
+            values = values + value
+        elif op == '-':
+            values = values - value
+        elif op == '&':
+            values = np.bitwise_and(values.astype(np.int64), int(value))
+        elif op == 's':
+            values = np.sqrt(values)
+        elif op == 'f':
+            values = np.floor(values).astype(np.int64)
+        elif op == 'c':
+            values = np.ceil(values).astype(np.int64)
+        elif op == '^':
+            values = values ** value
+    return values
+
+
+class LIFile:
+    """
+    Incremental decoder of a version 1 or 3 .li file. Only the headers are read when it is opened, the records are
+    decoded from the memory-mapped file when they are read.
+
+    Example:
+        li = LIFile('MokuDataLoggerData.li')
+        start, stop = li.index_range(1.0, 2.0)
+        data = li.read(start, stop)
+    """
+    def __init__(self, file_name):
+        """
+        :param file_name: path of the .li file
+        :raises NotImplementedError: if the file is in a version or record format this decoder does not support
+        """
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            magic = f.read(3)
+            if magic[:2] != b'LI':
+                raise ValueError(f'{file_name} is not a .li file')
+            self.version = magic[2:].decode('ascii', 'replace')
+            if self.version == '1':
+                self._read_header_v1(f)
+            elif self.version == '3':
+                self._read_header_v3(f)
+            else:
+                raise NotImplementedError(f"Can't decode version {self.version} .li files, convert them with mokucli")
+            data_start = f.tell()
+
+        self._fields, record_bits = _parse_fields(self.record_format)
+        if record_bits % 8:
+            raise NotImplementedError(f"Can't decode {record_bits} bit records, as they are not a whole number "
+                                      "of bytes")
+        self.record_size = record_bits // 8
+        self._operations = [_parse_processing(processing, calibration)
+                            for processing, calibration in zip(self.processing, self.calibration)]
+
+        # a column per field of each channel, skipping the padding
+        self._columns = []
+        for ch in range(self.n_channels):
+            fields = [idx for idx, field in enumerate(self._fields) if field[0] != 'p']
+            for number, idx in enumerate(fields, start=1):
+                name = f'ch{ch + 1}' if len(fields) == 1 else f'ch{ch + 1}_{number}'
+                self._columns.append((name, ch, idx, number - 1))
+        self.channels = ['time'] + [name for name, _, _, _ in self._columns]
+
+        self._file = np.memmap(file_name, dtype=np.uint8, mode='r')
+        self._index_chunks(data_start)
+
+    def _read_header_v1(self, f):
+        header_size, = struct.unpack('<H', f.read(2))
+        enabled, self.instrument, self.instrument_version, self.time_step, self.start_time = \
+            struct.unpack('<BBHdQ', f.read(20))
+        self.n_channels = bin(enabled & 0x03).count('1')
+        self.start_offset = 0.0
+        self.calibration = [struct.unpack('<d', f.read(8))[0] for _ in range(self.n_channels)]
+        self.record_format = self._read_string(f)
+        self.processing = [self._read_string(f) for _ in range(self.n_channels)]
+        self.csv_format = self._read_string(f)
+        self.csv_header = self._read_string(f)
+        if f.tell() != header_size + 5:
+            raise ValueError(f'The header of {self.file_name} is {f.tell() - 5} bytes long, expected {header_size}')
+
+    def _read_header_v3(self, f):
+        f.read(2)
+        self.instrument, self.instrument_version, self.n_channels, self.start_time, self.start_offset, \
+            self.time_step = struct.unpack('<BQBQdd', f.read(34))
+        self.calibration = [None] * self.n_channels
+        self.record_format = self._read_string(f)
+        self.processing = [self._read_string(f) for _ in range(self.n_channels)]
+        self.csv_format = self._read_string(f)
+        self.csv_header = self._read_string(f)
+        # the chunks are aligned to 8 bytes
+        f.read(-f.tell() % 8)
+
+    @staticmethod
+    def _read_string(f):
+        length, = struct.unpack('<H', f.read(2))
+        return f.read(length).decode('ascii')
+
+    def _index_chunks(self, position):
+        # find the data of each chunk from the chunk headers alone, skipping over the records
+        chunks = [[] for _ in range(self.n_channels)]
+        header = struct.Struct('<BH' if self.version == '1' else '<IIQ')
+        size = len(self._file)
+        while position + header.size <= size:
+            ch, length = header.unpack_from(self._file, position)[:2]
+            if ch >= self.n_channels:
+                raise ValueError(f'Chunk at byte {position} of {self.file_name} is for channel {ch + 1}, but the log '
+                                 f'has {self.n_channels} channels')
+            position += header.size
+            # the last chunk of a log that was cut short is kept up to its last whole record
+            chunks[ch].append((position, min(length, size - position)))
+            position += length
+            if self.version == '3':
+                position += -position % 8
+
+        self._chunk_offsets = [np.array([c[0] for c in ch_chunks], dtype=np.int64) for ch_chunks in chunks]
+        self._chunk_starts = [np.concatenate([[0], np.cumsum([c[1] for c in ch_chunks], dtype=np.int64)])
+                              for ch_chunks in chunks]
+
+    def close(self):
+        """
+        Release the memory map
+        """
+        self._file = None
+
+    def __len__(self):
+        # the channels are recorded together, so a sample is only complete once every channel has its record
+        return int(min((starts[-1] for starts in self._chunk_starts), default=0)) // self.record_size
+
+    def time(self, index):
+        """
+        :param index: sample index, or an array of them
+        :return: time of the samples relative to the start of the log, in seconds
+        """
+        return self.start_offset + np.asarray(index) * self.time_step
+
+    def index_range(self, start_time=None, stop_time=None):
+        """
+        Find the samples between two times from the time step of the log, without reading any records
+        :param start_time: first time to include, defaults to the start of the log
+        :param stop_time: time to stop before, defaults to the end of the log
+        :return: tuple of the start and stop indices
+        """
+        def first_at(t):
+            # first sample at or after t, checked against the sample times to avoid rounding errors
+            idx = int(np.clip(np.ceil((t - self.start_offset) / self.time_step), 0, len(self)))
+            while idx > 0 and self.time(idx - 1) >= t:
+                idx -= 1
+            while idx < len(self) and self.time(idx) < t:
+                idx += 1
+            return idx
+
+        start = 0 if start_time is None else first_at(start_time)
+        stop = len(self) if stop_time is None else first_at(stop_time)
+        return start, max(start, stop)
+
+    def _bytes(self, ch, start, stop):
+        # bytes start:stop of the records of a channel, gathered from the chunks that hold them
+        if start >= stop:
+            return self._file[:0]
+        starts = self._chunk_starts[ch]
+        first = int(np.searchsorted(starts, start, side='right')) - 1
+        last = int(np.searchsorted(starts, stop, side='left'))
+        parts = []
+        for idx in range(first, last):
+            offset = self._chunk_offsets[ch][idx]
+            lo = max(start - starts[idx], 0)
+            hi = min(stop, starts[idx + 1]) - starts[idx]
+            parts.append(self._file[offset + lo:offset + hi])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def read(self, start=0, stop=None, channels=None):
+        """
+        Decode a range of samples
+        :param start: index of the first sample
+        :param stop: index to stop before, defaults to the end of the log
+        :param channels: names of the channels to decode, defaults to all of them
+        :return: dict of channel name to samples
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        channels = self.channels if channels is None else channels
+
+        data = {}
+        if 'time' in channels:
+            data['time'] = self.time(np.arange(start, stop))
+        records = {}
+        for name, ch, idx, number in self._columns:
+            if name not in channels:
+                continue
+            if ch not in records:
+                raw = self._bytes(ch, start * self.record_size, stop * self.record_size)
+                records[ch] = raw.reshape(stop - start, self.record_size)
+            kind, offset, bits, literal = self._fields[idx]
+            values = _decode_field(records[ch], kind, offset, bits)
+            if literal is not None and np.any(values != literal):
+                raise ValueError(f'The records of channel {ch + 1} in {self.file_name} are corrupt, convert the log '
+                                 'with mokucli to skip the damaged records')
+            operations = self._operations[ch]
+            data[name] = _process(values, operations[number] if number < len(operations) else [])
+        return data
+
+
+def convert_li(li_file, npy_file=None, mokucli=None):
+    """
+    Convert a .li file to a binary .npy file with mokucli, unless an up to date conversion already exists. The whole
+    log is converted before this returns, so use LIFile instead for the logs it can decode.
+    :param li_file: path of the .li file
+    :param npy_file: path of the .npy file, defaults to the .li path with a .npy extension. It may be on another
+    disk, as the conversion is written in its directory rather than next to the .li file.
+    :param mokucli: path of the mokucli executable, defaults to MOKU_CLI_PATH or mokucli on the PATH
+    :return: path of the .npy file
+    """
+    if npy_file is None:
+        npy_file = os.path.splitext(li_file)[0] + '.npy'
+    if os.path.exists(npy_file) and os.path.getmtime(npy_file) >= os.path.getmtime(li_file):
+        return npy_file
+
+    mokucli = mokucli or os.environ.get('MOKU_CLI_PATH', which('mokucli'))
+    if mokucli is None:
+        raise FileNotFoundError('Cannot find mokucli, install it or set the MOKU_CLI_PATH environment variable')
+
+    # mokucli writes the converted file next to the file it converts, so convert a link to the log from a working
+    # directory beside the .npy file, then move the result into place
+    work_dir = tempfile.mkdtemp(prefix='li_convert_', dir=os.path.dirname(os.path.abspath(npy_file)))
+    try:
+        source = os.path.join(work_dir, os.path.basename(li_file))
+        try:
+            os.symlink(os.path.abspath(li_file), source)
+        except OSError:
+            # links may not be allowed, e.g. on Windows, so convert next to the .li file instead
+            source = li_file
+        subprocess.run([mokucli, 'convert', '--format=npy', source], check=True, capture_output=True)
+        shutil.move(os.path.splitext(source)[0] + '.npy', npy_file)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return npy_file
+
+
+class LogFile:
+    """
+    View of a Datalogger log, decoded a range of samples at a time.
+
+    Example:
+        with LogFile('MokuDataLoggerData.li') as log:
+            data = log.time_slice(1.0, 2.0)
+            log.export('MokuDataLoggerData.h5')
+    """
+    def __init__(self, file_name, mokucli=None, npy_file=None, temporary=False, convert=False):
+        """
+        :param file_name: path of a .li file, or of a .npy file already converted by mokucli
+        :param mokucli: path of the mokucli executable, used to convert the .li files the decoder does not support
+        :param npy_file: path to convert a .li file to, defaults to the .li path with a .npy extension, or to a
+        temporary file if temporary is set
+        :param temporary: delete the converted file when the log is closed, rather than keeping it for the next time
+        the log is opened
+        :param convert: convert a .li file with mokucli even if it can be decoded natively
+        """
+        self._delete = None
+        self._li = None
+        self._columns = {}
+        if os.path.splitext(file_name)[1].lower() == '.li':
+            if not convert:
+                try:
+                    self._li = LIFile(file_name)
+                except NotImplementedError:
+                    # fall back to mokucli, which converts the whole log before it can be read
+                    pass
+            if self._li is None:
+                if temporary and npy_file is None:
+                    handle, npy_file = tempfile.mkstemp(suffix='.npy')
+                    os.close(handle)
+                    # an empty file would look like an up to date conversion
+                    os.remove(npy_file)
+                file_name = convert_li(file_name, npy_file, mokucli=mokucli)
+                if temporary:
+                    self._delete = file_name
+        self.file_name = file_name
+
+        if self._li is not None:
+            self.channels = self._li.channels
+            return
+        self._data = np.load(file_name, mmap_mode='r')
+        if self._data.dtype.names:
+            # structured array with a field per channel
+            self.channels = list(self._data.dtype.names)
+            self._columns = {ch: self._data[ch] for ch in self.channels}
+        else:
+            # one column per channel, starting with the time
+            self.channels = ['time'] + [f'ch{idx}' for idx in range(1, self._data.shape[1])]
+            self._columns = {ch: self._data[:, idx] for idx, ch in enumerate(self.channels)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Release the memory map, and delete the converted file if it is temporary
+        """
+        if self._li is not None:
+            self._li.close()
+        self._data = None
+        self._columns = {}
+        if self._delete is not None and os.path.exists(self._delete):
+            os.remove(self._delete)
+            self._delete = None
+
+    def __len__(self):
+        if self._li is not None:
+            return len(self._li)
+        return len(self._columns[self.channels[0]])
+
+    def _read(self, start, stop):
+        if self._li is not None:
+            return self._li.read(start, stop)
+        return {ch: values[start:stop] for ch, values in self._columns.items()}
+
+    def __getitem__(self, channel):
+        """
+        :param channel: channel name, e.g. 'time' or 'ch1'
+        :return: samples of the channel, the whole channel is decoded for a .li file
+        """
+        if self._li is not None:
+            return self._li.read(channels=[channel])[channel]
+        return self._columns[channel]
+
+    @property
+    def time(self):
+        return self[self.channels[0]]
+
+    def index_range(self, start_time=None, stop_time=None):
+        """
+        Find the samples between two times, from the time step of a .li file or with a binary search of a converted
+        file, which only reads a few pages of it
+        :param start_time: first time to include, defaults to the start of the log
+        :param stop_time: time to stop before, defaults to the end of the log
+        :return: tuple of the start and stop indices
+        """
+        if self._li is not None:
+            return self._li.index_range(start_time, stop_time)
+        start = 0 if start_time is None else int(np.searchsorted(self.time, start_time, side='left'))
+        stop = len(self) if stop_time is None else int(np.searchsorted(self.time, stop_time, side='left'))
+        return start, stop
+
+    def time_slice(self, start_time=None, stop_time=None):
+        """
+        Get the samples between two times without reading the rest of the file
+        :param start_time: first time to include, defaults to the start of the log
+        :param stop_time: time to stop before, defaults to the end of the log
+        :return: dict of channel name to samples
+        """
+        return self._read(*self.index_range(start_time, stop_time))
+
+    def chunks(self, chunk_size=2 ** 20, start_time=None, stop_time=None):
+        """
+        Iterate over the log in chunks, reading each from disk in turn
+        :param chunk_size: number of samples in each chunk
+        :param start_time: first time to include, defaults to the start of the log
+        :param stop_time: time to stop before, defaults to the end of the log
+        :return: generator of dicts of channel name to samples
+        """
+        start, stop = self.index_range(start_time, stop_time)
+        for idx in range(start, stop, chunk_size):
+            yield {ch: np.asarray(values) for ch, values in self._read(idx, min(idx + chunk_size, stop)).items()}
+
+    def export(self, file_name, chunk_size=2 ** 16, compression='default', start_time=None, stop_time=None):
+        """
+        Write the log to an HDF5 or Parquet file, one column per channel, a chunk at a time
+        :param file_name: path of the file, the format is chosen by its extension
+        :param chunk_size: number of samples in each HDF5 chunk or Parquet row group
+        :param compression: compression filter, see StreamWriter
+        :param start_time: first time to include, defaults to the start of the log
+        :param stop_time: time to stop before, defaults to the end of the log
+        :return: the metrics of the writer
+        """
+        with StreamWriter(file_name, chunk_size=chunk_size, compression=compression) as writer:
+            for chunk in self.chunks(max(chunk_size, 2 ** 20), start_time, stop_time):
+                writer.write(chunk)
+        return writer.metrics()
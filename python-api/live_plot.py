@@ -0,0 +1,171 @@
+#
+# moku example: Live plotting with blitting
+#
+# This module updates matplotlib plots in real-time by redrawing only the
+# lines that change on top of a cached background, rather than redrawing
+# the whole figure for every frame. The axis limits are only recomputed
+# when the data moves outside of them, and frames that arrive faster than
+# the maximum frame rate are dropped so that plotting never holds up the
+# acquisition.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+class LivePlot:
+    """
+    Blitting renderer for the artists of a figure.
+
+    Example:
+        line1, = plt.plot([])
+        plot = LivePlot(plt.gcf(), max_fps=30)
+        plot.add(line1)
+        plot.autoscale(plt.gca(), axis='x')
+        while plot.is_open():
+            data = i.get_data()
+            plot.set_data(line1, data['time'], data['ch1'])
+            plot.render()
+    """
+    def __init__(self, fig=None, max_fps=30):
+        """
+        :param fig: figure to draw, defaults to the current figure
+        :param max_fps: maximum number of frames to render per second, later frames are dropped until it is time
+        for the next one
+        """
+        self.fig = plt.gcf() if fig is None else fig
+        self.canvas = self.fig.canvas
+        self.min_interval = 1 / max_fps if max_fps else 0
+
+        self.artists = []
+        self._data = {}
+        self._autoscale = {}
+        self._background = None
+        self._last_render = -np.inf
+        self._needs_redraw = True
+
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self.full_redraws = 0
+
+        # the background must be recached whenever the whole figure is drawn, e.g. when the window is resized
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add(self, artist):
+        """
+        Add an artist to redraw on every frame, e.g. a Line2D or a StepPatch
+        :param artist: the artist
+        :return: the artist
+        """
+        artist.set_animated(True)
+        self.artists.append(artist)
+        self._needs_redraw = True
+        return artist
+
+    def autoscale(self, ax, axis='both', margin=0.05, shrink=0.5):
+        """
+        Fit the limits of an axes to the data of its artists. The x-axis is a tight fit. The y-axis grows as soon as
+        the data leaves it, but only shrinks once the data spans less than the shrink fraction of it, so that noise
+        does not cause a full redraw on every frame.
+        :param ax: the axes
+        :param axis: 'x', 'y' or 'both'
+        :param margin: fraction of the data range to add above and below the y data
+        :param shrink: fraction of the y range below which the y-axis is refitted to the data
+        """
+        self._autoscale[ax] = (axis, margin, shrink)
+
+    def set_data(self, artist, x, y):
+        """
+        Set the data of an artist for the next frame. Only the latest data is kept if frames are dropped.
+        :param artist: an artist added with add()
+        :param x: x data, or the bin edges of a StepPatch
+        :param y: y data, or the bin values of a StepPatch
+        """
+        self._data[artist] = (np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+
+    def is_open(self):
+        return plt.fignum_exists(self.fig.number)
+
+    def render(self, force=False):
+        """
+        Draw the latest data, unless the previous frame was drawn less than 1 / max_fps ago
+        :param force: draw the frame regardless of the frame rate
+        :return: whether the frame was drawn
+        """
+        now = time.perf_counter()
+        if not force and now - self._last_render < self.min_interval:
+            self.frames_dropped += 1
+            # keep the window responsive while frames are being dropped
+            self.canvas.flush_events()
+            return False
+        self._last_render = now
+
+        for artist, (x, y) in self._data.items():
+            if hasattr(artist, 'set_xdata'):
+                artist.set_data(x, y)
+            else:
+                artist.set_data(values=y, edges=x)
+        ranges = self._ranges()
+        for ax, options in self._autoscale.items():
+            if ax in ranges:
+                self._needs_redraw |= self._update_limits(ax, ranges[ax], *options)
+
+        if self._needs_redraw or self._background is None or not self.canvas.supports_blit:
+            # draw the whole figure, which caches the new background in _on_draw
+            self.full_redraws += 1
+            self._needs_redraw = False
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+        if self.canvas.supports_blit:
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+        self.frames_rendered += 1
+        return True
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def _ranges(self):
+        # find the data range of the artists on each axes
+        ranges = {}
+        for artist in self.artists:
+            if artist not in self._data or artist.axes not in self._autoscale:
+                continue
+            x, y = self._data[artist]
+            x, y = x[np.isfinite(x)], y[np.isfinite(y)]
+            if not x.size or not y.size:
+                continue
+            lo_x, hi_x, lo_y, hi_y = ranges.get(artist.axes, (np.inf, -np.inf, np.inf, -np.inf))
+            ranges[artist.axes] = (min(lo_x, x.min()), max(hi_x, x.max()), min(lo_y, y.min()), max(hi_y, y.max()))
+        return ranges
+
+    def _update_limits(self, ax, data_range, axis, margin, shrink):
+        lo_x, hi_x, lo_y, hi_y = data_range
+        changed = False
+
+        if axis in ('x', 'both') and hi_x > lo_x and tuple(ax.get_xlim()) != (lo_x, hi_x):
+            ax.set_xlim(lo_x, hi_x)
+            changed = True
+
+        if axis in ('y', 'both'):
+            ylim = ax.get_ylim()
+            span = (hi_y - lo_y) or 1
+            fitted = (lo_y - margin * span, hi_y + margin * span)
+            outside = lo_y < ylim[0] or hi_y > ylim[1]
+            too_loose = shrink * (ylim[1] - ylim[0]) > fitted[1] - fitted[0]
+            if outside or too_loose:
+                ax.set_ylim(*fitted)
+                changed = True
+
+        return changed
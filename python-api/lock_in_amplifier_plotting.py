@@ -11,6 +11,7 @@
 
 import matplotlib.pyplot as plt
 from moku.instruments import LockInAmp
+from live_plot import LivePlot
 
 # Connect to your Moku by its ip address using LockInAmp('192.168.###.###')
 # or by its serial number using LockInAmp(serial=123)
@@ -64,17 +65,21 @@ try:
     # Configure labels for axes
     ax = plt.gca()
 
-    # This loops continuously updates the plot with new data
-    while True:
+    # Only redraw the lines on each frame, rather than the whole figure
+    plot = LivePlot(plt.gcf(), max_fps=30)
+    plot.add(line1)
+    plot.add(line2)
+
+    # This loops continuously updates the plot with new data until the
+    # plot is closed
+    while plot.is_open():
         # Get new data
         data = i.get_data()
 
         # Update the plot
-        line1.set_ydata(data['ch1'])
-        line2.set_ydata(data['ch2'])
-        line1.set_xdata(data['time'])
-        line2.set_xdata(data['time'])
-        plt.pause(0.001)
+        plot.set_data(line1, data['time'], data['ch1'])
+        plot.set_data(line2, data['time'], data['ch2'])
+        plot.render()
 
 except Exception as e:
     print(f'Exception occurred: {e}')
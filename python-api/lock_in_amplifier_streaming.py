@@ -12,6 +12,8 @@
 import matplotlib.pyplot as plt
 
 from moku.instruments import LockInAmp
+from decimate import StreamDecimator
+from stream_reader import StreamReader
 
 # Connect to your Moku by its ip address using
 # LockInAmp('192.168.###.###')
@@ -65,18 +67,37 @@ try:
     # Configure labels for axes
     ax = plt.gca()
 
-    # This loops continuously updates the plot with new data
-    while True:
-        # Get new data
-        data = i.get_stream_data()
-        if data:
-            plt.xlim([data['time'][0], data['time'][-1]])
+    # Read the stream on a background thread so that a slow plot update
+    # never backs up the stream at 100 kSa/s
+    reader = StreamReader(i, capacity=2**22).start()
+
+    # Keep a min/max envelope of each channel so that the whole stream can
+    # be plotted. 2000 buckets of 1000 samples covers 20 s at 100 kSa/s
+    envelope1 = StreamDecimator(bucket_size=1000, n_buckets=2000)
+    envelope2 = StreamDecimator(bucket_size=1000, n_buckets=2000)
+
+    # This loops continuously updates the plot with all of the data
+    # until the end of the stream
+    while reader.is_alive() or reader.available():
+        # read every sample received since the last update, waiting for
+        # at least a full bucket
+        data = reader.read(max(1000, reader.available()), timeout=0.1)
+        if data and len(data['time']):
+            envelope1.append(data['time'], data['ch1'])
+            envelope2.append(data['time'], data['ch2'])
+            time1, ch1 = envelope1.envelope()
+            time2, ch2 = envelope2.envelope()
+            plt.xlim([time1[0], time1[-1]])
             # Update the plot
-            line1.set_ydata(data['ch1'])
-            line2.set_ydata(data['ch2'])
-            line1.set_xdata(data['time'])
-            line2.set_xdata(data['time'])
-            plt.pause(0.001)
+            line1.set_data(time1, ch1)
+            line2.set_data(time2, ch2)
+        plt.pause(0.001)
+
+    if reader.error:
+        raise reader.error
+    print(f'Received {reader.samples_received} samples with '
+          f'{reader.time_gaps} gaps in the stream and '
+          f'{reader.overruns} samples dropped by the plot')
 
 except Exception as e:
     i.stop_streaming()
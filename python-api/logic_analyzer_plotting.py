@@ -9,6 +9,8 @@
 
 import matplotlib.pyplot as plt
 from moku.instruments import LogicAnalyzer
+from live_plot import LivePlot
+from logic_capture import LogicCapture, pin_traces
 
 # Connect to your Moku by its ip address using
 # LogicAnalyzer('192.168.###.###')
@@ -28,12 +30,16 @@ try:
     i.set_pin_mode(pin=2, state="PG1")
     i.set_pin_mode(pin=3, state="PG1")
     i.set_pin_mode(pin=4, state="PG1")
-    data = i.get_data(wait_reacquire=True, include_pins=[1, 2, 3, 4])
+    # Pack the pins of each frame into one word per sample, and find the
+    # rising and falling edges of every pin
+    pins = [1, 2, 3, 4]
+    capture = LogicCapture(pins=pins)
+    frame = capture.add(i.get_data(wait_reacquire=True, include_pins=pins))
+    print(f"{frame['events'].size} edges in the first frame")
 
-    pin1, = plt.step(data["time"], data["pin1"])
-    pin2, = plt.step(data["time"], [i + 2 for i in data["pin2"]])
-    pin3, = plt.step(data["time"], [i + 4 for i in data["pin3"]])
-    pin4, = plt.step(data["time"], [i + 6 for i in data["pin4"]])
+    # Plot the pins above one another, 2 apart
+    traces = pin_traces(frame['words'], pins, spacing=2)
+    lines = [plt.step(frame['time'], trace)[0] for trace in traces]
 
     plt.ion()
     plt.show()
@@ -41,21 +47,19 @@ try:
     plt.ylim([-1, 8])
     plt.yticks([0, 2, 4, 6], labels=["Pin1", "Pin2", "Pin3", "Pin4"])
 
-    while True:
-        data = i.get_data(wait_reacquire=True,
-                          include_pins=[1, 2, 3, 4])
+    # Only redraw the pins on each frame, rather than the whole figure
+    plot = LivePlot(plt.gcf(), max_fps=30)
+    for line in lines:
+        plot.add(line)
+    plot.autoscale(plt.gca(), axis='x')
 
-        pin1.set_xdata(data["time"])
-        pin2.set_xdata(data["time"])
-        pin3.set_xdata(data["time"])
-        pin4.set_xdata(data["time"])
+    while plot.is_open():
+        frame = capture.add(i.get_data(wait_reacquire=True, include_pins=pins))
 
-        pin1.set_ydata(data["pin1"])
-        pin2.set_ydata([i + 2 for i in data["pin2"]])
-        pin3.set_ydata([i + 4 for i in data["pin3"]])
-        pin4.set_ydata([i + 6 for i in data["pin4"]])
-
-        plt.pause(0.001)
+        traces = pin_traces(frame['words'], pins, spacing=2)
+        for line, trace in zip(lines, traces):
+            plot.set_data(line, frame['time'], trace)
+        plot.render()
 
 
 except Exception as e:
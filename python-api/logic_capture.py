@@ -0,0 +1,172 @@
+#
+# moku example: Logic Analyzer capture
+#
+# This module packs the pins of Logic Analyzer frames into one 16-bit word
+# per sample, so that long captures of a 16-pin bus take 2 bytes a sample
+# rather than a Python list per pin. The transitions of every pin are found
+# at once from the XOR of neighbouring words and reported as events of
+# (time, pin, edge), which can be passed on to protocol decoders.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import numpy as np
+
+# an event is a transition of one pin, with edge +1 when it rises and -1 when it falls
+EVENT_DTYPE = np.dtype([('time', float), ('pin', np.uint8), ('edge', np.int8)])
+
+
+def frame_pins(frame):
+    """
+    :return: the pin numbers included in a frame, in order
+    """
+    return sorted(int(key[3:]) for key in frame if key.startswith('pin') and key[3:].isdigit())
+
+
+def pack_pins(frame, pins=None):
+    """
+    Pack the pins of a frame into one word per sample, with pin n in bit n - 1
+    :param frame: frame from get_data, with 'pin1' to 'pin16'
+    :param pins: pins to pack, defaults to every pin in the frame
+    :return: uint16 array of the words
+    """
+    pins = frame_pins(frame) if pins is None else pins
+    words = np.zeros(len(frame['time']), dtype=np.uint16)
+    for pin in pins:
+        words |= (np.asarray(frame[f'pin{pin}']) != 0).astype(np.uint16) << (pin - 1)
+    return words
+
+
+def unpack_pins(words, pins):
+    """
+    :param words: words from pack_pins
+    :param pins: pins to unpack
+    :return: array of the state of each pin, with one row per pin
+    """
+    shifts = np.asarray(pins, dtype=np.uint16)[:, None] - 1
+    return (np.asarray(words, dtype=np.uint16)[None, :] >> shifts) & 1
+
+
+def pin_traces(words, pins, spacing=2):
+    """
+    Offset the state of each pin so that the pins can be plotted above one another
+    :param words: words from pack_pins
+    :param pins: pins to plot, from the bottom up
+    :param spacing: offset between neighbouring pins
+    :return: array of the offset state of each pin, with one row per pin
+    """
+    return unpack_pins(words, pins) + spacing * np.arange(len(pins))[:, None]
+
+
+def find_edges(time, words, previous=None):
+    """
+    Find the transitions of every pin
+    :param time: time of each sample
+    :param words: words from pack_pins
+    :param previous: last word of the previous frame, to find the transitions between frames of a continuous
+    capture
+    :return: array of events with EVENT_DTYPE, in time order and then in pin order
+    """
+    time = np.asarray(time, dtype=float)
+    words = np.asarray(words, dtype=np.uint16)
+    if previous is not None:
+        before = np.concatenate(([previous], words[:-1])).astype(np.uint16)
+        samples = np.arange(words.size)
+    else:
+        before = words[:-1]
+        words = words[1:]
+        samples = np.arange(1, words.size + 1)
+
+    # the bits that changed between neighbouring samples, only for the samples where any did
+    changed = np.flatnonzero(before != words)
+    flips = before[changed] ^ words[changed]
+    bits = np.unpackbits(flips.astype('<u2').view(np.uint8).reshape(-1, 2), axis=1, bitorder='little')
+    row, bit = np.nonzero(bits)
+
+    events = np.empty(row.size, dtype=EVENT_DTYPE)
+    events['time'] = time[samples[changed[row]]]
+    events['pin'] = bit + 1
+    events['edge'] = np.where((words[changed[row]] >> bit.astype(np.uint16)) & 1, 1, -1)
+    return events
+
+
+class ClockedDecoder:
+    """
+    Decoder that samples a parallel bus, or the data line of a serial bus, on the edges of a clock pin.
+
+    Example:
+        capture.add_decoder('bus', ClockedDecoder(clock_pin=1, data_pins=[2, 3, 4, 5]))
+    """
+    def __init__(self, clock_pin, data_pins, edge=1):
+        """
+        :param clock_pin: pin of the clock
+        :param data_pins: pins of the data, least significant bit first
+        :param edge: 1 to sample on the rising edges of the clock, -1 on the falling edges
+        """
+        self.clock_pin = clock_pin
+        self.data_pins = list(data_pins)
+        self.edge = edge
+
+    def __call__(self, time, words, events):
+        """
+        :return: tuple of the time of each clock edge and the value of the data pins at that edge
+        """
+        clock = events[(events['pin'] == self.clock_pin) & (events['edge'] == self.edge)]
+        # the word at each clock edge, found by time as the events of a frame are in time order
+        sampled = words[np.searchsorted(time, clock['time'])]
+        values = np.zeros(sampled.size, dtype=np.uint16)
+        for bit, pin in enumerate(self.data_pins):
+            values |= ((sampled >> np.uint16(pin - 1)) & 1) << np.uint16(bit)
+        return clock['time'], values
+
+
+class LogicCapture:
+    """
+    Packs the frames of the Logic Analyzer, finds their transitions and passes them to decoders.
+
+    Example:
+        capture = LogicCapture(pins=[1, 2, 3, 4])
+        capture.add_decoder('bus', ClockedDecoder(clock_pin=1, data_pins=[2, 3, 4]))
+        result = capture.add(i.get_data(wait_reacquire=True, include_pins=[1, 2, 3, 4]))
+        print(result['events'], result['bus'])
+    """
+    def __init__(self, pins=None, continuous=False):
+        """
+        :param pins: pins to capture, defaults to every pin in the first frame
+        :param continuous: whether each frame follows on from the last, so that transitions between frames are
+        found too. Frames from get_data(wait_reacquire=True) are separate acquisitions, so they don't.
+        """
+        self.pins = pins
+        self.continuous = continuous
+        self.decoders = {}
+        self.frames = 0
+        self.events = 0
+        self._previous = None
+
+    def add_decoder(self, name, decoder):
+        """
+        Add a decoder, which is called with the time, words and events of every frame
+        :param name: key of the result of the decoder in the results of add()
+        :param decoder: function of (time, words, events), e.g. a ClockedDecoder
+        """
+        self.decoders[name] = decoder
+
+    def add(self, frame):
+        """
+        Capture a frame
+        :param frame: frame from get_data
+        :return: dict of the 'time', 'words' and 'events' of the frame, and the result of each decoder
+        """
+        if self.pins is None:
+            self.pins = frame_pins(frame)
+        time = np.asarray(frame['time'], dtype=float)
+        words = pack_pins(frame, self.pins)
+        events = find_edges(time, words, self._previous if self.continuous else None)
+        if self.continuous and words.size:
+            self._previous = words[-1]
+
+        self.frames += 1
+        self.events += events.size
+        result = {'time': time, 'words': words, 'events': events}
+        for name, decoder in self.decoders.items():
+            result[name] = decoder(time, words, events)
+        return result
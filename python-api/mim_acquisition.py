@@ -0,0 +1,159 @@
+#
+# moku example: Multi-instrument Mode acquisition
+#
+# This module reads the data of every slot of a Multi-instrument Mode
+# configuration concurrently, rather than polling one slot at a time.
+# Streaming slots are drained by a background StreamReader each, while
+# framed slots, such as an Oscilloscope, are fetched in parallel on a
+# thread pool. The slots share the HTTP session of the Moku, so each
+# worker thread sends its requests through its own copy of the session.
+# The results are aligned on a common timebase and combined into a single
+# frame per tick.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from stream_reader import StreamReader
+from thread_sessions import ThreadSessions
+
+
+def align(datasets, x_key='time', reference=None, offsets=None):
+    """
+    Combine the data of several slots on the x axis of one of them, interpolating the other slots onto it. Only the
+    range covered by every slot is kept.
+    :param datasets: dict of slot name to data, each a dict of channel name to samples including x_key
+    :param x_key: name of the shared axis, e.g. 'time' or 'frequency'
+    :param reference: name of the slot whose axis is used, defaults to the first slot
+    :param offsets: optional dict of slot name to an offset added to the axis of that slot, e.g. the difference
+    between the start times of two streams
+    :return: dict with the shared axis under x_key and every other channel as '<slot>_<channel>'
+    """
+    offsets = offsets or {}
+    datasets = {name: data for name, data in datasets.items() if data and len(data[x_key])}
+    if not datasets:
+        return {}
+    reference = next(iter(datasets)) if reference is None else reference
+
+    axes = {name: np.asarray(data[x_key], dtype=float) + offsets.get(name, 0) for name, data in datasets.items()}
+    lo = max(x[0] for x in axes.values())
+    hi = min(x[-1] for x in axes.values())
+    x = axes[reference]
+    keep = (x >= lo) & (x <= hi)
+    if not keep.any():
+        return {}
+
+    combined = {x_key: x[keep]}
+    for name, data in datasets.items():
+        # only interpolate the part of each slot that covers the shared range
+        start = max(0, np.searchsorted(axes[name], lo) - 1)
+        stop = np.searchsorted(axes[name], hi, side='right') + 1
+        for ch, values in data.items():
+            if ch == x_key:
+                continue
+            values = np.asarray(values, dtype=float)
+            if name == reference:
+                combined[f'{name}_{ch}'] = values[keep]
+            else:
+                combined[f'{name}_{ch}'] = np.interp(x[keep], axes[name][start:stop], values[start:stop])
+    return combined
+
+
+class MultiInstrumentAcquisition:
+    """
+    Concurrent acquisition from the slots of a MultiInstrument.
+
+    Example:
+        with MultiInstrumentAcquisition(streams={'dl': dl, 'lia': lia}) as acquisition:
+            while acquisition.is_alive():
+                frame = acquisition.tick(1000)
+    """
+    def __init__(self, streams=None, frames=None, capacity=2 ** 20, offsets=None, on_chunk=None):
+        """
+        :param streams: dict of slot name to an instrument that has started streaming
+        :param frames: dict of slot name to an instrument to read frames from with get_data
+        :param capacity: number of samples buffered for each streaming slot
+        :param offsets: optional dict of slot name to a time offset to add to its data when aligning the slots
+        :param on_chunk: optional dict of slot name to a callback for each chunk of its stream, see StreamReader
+        """
+        on_chunk = on_chunk or {}
+        self.readers = {name: StreamReader(instrument, capacity=capacity, on_chunk=on_chunk.get(name))
+                        for name, instrument in (streams or {}).items()}
+        self.frames = dict(frames or {})
+        self.offsets = offsets
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.frames)),
+                                            thread_name_prefix='MultiInstrumentAcquisition')
+        self._sessions = ThreadSessions()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        for reader in self.readers.values():
+            reader.start()
+        return self
+
+    def stop(self):
+        for reader in self.readers.values():
+            reader.stop(timeout=1)
+        self._executor.shutdown(wait=False)
+
+    def is_alive(self):
+        """
+        :return: whether any stream is still being read, or whether there are framed slots to read
+        """
+        return any(reader.is_alive() for reader in self.readers.values()) or bool(self.frames)
+
+    def errors(self):
+        return {name: reader.error for name, reader in self.readers.items() if reader.error is not None}
+
+    def get_frames(self, **kwargs):
+        """
+        Fetch a frame from every framed slot at once
+        :param kwargs: additional arguments for get_data, e.g. wait_reacquire=True
+        :return: dict of slot name to frame
+        """
+        futures = {name: self._executor.submit(self._get_frame, instrument, kwargs)
+                   for name, instrument in self.frames.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _get_frame(self, instrument, kwargs):
+        return self._sessions.instrument(instrument).get_data(**kwargs)
+
+    def latest(self, n=None):
+        """
+        Get the latest samples of every stream, aligned on the time axis of the first stream
+        :param n: number of samples of each stream, defaults to all of the samples held
+        :return: dict of 'time' and '<slot>_<channel>' arrays, empty until every stream has data
+        """
+        if not self.readers:
+            return {}
+        offsets = self.offsets or {}
+        (first, reader), *others = self.readers.items()
+        # copy the latest n samples of the first stream, then the samples of the others that cover the same time
+        # range, each under the lock of its reader so that none of them is overwritten while it is aligned
+        data = {first: reader.latest(n, copy=True)}
+        if not data[first] or not len(data[first]['time']):
+            return {}
+        start, stop = data[first]['time'][[0, -1]] + offsets.get(first, 0)
+        for name, reader in others:
+            data[name] = reader.between(start - offsets.get(name, 0), stop - offsets.get(name, 0))
+        if not all(data and len(data['time']) for data in data.values()):
+            return {}
+        return align(data, offsets=self.offsets)
+
+    def tick(self, n=None, **kwargs):
+        """
+        Get one combined frame of every slot. The framed slots are fetched concurrently while the streams continue to
+        be read in the background.
+        :param n: number of samples of each stream
+        :param kwargs: additional arguments for get_data
+        :return: dict of the aligned streams under 'streams' and the frames of each framed slot under 'frames'
+        """
+        return {'streams': self.latest(n), 'frames': self.get_frames(**kwargs) if self.frames else {}}
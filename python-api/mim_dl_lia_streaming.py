@@ -1,6 +1,8 @@
 import matplotlib.pyplot as plt
 
 from moku.instruments import Datalogger, LockInAmp, MultiInstrument
+from mim_acquisition import MultiInstrumentAcquisition
+from stream_writer import StreamWriter
 
 i = MultiInstrument('192.168.xxx.xxx', platform_id=2)
 
@@ -19,35 +21,43 @@ try:
 
     dl.start_streaming(10)
 
-    dl.stream_to_file()
-
     lia.set_monitor(1, "Input1")
 
     lia.start_streaming(10)
 
-    plt.ion()
-    plt.show()
-    plt.grid(visible=True)
-    plt.ylim([-1, 1])
-
-    line1, = plt.plot([])
-    line2, = plt.plot([])
-
-    # Configure labels for axes
-    ax = plt.gca()
-
-    # This loops continuously updates the plot with new data
-    while True:
-        # Get new data
-        data = lia.get_stream_data()
-
-        # Update the plot
-        if data:
-            plt.xlim([data['time'][0], data['time'][-1]])
-            line1.set_ydata(data['ch1'])
-            line1.set_xdata(data['time'])
+    # Read both streams concurrently in the background. The Datalogger
+    # stream is also written to an HDF5 file on the host as it arrives.
+    # Leaving the with block stops reading the streams and then closes
+    # the file, however the block exits
+    with StreamWriter('datalogger_stream.h5') as writer, \
+            MultiInstrumentAcquisition(streams={'dl': dl, 'lia': lia},
+                                       on_chunk={'dl': writer.write}) as acquisition:
+        plt.ion()
+        plt.show()
+        plt.grid(visible=True)
+        plt.ylim([-1, 1])
+
+        line1, = plt.plot([])
+        line2, = plt.plot([])
+
+        # Configure labels for axes
+        ax = plt.gca()
+
+        # This loops continuously updates the plot with the latest data of
+        # both slots, aligned on a common timebase, until the streams end
+        while acquisition.is_alive():
+            data = acquisition.latest(1000)
+
+            # Update the plot
+            if data:
+                plt.xlim([data['time'][0], data['time'][-1]])
+                line1.set_data(data['time'], data['dl_ch1'])
+                line2.set_data(data['time'], data['lia_ch1'])
             plt.pause(0.001)
 
+    for name, error in acquisition.errors().items():
+        print(f'Error reading {name}: {error}')
+
 except Exception as e:
     print(e)
 finally:
@@ -0,0 +1,62 @@
+import matplotlib.pyplot as plt
+
+from moku.instruments import FrequencyResponseAnalyzer, MultiInstrument
+from fra_bands import BandedSweep, plan_bands
+
+# Sweep from 20 MHz down to 100 Hz on two Frequency Response Analyzers at
+# once. Each one drives and measures its own copy of the device under test,
+# from Output1 to Input1 and from Output2 to Input2.
+m = MultiInstrument('192.168.###.###', platform_id=4)
+try:
+    fra1 = m.set_instrument(1, FrequencyResponseAnalyzer)
+    fra2 = m.set_instrument(2, FrequencyResponseAnalyzer)
+
+    connections = [dict(source="Input1", destination="Slot1InA"),
+                   dict(source="Slot1OutA", destination="Output1"),
+                   dict(source="Input2", destination="Slot2InA"),
+                   dict(source="Slot2OutA", destination="Output2")]
+
+    print(m.set_connections(connections=connections))
+
+    for fra in (fra1, fra2):
+        fra.set_output(1, 0.5)
+
+    def band_settings(start_frequency, stop_frequency):
+        # Average the low frequency bands for more cycles, and the high
+        # frequency bands for a minimum time
+        if min(start_frequency, stop_frequency) < 1e3:
+            return dict(averaging_time=1e-3, settling_time=1e-3, averaging_cycles=10, settling_cycles=10)
+        return dict(averaging_time=1e-3, settling_time=1e-3, averaging_cycles=1, settling_cycles=1)
+
+    # Split the sweep into 4 bands that each take about the same time, and
+    # share them between the two instruments
+    bands = plan_bands(20e6, 100, 512, n_bands=4, settings=band_settings)
+    for band in bands:
+        print(f"{band['start_frequency']:.0f} Hz to {band['stop_frequency']:.0f} Hz, "
+              f"{band['num_points']} points, about {band['duration']:.1f} s")
+
+    sweep = BandedSweep([fra1, fra2], bands, channels=['ch1'],
+                        progress=lambda band, tracker: print(f"Band from {band['start_frequency']:.0f} Hz done"))
+    result = sweep.run()
+    print(f'Swept in {sweep.elapsed:.1f} s')
+
+    # Check that the bands agree where they overlap
+    for check in result['checks']:
+        if not check['consistent']:
+            print(f"Bands disagree at {check['frequency'][0]:.0f} Hz: {check['ch1']}")
+
+    # Plot the stitched transfer function
+    fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True)
+    ax1.semilogx(result['frequency'], result['ch1']['magnitude'])
+    ax1.set_ylabel('Magnitude (dB)')
+    ax2.semilogx(result['frequency'], result['ch1']['phase'])
+    ax2.set_ylabel('Phase (Cycles)')
+    ax2.set_xlabel('Frequency (Hz)')
+    plt.show()
+
+except Exception as e:
+    raise e
+finally:
+    # Close the connection to the Moku device
+    # This ensures network resources and released correctly
+    m.relinquish_ownership()
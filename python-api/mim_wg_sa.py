@@ -1,8 +1,11 @@
 import matplotlib.pyplot as plt
+import numpy as np
 
 from moku.instruments import MultiInstrument
 from moku.instruments import SpectrumAnalyzer, WaveformGenerator
 
+from spectrum_accumulator import SpectrumAccumulator
+
 m = MultiInstrument("192.168.###.###", platform_id=2)
 try:
     w = m.set_instrument(1, WaveformGenerator)
@@ -17,26 +20,43 @@ try:
     s.set_span(frequency1=0, frequency2=10e5)
     s.set_rbw('Auto')
 
-    line1, = plt.plot([])
+    # Plot the latest spectrum and its peak hold above a waterfall of the
+    # last 200 spectra
+    fig, (ax, ax_waterfall) = plt.subplots(2, 1, sharex=True)
+    line1, = ax.plot([])
+    peak1, = ax.plot([], '--')
     plt.ion()
     plt.show()
-    plt.grid(visible=True)
-    plt.autoscale(axis='x', tight=True)
+    ax.grid(visible=True)
+    ax.autoscale(axis='x', tight=True)
 
     # Get an initial frame of data to set any frame-specific plot parameters
     frame = s.get_data()
+    spectrum = SpectrumAccumulator('ch1', n_rows=200)
+    spectrum.add(frame)
 
-    # Format the x-axis as a frequency scale
-    ax = plt.gca()
+    _, rows = spectrum.waterfall()
+    waterfall = ax_waterfall.imshow(rows, aspect='auto', origin='lower',
+                                    extent=[frame['frequency'][0], frame['frequency'][-1], 0, len(rows)])
+    ax_waterfall.set_ylabel('Spectrum')
 
     # Get and update the plot with new data
     while True:
         frame = s.get_data()
+        spectrum.add(frame)
 
         # Set the frame data for each channel plot
         line1.set_ydata(frame['ch1'])
         # Frequency axis shouldn't change, but to be sure
         line1.set_xdata(frame['frequency'])
+        peak1.set_data(spectrum.frequency, spectrum.max_hold)
+
+        # Show the spectra held, oldest at the bottom, with the colour scale
+        # fitted to the range of levels
+        _, rows = spectrum.waterfall()
+        waterfall.set_data(rows)
+        waterfall.set_extent([spectrum.frequency[0], spectrum.frequency[-1], 0, len(rows)])
+        waterfall.set_clim(np.nanmin(rows), np.nanmax(rows))
         # Ensure the frequency axis is a tight fit
         ax.relim()
         ax.autoscale_view()
@@ -0,0 +1,57 @@
+#
+# moku example: Phasemeter with asyncio
+#
+# This example demonstrates how you can configure the Phasemeter
+# instrument with asyncio. The settings of the 4 channels are sent to the
+# Moku at once, up to 4 requests in flight, without blocking the event
+# loop.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import asyncio
+
+from moku.instruments import Phasemeter
+
+from async_instrument import AsyncInstrument
+
+
+async def main():
+    # Connect to your Moku by its ip address using
+    # AsyncInstrument.connect(Phasemeter, '192.168.###.###')
+    # or by its serial number using AsyncInstrument.connect(Phasemeter, serial=123)
+    i = await AsyncInstrument.connect(Phasemeter, '192.168.###.###', force_connect=False)
+
+    try:
+        # Set all input channels to DC coupled, 1 MOhm impedance, and 400 mVpp
+        # range, configure the outputs, and set the acquisition speed to 596Hz
+        await asyncio.gather(
+            *(i.set_frontend(ch, coupling='DC', impedance='1MOhm', range='400mVpp') for ch in range(1, 5)),
+            # Output channel 1 generates a 1 Vpp, 2 MHz sine wave, and Output
+            # channel 2 is phase locked to Input 2 at an amplitude of 0.5 Vpp
+            i.generate_output(1, 'Sine', amplitude=1, frequency=2e6),
+            i.generate_output(2, 'Sine', amplitude=0.5, phase_locked=True),
+            # Output channel 3 and 4 generate the measured phase at a scaling of
+            # 1 V/cycle and 10 V/cycle respectively
+            i.generate_output(3, 'Phase', scaling=1),
+            i.generate_output(4, 'Phase', scaling=10),
+            i.set_acquisition_speed('596Hz'))
+
+        # Set all input channels to 2 MHz, bandwidth 100 Hz
+        await asyncio.gather(*(i.set_pm_loop(ch, auto_acquire=False, frequency=2e6, bandwidth='100Hz')
+                               for ch in range(1, 5)))
+
+        # Get all the data available from the Moku
+        data = await i.get_data()
+        print(data)
+        print(f'{i.device.requests} requests, up to {i.device.peak_in_flight} in flight at once')
+
+    except Exception as e:
+        print(f'Exception occurred: {e}')
+    finally:
+        # Close the connection to the Moku device
+        # This ensures network resources are released correctly
+        await i.relinquish_ownership()
+        i.device.shutdown()
+
+
+asyncio.run(main())
@@ -9,39 +9,45 @@
 
 from moku.instruments import Phasemeter
 
+from instrument_config import InstrumentConfig
+
 # Connect to your Moku by its ip address using Phasemeter('192.168.###.###')
 # or by its serial number using Phasemeter(serial=123)
 i = Phasemeter('192.168.###.###', force_connect=False)
 
 try:
-    # Set Channel 1 and 2 to DC coupled, 1 MOhm impedance, and 400 mVpp range
-    i.set_frontend(1, coupling='DC', impedance='1MOhm', range='400mVpp')
-    i.set_frontend(2, coupling='DC', impedance='1MOhm', range='400mVpp')
-    i.set_frontend(3, coupling='DC', impedance='1MOhm', range='400mVpp')
-    i.set_frontend(4, coupling='DC', impedance='1MOhm', range='400mVpp')
-
-    # Configure Output channel 1 to generate sine waves at 1 Vpp, 2 MHz
-    i.generate_output(1, 'Sine', amplitude=1, frequency=2e6)
-    # Configure Output channel 2 to be phase locked to Input 2 signal at an
-    # amplitude of 0.5 Vpp
-    i.generate_output(2, 'Sine', amplitude=0.5, phase_locked=True)
-    # Configure Output channel 3 and 4 to generate measured phase at a
-    # scaling of 1 V/cycle and 10 V/cycle respectively
-    i.generate_output(3, 'Phase', scaling=1)
-    i.generate_output(4, 'Phase', scaling=10)
-
-    # Set the acquisition speed to 596Hz for all channels
-    i.set_acquisition_speed('596Hz')
-
-    # Set all input channels to 2 MHz, bandwidth 100 Hz
-    i.set_pm_loop(1, auto_acquire=False, frequency=2e6, bandwidth='100Hz')
-    i.set_pm_loop(2, auto_acquire=False, frequency=2e6, bandwidth='100Hz')
-    i.set_pm_loop(3, auto_acquire=False, frequency=2e6, bandwidth='100Hz')
-    i.set_pm_loop(4, auto_acquire=False, frequency=2e6, bandwidth='100Hz')
+    # Describe the settings of the instrument as a recipe. The config only
+    # sends the settings that differ from the ones it last applied.
+    config = InstrumentConfig(i)
+    recipe = {
+        # Set all input channels to DC coupled, 1 MOhm impedance, and 400 mVpp range
+        'set_frontend': {ch: dict(coupling='DC', impedance='1MOhm', range='400mVpp') for ch in range(1, 5)},
+        'generate_output': {
+            # Configure Output channel 1 to generate sine waves at 1 Vpp, 2 MHz
+            1: dict(signal='Sine', amplitude=1, frequency=2e6),
+            # Configure Output channel 2 to be phase locked to Input 2 signal at an
+            # amplitude of 0.5 Vpp
+            2: dict(signal='Sine', amplitude=0.5, phase_locked=True),
+            # Configure Output channel 3 and 4 to generate measured phase at a
+            # scaling of 1 V/cycle and 10 V/cycle respectively
+            3: dict(signal='Phase', scaling=1),
+            4: dict(signal='Phase', scaling=10),
+        },
+        # Set the acquisition speed to 596Hz for all channels
+        'set_acquisition_speed': dict(speed='596Hz'),
+        # Set all input channels to 2 MHz, bandwidth 100 Hz
+        'set_pm_loop': {ch: dict(auto_acquire=False, frequency=2e6, bandwidth='100Hz') for ch in range(1, 5)},
+    }
+    config.apply(recipe)
 
     # Get all the data available from the Moku
     data = i.get_data()
 
+    # Changing the recipe and applying it again only sends the changed setting,
+    # here a single set_pm_loop request for channel 2
+    recipe['set_pm_loop'][2]['bandwidth'] = '1kHz'
+    config.apply(recipe)
+    print(f'{config.requests} requests sent')
 
 except Exception as e:
     print(f'Exception occurred: {e}')
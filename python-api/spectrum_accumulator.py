@@ -0,0 +1,202 @@
+#
+# moku example: Spectrum accumulator
+#
+# This module accumulates the frames of the Spectrum Analyzer on the host,
+# for averaging, max/min hold, per-bin percentiles and waterfalls. All of
+# its memory is allocated when the first frame arrives, so it can run for
+# days at the full frame rate without growing: the waterfall is a ring of
+# the latest frames, and the percentiles are tracked with a fixed
+# histogram of levels in each frequency bin rather than by keeping every
+# frame.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import time
+
+import numpy as np
+
+
+class SpectrumAccumulator:
+    """
+    Accumulates the spectra of one channel of the Spectrum Analyzer.
+
+    Example:
+        spectrum = SpectrumAccumulator('ch1', n_rows=500, alpha=0.1)
+        while True:
+            spectrum.add(i.get_data())
+            line.set_data(spectrum.frequency, spectrum.max_hold)
+    """
+    def __init__(self, channel='ch1', n_rows=1000, average='power', alpha=0.1, db=True,
+                 levels=(-200, 50, 0.5), percentiles=(5, 50, 95)):
+        """
+        :param channel: channel of the frames to accumulate, e.g. 'ch1'
+        :param n_rows: number of the latest spectra kept for the waterfall
+        :param average: 'power' to average the power in each bin, or 'log' to average its level in dB, which reads
+        lower for noise but follows the displayed trace
+        :param alpha: weight of each new spectrum in the exponential average, between 0 and 1
+        :param db: whether the spectra are in dB units, e.g. dBm, rather than linear units, e.g. Vrms
+        :param levels: (lowest, highest, step) of the histogram in dB used to track percentiles, levels outside the
+        range are counted in the first or last step
+        :param percentiles: percentiles reported by percentiles(), in percent
+        """
+        if average not in ('power', 'log'):
+            raise ValueError("average must be 'power' or 'log'")
+        self.channel = channel
+        self.n_rows = int(n_rows)
+        self.average_mode = average
+        self.alpha = alpha
+        self.db = db
+        self.levels = np.arange(*levels)
+        self.default_percentiles = percentiles
+
+        self.frequency = None
+        self.rows = None
+        self.timestamps = None
+        self.max_hold = None
+        self.min_hold = None
+        self.frames = 0
+        self._sum = None
+        self._exponential = None
+        self._counts = None
+
+    def reset(self, frequency=None):
+        """
+        Clear everything that has been accumulated, e.g. after changing the span. The buffers are reallocated only
+        if the number of frequency bins changes.
+        :param frequency: frequency of each bin of the spectra to come
+        """
+        if frequency is not None:
+            frequency = np.array(frequency, dtype=float)
+            if self.frequency is None or frequency.size != self.frequency.size:
+                n_bins = frequency.size
+                self.rows = np.full((self.n_rows, n_bins), np.nan, dtype=np.float32)
+                self.timestamps = np.full(self.n_rows, np.nan)
+                self.max_hold = np.empty(n_bins)
+                self.min_hold = np.empty(n_bins)
+                self._sum = np.empty(n_bins)
+                self._exponential = np.empty(n_bins)
+                self._counts = np.empty((len(self.levels), n_bins), dtype=np.int64)
+            self.frequency = frequency
+        if self.frequency is None:
+            return
+        self.rows.fill(np.nan)
+        self.timestamps.fill(np.nan)
+        self.max_hold.fill(-np.inf)
+        self.min_hold.fill(np.inf)
+        self._sum.fill(0)
+        self._counts.fill(0)
+        self.frames = 0
+
+    def add(self, frame, timestamp=None):
+        """
+        Add a frame of the Spectrum Analyzer. Everything accumulated is reset if the frequency bins change.
+        :param frame: frame from get_data, with 'frequency' and the channel
+        :param timestamp: time of the frame, defaults to now
+        """
+        frequency = frame['frequency']
+        if self.frequency is None or len(frequency) != self.frequency.size \
+                or frequency[0] != self.frequency[0] or frequency[-1] != self.frequency[-1]:
+            self.reset(frequency)
+
+        spectrum = np.asarray(frame[self.channel], dtype=float)
+        row = self.frames % self.n_rows
+        self.rows[row] = spectrum
+        self.timestamps[row] = time.time() if timestamp is None else timestamp
+
+        np.maximum(self.max_hold, spectrum, out=self.max_hold)
+        np.minimum(self.min_hold, spectrum, out=self.min_hold)
+
+        value = self._to_average(spectrum)
+        self._sum += value
+        if self.frames == 0:
+            self._exponential[:] = value
+        else:
+            self._exponential += self.alpha * (value - self._exponential)
+
+        # each bin falls in exactly one level, so the counts can be incremented without np.add.at
+        level = np.searchsorted(self.levels, self._to_db(spectrum), side='right') - 1
+        self._counts[np.clip(level, 0, len(self.levels) - 1), np.arange(spectrum.size)] += 1
+        self.frames += 1
+
+    @property
+    def average(self):
+        """
+        :return: average of every spectrum since the last reset
+        """
+        return self._from_average(self._sum / max(self.frames, 1))
+
+    @property
+    def exponential_average(self):
+        """
+        :return: exponential average of the spectra, with the weight alpha for the newest
+        """
+        return self._from_average(self._exponential)
+
+    def percentiles(self, q=None):
+        """
+        Find percentiles of the level in each bin over every spectrum since the last reset, by nearest rank, to within
+        half a step of the level histogram
+        :param q: percentile or sequence of percentiles, in percent, defaults to the percentiles given at creation
+        :return: array of the percentiles of each bin, with one row per percentile if q is a sequence
+        """
+        q = self.default_percentiles if q is None else q
+        cumulative = np.cumsum(self._counts, axis=0)
+        targets = np.atleast_1d(q)[:, None, None] / 100 * max(self.frames, 1)
+        # first level at which the cumulative count reaches each percentile, for every bin at once
+        idx = np.argmax(cumulative[None, :, :] >= np.maximum(targets, 1), axis=1)
+        result = self._from_db(self.levels[idx] + (self.levels[1] - self.levels[0]) / 2)
+        return result if np.ndim(q) else result[0]
+
+    def waterfall(self):
+        """
+        :return: tuple of the timestamps and the spectra held, oldest first, with one row per spectrum
+        """
+        held = min(self.frames, self.n_rows)
+        order = (self.frames - held + np.arange(held)) % self.n_rows
+        return self.timestamps[order], self.rows[order]
+
+    def export(self, file_name, compression='gzip'):
+        """
+        Write the waterfall and the accumulated statistics to an HDF5 file
+        :param file_name: path of the file
+        :param compression: HDF5 compression filter, None to disable
+        """
+        import h5py
+
+        timestamps, rows = self.waterfall()
+        with h5py.File(file_name, 'w') as f:
+            f.attrs['channel'] = self.channel
+            f.attrs['frames'] = self.frames
+            f.attrs['average'] = self.average_mode
+            f.attrs['alpha'] = self.alpha
+            f.create_dataset('frequency', data=self.frequency)
+            f.create_dataset('timestamps', data=timestamps)
+            f.create_dataset('waterfall', data=rows, compression=compression,
+                             chunks=(min(len(rows), 64) or 1, rows.shape[1]))
+            f.create_dataset('average', data=self.average)
+            f.create_dataset('exponential_average', data=self.exponential_average)
+            f.create_dataset('max_hold', data=self.max_hold)
+            f.create_dataset('min_hold', data=self.min_hold)
+            f.create_dataset('percentiles', data=self.percentiles(self.default_percentiles))
+            f['percentiles'].attrs['q'] = self.default_percentiles
+
+    def _to_db(self, spectrum):
+        if self.db:
+            return spectrum
+        with np.errstate(divide='ignore'):
+            return 20 * np.log10(np.abs(spectrum))
+
+    def _from_db(self, level):
+        return level if self.db else 10 ** (level / 20)
+
+    def _to_average(self, spectrum):
+        # average either the power in each bin, or its level in dB
+        if self.average_mode == 'log':
+            return self._to_db(spectrum)
+        return 10 ** (spectrum / 10) if self.db else spectrum ** 2
+
+    def _from_average(self, value):
+        if self.average_mode == 'log':
+            return self._from_db(value)
+        with np.errstate(divide='ignore'):
+            return 10 * np.log10(value) if self.db else np.sqrt(value)
@@ -10,6 +10,8 @@ import logging
 
 import matplotlib.pyplot as plt
 from moku.instruments import SpectrumAnalyzer
+from live_plot import LivePlot
+from spectrum_accumulator import SpectrumAccumulator
 
 logging.basicConfig(format='%(asctime)s:%(name)s:%(levelname)s::%(message)s')
 logging.getLogger('moku_client').setLevel(logging.INFO)
@@ -31,6 +33,10 @@ try:
     # Set up basic plot configurations
     line1, = plt.plot([])
     line2, = plt.plot([])
+    # Peak hold and average of channel 1, accumulated over every frame
+    max_hold, = plt.plot([], '--', label='Ch1 max hold')
+    average, = plt.plot([], label='Ch1 average')
+    plt.legend(loc='upper right')
     plt.ion()
     plt.show()
     plt.grid(visible=True)
@@ -43,23 +49,29 @@ try:
     # Format the x-axis as a frequency scale
     ax = plt.gca()
 
-    # Get and update the plot with new data
-    while True:
+    # Only redraw the lines on each frame, rather than the whole figure.
+    # The frequency axis shouldn't change, but it is refitted if it does
+    plot = LivePlot(plt.gcf(), max_fps=30)
+    plot.add(line1)
+    plot.add(line2)
+    plot.add(max_hold)
+    plot.add(average)
+    plot.autoscale(ax, axis='x')
+
+    # Average the power in each bin exponentially, with a weight of 0.1 for each new frame
+    spectrum = SpectrumAccumulator('ch1', average='power', alpha=0.1)
+
+    # Get and update the plot with new data until the plot is closed
+    while plot.is_open():
         frame = i.get_data()
-        
-        # Set the frame data for each channel plot
-        line1.set_ydata(frame['ch1'])
-        line2.set_ydata(frame['ch2'])
-        # Frequency axis shouldn't change, but to be sure
-        line1.set_xdata(frame['frequency'])
-        line2.set_xdata(frame['frequency'])
-        # Ensure the frequency axis is a tight fit
-        ax.relim()
-        ax.autoscale_view()
+        spectrum.add(frame)
 
-        # Redraw the lines
-        plt.draw()
-        plt.pause(0.001)
+        # Set the frame data for each channel plot
+        plot.set_data(line1, frame['frequency'], frame['ch1'])
+        plot.set_data(line2, frame['frequency'], frame['ch2'])
+        plot.set_data(max_hold, spectrum.frequency, spectrum.max_hold)
+        plot.set_data(average, spectrum.frequency, spectrum.exponential_average)
+        plot.render()
 
 except Exception as e:
     print(f'Exception occurred: {e}')
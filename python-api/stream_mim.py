@@ -1,6 +1,8 @@
 import matplotlib.pyplot as plt
 
 from moku.instruments import Datalogger, LockInAmp, MultiInstrument
+from stream_reader import StreamReader
+from stream_writer import StreamWriter
 
 i = MultiInstrument('10.1.111.85', platform_id=2, force_connect=True)
 
@@ -19,35 +21,50 @@ try:
 
     dl.start_streaming(10)
 
-    dl.stream_to_file()
+    # Write the Datalogger stream to an HDF5 file on the host, one
+    # dataset per channel, from a separate thread. Leaving the with block
+    # waits for the rest of the stream to be written and closes the file,
+    # or stops recording at the next chunk if anything goes wrong
+    with StreamWriter('datalogger_stream.h5') as writer:
+        writer.start_recording(dl)
 
-    lia.set_monitor(1, "Input1")
+        lia.set_monitor(1, "Input1")
 
-    lia.start_streaming(10)
+        lia.start_streaming(10)
 
-    plt.ion()
-    plt.show()
-    plt.grid(visible=True)
-    plt.ylim([-1, 1])
+        plt.ion()
+        plt.show()
+        plt.grid(visible=True)
+        plt.ylim([-1, 1])
 
-    line1, = plt.plot([])
-    line2, = plt.plot([])
+        line1, = plt.plot([])
+        line2, = plt.plot([])
 
-    # Configure labels for axes
-    ax = plt.gca()
+        # Configure labels for axes
+        ax = plt.gca()
 
-    # This loops continuously updates the plot with new data
-    while True:
-        # Get new data
-        data = lia.get_stream_data()
+        # Read the stream on a background thread so that a slow plot update
+        # never backs up the stream
+        reader = StreamReader(lia, capacity=2**20).start()
 
-        # Update the plot
-        if data:
-            plt.xlim([data['time'][0], data['time'][-1]])
-            line1.set_ydata(data['ch1'])
-            line1.set_xdata(data['time'])
+        # This loops continuously updates the plot with the latest data
+        # until the end of the stream
+        while reader.is_alive():
+            # view the latest 1000 samples of the stream
+            data = reader.latest(1000)
+
+            # Update the plot
+            if data:
+                plt.xlim([data['time'][0], data['time'][-1]])
+                line1.set_ydata(data['ch1'])
+                line1.set_xdata(data['time'])
             plt.pause(0.001)
 
+        if reader.error:
+            raise reader.error
+
+    print(writer.metrics())
+
 except Exception as e:
     print(e)
 finally:
@@ -0,0 +1,225 @@
+#
+# moku example: Background stream reader
+#
+# This module drains the data of a streaming session on a dedicated
+# thread into a fixed-capacity ring buffer per channel, so that a slow
+# consumer, e.g. a plot that stalls while rendering, never backs up the
+# stream. The consumer can view the latest samples without copying them
+# or read every sample in order with read(n).
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import asyncio
+import threading
+
+import numpy as np
+from moku.exceptions import StreamException
+
+
+class StreamReader:
+    """
+    Reads the stream of an instrument on a background thread into a ring buffer.
+
+    Each channel, including 'time', is held in a buffer of twice the capacity where every sample is written twice,
+    capacity samples apart. Any run of up to capacity consecutive samples is then a contiguous slice of the buffer, so
+    latest() can return views rather than copies.
+
+    Example:
+        i.start_streaming(duration=20, rate=100e3)
+        with StreamReader(i, capacity=2**20) as reader:
+            while reader.is_alive():
+                data = reader.latest(1000)
+    """
+    def __init__(self, instrument, capacity=2 ** 20, dtype=np.float64, on_chunk=None):
+        """
+        :param instrument: instrument that has started streaming, e.g. a Datalogger
+        :param capacity: number of samples held for each channel
+        :param dtype: data type of the buffers
+        :param on_chunk: optional callback, called from the reader thread with each chunk of stream data, e.g. the
+        write method of a StreamWriter
+        """
+        self.instrument = instrument
+        self.capacity = int(capacity)
+        self.dtype = dtype
+        self.on_chunk = on_chunk
+
+        self.channels = None
+        self.buffers = None
+        self.error = None
+
+        # absolute sample counts of the writer and of the read() consumer
+        self.samples_received = 0
+        self.chunks_received = 0
+        self._read_pos = 0
+
+        # samples overwritten before read() consumed them, and gaps in the time base of the stream itself
+        self.overruns = 0
+        self.time_gaps = 0
+        self._last_time = None
+        self._dt = None
+
+        self._lock = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='StreamReader', daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop reading the stream. get_stream_data blocks until the next chunk arrives, so the thread finishes once
+        the current chunk is received or the stream ends.
+        :param timeout: maximum time to wait for the thread to finish
+        """
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    @property
+    def finished(self):
+        return self._started() and not self._thread.is_alive()
+
+    def _started(self):
+        return self._thread.ident is not None
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                data = self.instrument.get_stream_data()
+                if data:
+                    self._write(data)
+                    if self.on_chunk is not None:
+                        self.on_chunk(data)
+        except StreamException:
+            # end of stream
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._lock:
+                self._lock.notify_all()
+
+    def _allocate(self, data):
+        self.channels = list(data)
+        self.buffers = {ch: np.zeros(2 * self.capacity, dtype=self.dtype) for ch in self.channels}
+
+    def _check_time(self, times):
+        # count discontinuities in the time base, which show that samples were lost before reaching this reader
+        if times.size > 1:
+            self._dt = np.median(np.diff(times))
+        if self._dt:
+            steps = np.diff(times, prepend=times[0] if self._last_time is None else self._last_time)
+            self.time_gaps += int(np.count_nonzero(steps > 1.5 * self._dt))
+        self._last_time = times[-1]
+
+    def _write(self, data):
+        if self.buffers is None:
+            self._allocate(data)
+
+        chunk = {ch: np.asarray(data[ch], dtype=self.dtype)[-self.capacity:] for ch in self.channels}
+        n_total = len(data[self.channels[0]])
+        n = len(chunk[self.channels[0]])
+        if 'time' in data and n_total:
+            self._check_time(np.asarray(data['time'], dtype=float))
+
+        with self._lock:
+            # skip the samples of an oversized chunk that would be overwritten straight away
+            pos = (self.samples_received + n_total - n) % self.capacity
+            first = min(n, self.capacity - pos)
+            for ch, values in chunk.items():
+                buf = self.buffers[ch]
+                for offset in (0, self.capacity):
+                    buf[offset + pos:offset + pos + first] = values[:first]
+                    buf[offset:offset + n - first] = values[first:]
+
+            self.samples_received += n_total
+            self.chunks_received += 1
+            self._lock.notify_all()
+
+    def available(self):
+        """
+        :return: number of samples that read() can return without blocking
+        """
+        with self._lock:
+            return min(self.samples_received - self._read_pos, self.capacity)
+
+    def latest(self, n=None, copy=False):
+        """
+        Get the most recent samples of every channel. By default these are views into the ring buffer, which the
+        reader thread overwrites once another capacity samples have been received, so copy them to keep them.
+        :param n: number of samples, defaults to all of the samples held
+        :param copy: return copies of the samples rather than views
+        :return: dict of channel name to samples, empty if no data has been received
+        """
+        with self._lock:
+            if self.buffers is None:
+                return {}
+            held = min(self.samples_received, self.capacity)
+            n = held if n is None else min(n, held)
+            end = self.samples_received % self.capacity + self.capacity
+            return {ch: buf[end - n:end].copy() if copy else buf[end - n:end] for ch, buf in self.buffers.items()}
+
+    def between(self, start, stop, x_key='time'):
+        """
+        Get copies of the samples held between two times, with one more sample either side so that they can be
+        interpolated across the whole range
+        :param start: first time
+        :param stop: last time
+        :param x_key: name of the channel to select the samples on
+        :return: dict of channel name to copies of the samples, empty if no data has been received
+        """
+        with self._lock:
+            if self.buffers is None:
+                return {}
+            held = min(self.samples_received, self.capacity)
+            first = self.samples_received % self.capacity + self.capacity - held
+            x = self.buffers[x_key][first:first + held]
+            lo = max(0, int(np.searchsorted(x, start, side='left')) - 1)
+            hi = min(held, int(np.searchsorted(x, stop, side='right')) + 1)
+            return {ch: buf[first + lo:first + hi].copy() for ch, buf in self.buffers.items()}
+
+    def read(self, n, timeout=None):
+        """
+        Read the next n samples of every channel in order, blocking until they are received. Samples that were
+        overwritten before they could be read are counted in overruns and skipped.
+        :param n: number of samples to read, at most the capacity
+        :param timeout: maximum time to wait for the samples, fewer samples are returned if it expires
+        :return: dict of channel name to copies of the samples, with fewer than n samples at the end of the stream
+        """
+        if n > self.capacity:
+            raise ValueError(f'Cannot read more than the capacity of {self.capacity} samples at once')
+
+        with self._lock:
+            self._lock.wait_for(lambda: self.samples_received - self._read_pos >= n
+                                or (self._started() and not self._thread.is_alive()), timeout)
+            if self.error is not None:
+                raise self.error
+            if self.buffers is None:
+                return {}
+
+            backlog = self.samples_received - self._read_pos
+            if backlog > self.capacity:
+                self.overruns += backlog - self.capacity
+                self._read_pos = self.samples_received - self.capacity
+
+            n = min(n, self.samples_received - self._read_pos)
+            start = self._read_pos % self.capacity
+            self._read_pos += n
+            return {ch: buf[start:start + n].copy() for ch, buf in self.buffers.items()}
+
+    async def read_async(self, n, timeout=None):
+        """
+        Awaitable version of read, which blocks in the default executor rather than the event loop
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.read, n, timeout)
@@ -0,0 +1,246 @@
+#
+# moku example: Stream writer
+#
+# This module writes the data of a streaming session to an HDF5 or
+# Parquet file on the host, with one column per channel, so that long
+# captures are ready for analysis without converting them from CSV.
+# Chunks are written on a separate thread through a bounded queue. If the
+# disk falls behind, write() blocks rather than dropping data, and the
+# time spent waiting is reported in the metrics.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from moku.exceptions import StreamException
+
+FORMATS = {
+    '.h5': 'hdf5',
+    '.hdf5': 'hdf5',
+    '.parquet': 'parquet',
+}
+
+# marks the end of the data in the queue
+_CLOSE = object()
+
+
+class StreamWriter:
+    """
+    Writes stream data chunks to disk on a background thread.
+
+    Example:
+        i.start_streaming(duration=3600, rate=100e3)
+        with StreamWriter('capture.h5') as writer:
+            writer.record(i)
+        print(writer.metrics())
+
+    The stream can also be recorded on a background thread with start_recording. Leaving the with block then waits
+    for the end of the stream, or stops recording at the next chunk if the block raised, and always closes the file.
+    """
+    def __init__(self, file_name, file_format=None, chunk_size=2 ** 16, compression='default', queue_size=64):
+        """
+        :param file_name: path of the file to write
+        :param file_format: 'hdf5' or 'parquet', defaults to the format of the file extension
+        :param chunk_size: number of samples of each channel in each HDF5 chunk or Parquet row group
+        :param compression: compression filter, 'gzip' for HDF5 and 'zstd' for Parquet by default, None to disable
+        :param queue_size: maximum number of stream chunks waiting to be written before write() blocks
+        """
+        if file_format is None:
+            file_format = FORMATS.get(os.path.splitext(file_name)[1].lower())
+        if file_format not in FORMATS.values():
+            raise ValueError(f'Unknown file format for {file_name}, try one of {sorted(set(FORMATS.values()))}')
+        if compression == 'default':
+            compression = 'gzip' if file_format == 'hdf5' else 'zstd'
+
+        self.file_name = file_name
+        self.file_format = file_format
+        self.chunk_size = int(chunk_size)
+        self.compression = compression
+
+        self.channels = None
+        self.error = None
+        self._file = None
+        self._pending = []
+        self._pending_samples = 0
+
+        # metrics
+        self.chunks_received = 0
+        self.samples_written = 0
+        self.max_queue_depth = 0
+        self.blocked_time = 0.0
+        self._start_time = None
+
+        self._recorder = None
+        self._stop = threading.Event()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='StreamWriter', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            # don't wait for the end of the stream when leaving on an error
+            self.stop_recording(timeout=5)
+        self.close()
+
+    def write(self, data, timeout=None):
+        """
+        Queue a chunk of stream data to be written. Blocks while the queue is full, so a slow disk slows the caller
+        down rather than losing data.
+        :param data: dict of channel name to samples, as returned by get_stream_data
+        :param timeout: maximum time to wait for space in the queue, raises queue.Full if it expires
+        """
+        if self.error is not None:
+            raise self.error
+        if self._start_time is None:
+            self._start_time = time.perf_counter()
+
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            start = time.perf_counter()
+            self._queue.put(data, timeout=timeout)
+            self.blocked_time += time.perf_counter() - start
+        self.chunks_received += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def record(self, instrument):
+        """
+        Write the stream of an instrument until the end of the stream, or until stop_recording is called
+        :param instrument: instrument that has started streaming
+        """
+        try:
+            while not self._stop.is_set():
+                data = instrument.get_stream_data()
+                if data:
+                    self.write(data)
+        except StreamException:
+            # end of stream
+            pass
+
+    def start_recording(self, instrument):
+        """
+        Write the stream of an instrument on a background thread, see record. close() waits for the recording to
+        finish, and raises any error that ended it.
+        :param instrument: instrument that has started streaming
+        :return: the writer
+        """
+        self._recorder = threading.Thread(target=self._record, args=(instrument,), name='StreamRecorder', daemon=True)
+        self._recorder.start()
+        return self
+
+    def stop_recording(self, timeout=None):
+        """
+        Stop recording the stream. get_stream_data blocks until the next chunk arrives, so recording stops once the
+        current chunk is received or the stream ends.
+        :param timeout: maximum time to wait for the recording thread to finish
+        """
+        self._stop.set()
+        if self._recorder is not None and self._recorder.is_alive():
+            self._recorder.join(timeout)
+
+    def _record(self, instrument):
+        try:
+            self.record(instrument)
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+
+    def close(self):
+        """
+        Wait for the recording started by start_recording to finish, unless it has been stopped, then write any
+        remaining data and close the file
+        """
+        if self._recorder is not None and not self._stop.is_set():
+            self._recorder.join()
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def metrics(self):
+        """
+        :return: dict of the progress and throughput of the writer
+        """
+        elapsed = time.perf_counter() - self._start_time if self._start_time else 0
+        return {
+            'chunks_received': self.chunks_received,
+            'samples_written': self.samples_written,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'blocked_time': self.blocked_time,
+            'samples_per_second': self.samples_written / elapsed if elapsed else 0,
+        }
+
+    def _run(self):
+        try:
+            while True:
+                data = self._queue.get()
+                if data is _CLOSE:
+                    break
+                self._add(data)
+            self._flush()
+        except Exception as e:
+            self.error = e
+            # keep draining the queue so that write() raises the error rather than blocking forever
+            while self._queue.get() is not _CLOSE:
+                pass
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    def _add(self, data):
+        if self.channels is None:
+            self.channels = list(data)
+        self._pending.append({ch: np.asarray(data[ch], dtype=float) for ch in self.channels})
+        self._pending_samples += len(data[self.channels[0]])
+
+        if self._pending_samples >= self.chunk_size:
+            columns = {ch: np.concatenate([chunk[ch] for chunk in self._pending]) for ch in self.channels}
+            n_full = (self._pending_samples // self.chunk_size) * self.chunk_size
+            self._write_columns({ch: values[:n_full] for ch, values in columns.items()})
+            self._pending = [{ch: values[n_full:] for ch, values in columns.items()}]
+            self._pending_samples -= n_full
+
+    def _flush(self):
+        if self._pending_samples:
+            self._write_columns({ch: np.concatenate([chunk[ch] for chunk in self._pending]) for ch in self.channels})
+            self._pending = []
+            self._pending_samples = 0
+
+    def _write_columns(self, columns):
+        if self.file_format == 'hdf5':
+            self._write_hdf5(columns)
+        else:
+            self._write_parquet(columns)
+        self.samples_written += len(columns[self.channels[0]])
+
+    def _write_hdf5(self, columns):
+        import h5py
+
+        if self._file is None:
+            self._file = h5py.File(self.file_name, 'w')
+            for ch in self.channels:
+                self._file.create_dataset(ch, shape=(0,), maxshape=(None,), dtype=float,
+                                          chunks=(self.chunk_size,), compression=self.compression)
+        for ch, values in columns.items():
+            dataset = self._file[ch]
+            dataset.resize((dataset.shape[0] + values.size,))
+            dataset[-values.size:] = values
+
+    def _write_parquet(self, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table(columns)
+        if self._file is None:
+            self._file = pq.ParquetWriter(self.file_name, table.schema, compression=self.compression or 'none')
+        self._file.write_table(table, row_group_size=self.chunk_size)
@@ -0,0 +1,165 @@
+#
+# moku example: Time and Frequency Analyzer histogram accumulator
+#
+# This module adds up the interval histograms of the Time and Frequency
+# Analyzer over many windows, so that jitter can be characterized from
+# millions of events rather than the events of a single window. The counts
+# are kept as 64-bit integers, and the statistics of the intervals are
+# computed from the counts with NumPy.
+#
+# Use it with the 'Windowed' acquisition mode. In the 'Continuous' mode the
+# Moku already accumulates the histogram. get_data returns the latest
+# window, which is the same window again if no new one has completed since
+# the last call, so a frame that repeats the last window is not added
+# again.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import numpy as np
+
+
+class HistogramAccumulator:
+    """
+    Accumulates the histogram of one interval analyzer.
+
+    Example:
+        histogram = HistogramAccumulator('interval1')
+        while True:
+            histogram.add(i.get_data())
+            stairs.set_data(*histogram.stairs())
+        print(histogram.statistics())
+    """
+    def __init__(self, interval='interval1', on_mismatch='raise'):
+        """
+        :param interval: interval analyzer of the frames to accumulate, e.g. 'interval1'
+        :param on_mismatch: 'raise' to raise a ValueError if the bins of a frame differ from the bins accumulated,
+        or 'reset' to start again from that frame, e.g. when the histogram span is changed while plotting
+        """
+        if on_mismatch not in ('raise', 'reset'):
+            raise ValueError("on_mismatch must be 'raise' or 'reset'")
+        self.interval = interval
+        self.on_mismatch = on_mismatch
+        self.t0 = None
+        self.dt = None
+        self.counts = None
+        self.windows = 0
+        self.resets = 0
+        self.repeats = 0
+        self._last = None
+
+    def reset(self):
+        """
+        Clear the accumulated counts
+        """
+        self.t0 = None
+        self.dt = None
+        self.counts = None
+        self.windows = 0
+        self._last = None
+
+    def add(self, frame):
+        """
+        Add the histogram of a window
+        :param frame: frame from get_data
+        :return: whether the histogram was added, False if the frame repeats the last window
+        """
+        histogram = frame[self.interval]['histogram']
+        data = np.asarray(histogram['data'], dtype=np.int64)
+        t0, dt = histogram['t0'], histogram['dt']
+
+        if self.counts is not None and not self._same_bins(data.size, t0, dt):
+            if self.on_mismatch == 'raise':
+                raise ValueError(f'The histogram of {self.interval} changed from {self.counts.size} bins of '
+                                 f'{self.dt:g} s from {self.t0:g} s to {data.size} bins of {dt:g} s from {t0:g} s')
+            self.reset()
+            self.resets += 1
+
+        if self._last is not None and np.array_equal(data, self._last):
+            self.repeats += 1
+            return False
+
+        if self.counts is None:
+            self.t0, self.dt = t0, dt
+            self.counts = np.zeros(data.size, dtype=np.int64)
+        self.counts += data
+        self.windows += 1
+        self._last = data
+        return True
+
+    def _same_bins(self, n_bins, t0, dt):
+        # t0 and dt are floats, so compare them to within a small fraction of a bin
+        return (n_bins == self.counts.size and abs(t0 - self.t0) <= 1e-3 * self.dt
+                and abs(dt - self.dt) <= 1e-9 * self.dt)
+
+    @property
+    def events(self):
+        """
+        :return: number of intervals counted, excluding those outside the span of the histogram
+        """
+        return int(self.counts.sum()) if self.counts is not None else 0
+
+    @property
+    def edges(self):
+        """
+        :return: the edges of the bins in seconds, one more than the number of bins
+        """
+        return self.t0 + self.dt * np.arange(self.counts.size + 1)
+
+    @property
+    def centers(self):
+        """
+        :return: the centre of each bin in seconds
+        """
+        return self.t0 + self.dt * (np.arange(self.counts.size) + 0.5)
+
+    def stairs(self):
+        """
+        :return: tuple of the bin edges and counts, for LivePlot.set_data or StepPatch.set_data(values, edges)
+        """
+        return self.edges, self.counts
+
+    def mean(self):
+        """
+        :return: mean interval in seconds, taking each interval to be at the centre of its bin
+        """
+        return float(np.dot(self.counts, self.centers) / self.events) if self.events else np.nan
+
+    def std(self):
+        """
+        :return: standard deviation of the intervals in seconds, taking each interval to be at the centre of its bin
+        """
+        if not self.events:
+            return np.nan
+        deviation = self.centers - self.mean()
+        return float(np.sqrt(np.dot(self.counts, deviation * deviation) / self.events))
+
+    def percentiles(self, q=(1, 50, 99)):
+        """
+        Find percentiles of the intervals, interpolating linearly within each bin
+        :param q: percentile or sequence of percentiles, in percent
+        :return: interval at each percentile in seconds
+        """
+        if not self.events:
+            return np.full(np.shape(q), np.nan)
+        cumulative = np.concatenate(([0], np.cumsum(self.counts)))
+        # the cumulative count is flat across empty bins, so find the first edge that reaches each target
+        targets = np.asarray(q, dtype=float) / 100 * self.events
+        idx = np.clip(np.searchsorted(cumulative, targets, side='left'), 1, self.counts.size)
+        below = cumulative[idx - 1]
+        fraction = (targets - below) / np.maximum(self.counts[idx - 1], 1)
+        return self.t0 + self.dt * (idx - 1 + np.clip(fraction, 0, 1))
+
+    def statistics(self):
+        """
+        :return: dict of the statistics of the accumulated intervals
+        """
+        p1, p50, p99 = self.percentiles((1, 50, 99))
+        return {
+            'windows': self.windows,
+            'events': self.events,
+            'mean': self.mean(),
+            'std': self.std(),
+            'median': p50,
+            'p1': p1,
+            'p99': p99,
+        }
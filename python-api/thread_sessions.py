@@ -0,0 +1,64 @@
+#
+# moku example: Per-thread instrument sessions
+#
+# The instruments of a Moku, including every slot of a Multi-instrument
+# Mode configuration, send their requests through one HTTP session, and a
+# requests session is not safe to use from several threads at once. This
+# module gives each thread its own copy of the session, with the same
+# address, timeouts and client key, so that several threads can call the
+# same Moku at once over their own keep-alive connections.
+#
+# (c) 2024 Liquid Instruments Pty. Ltd.
+#
+import copy
+import threading
+
+import requests
+
+
+class ThreadSessions:
+    """
+    Copies of instruments that send their requests through an HTTP session of the calling thread. The slots of a
+    MultiInstrument share one session per thread, as they share one session on the main thread.
+
+    Example:
+        sessions = ThreadSessions()
+        with ThreadPoolExecutor(2) as pool:
+            frames = list(pool.map(lambda osc: sessions.instrument(osc).get_data(), (osc1, osc2)))
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def _sessions(self):
+        # the session copies and instrument copies of the calling thread, keyed on the id of the original, which is
+        # kept alongside so that the id cannot be reused
+        if not hasattr(self._local, 'sessions'):
+            self._local.sessions = {}
+            self._local.instruments = {}
+        return self._local.sessions, self._local.instruments
+
+    def session(self, session):
+        """
+        :param session: RequestSession of a connected instrument
+        :return: copy of the session for the calling thread, with its own requests.Session
+        """
+        sessions, _ = self._sessions()
+        if id(session) not in sessions:
+            local = copy.copy(session)
+            local.rs = requests.Session()
+            for attr in ('headers', 'auth', 'proxies', 'verify', 'cert', 'trust_env', 'max_redirects'):
+                setattr(local.rs, attr, copy.copy(getattr(session.rs, attr)))
+            sessions[id(session)] = (session, local)
+        return sessions[id(session)][1]
+
+    def instrument(self, instrument):
+        """
+        :param instrument: connected instrument, or a slot of a MultiInstrument
+        :return: copy of the instrument that sends its requests through the session of the calling thread
+        """
+        _, instruments = self._sessions()
+        if id(instrument) not in instruments:
+            local = copy.copy(instrument)
+            local.session = self.session(instrument.session)
+            instruments[id(instrument)] = (instrument, local)
+        return instruments[id(instrument)][1]
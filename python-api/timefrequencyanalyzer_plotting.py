@@ -7,8 +7,9 @@
 # (c) 2024 Liquid Instruments Pty. Ltd.
 #
 import matplotlib.pyplot as plt
-import numpy as np
 from moku.instruments import TimeFrequencyAnalyzer
+from live_plot import LivePlot
+from tfa_histogram import HistogramAccumulator
 
 # Connect to your Moku by its ip address using TimeFrequencyAnalyzer('192.168.###.###')
 # or by its serial number using TimeFrequencyAnalyzer(serial=123)
@@ -37,41 +38,55 @@ try:
     i.set_interval_analyzer(2, start_event_id=2, stop_event_id=2)
 
 
-    # Get initial data frame to set up plotting parameters. This can be done
-    # once if we know that the axes aren't going to change (otherwise we'd do
-    # this in the loop)
-    data = i.get_data()
+    # Add up the histograms of every window, rather than showing one window
+    # at a time. The histograms are reset if their span changes
+    histogram1 = HistogramAccumulator('interval1', on_mismatch='reset')
+    histogram2 = HistogramAccumulator('interval2', on_mismatch='reset')
 
-    # Set up the plotting parameters
-    t0 = data['interval1']['histogram']['t0']
-    dt = data['interval1']['histogram']['dt']
-    length = 1024
-    x = np.linspace(start=t0, stop=t0 + dt*1023, num=1024)
+    # Get initial data frame to set up plotting parameters
+    data = i.get_data()
+    histogram1.add(data)
+    histogram2.add(data)
 
     plt.ion()
     plt.show()
     plt.grid(visible=True)
-    plt.ylim([0, 600])
     plt.xlim([1.996e-6, 2.004e-6])
 
-    line1 = plt.bar(x, height=data['interval1']['histogram']['data'], width=dt, align='edge', alpha=0.8)
-    line2 = plt.bar(x, height=data['interval2']['histogram']['data'], width=dt, align='edge', alpha=0.8)
+    # Draw each histogram as a single filled step patch rather than a bar per bin
+    line1 = plt.stairs(histogram1.counts, histogram1.edges, fill=True, alpha=0.8)
+    line2 = plt.stairs(histogram2.counts, histogram2.edges, fill=True, alpha=0.8)
 
     # Configure labels for axes
     ax = plt.gca()
+    ax.set_xlabel('Interval (s)')
+    ax.set_ylabel('Events')
+    stats = ax.text(0.02, 0.98, '', transform=ax.transAxes, va='top', family='monospace')
+
+    # Only redraw the histograms and statistics on each frame, rather than the
+    # whole figure. The counts axis grows as the events add up
+    plot = LivePlot(plt.gcf(), max_fps=30)
+    plot.add(line1)
+    plot.add(line2)
+    plot.add(stats)
+    plot.autoscale(ax, axis='y')
 
-    # This loops continuously updates the plot with new data
-    while True:
-        # Get new data
+    # This loops continuously updates the plot with new data until the
+    # plot is closed
+    while plot.is_open():
+        # Get the latest window, and add it to the histograms unless it is
+        # the same window as last time
         data = i.get_data()
+        histogram1.add(data)
+        histogram2.add(data)
 
         # Update the plot
-        height1 = data['interval1']['histogram']['data']
-        height2 = data['interval2']['histogram']['data']
-        for count1, rect1, count2, rect2 in zip(height1, line1.patches, height2, line2.patches):
-            rect1.set_height(count1)
-            rect2.set_height(count2)
-        plt.pause(0.001)
+        plot.set_data(line1, *histogram1.stairs())
+        plot.set_data(line2, *histogram2.stairs())
+        stats.set_text('\n'.join(
+            f"Interval {n}: {h.events} events, mean {h.mean() * 1e9:.4f} ns, std {h.std() * 1e12:.1f} ps"
+            for n, h in ((1, histogram1), (2, histogram2))))
+        plot.render()
 
 except Exception as e:
     print(f'Exception occurred: {e}')